@@ -0,0 +1,272 @@
+"""Camada de acesso à base de dados: pool de conexões e consultas preparadas.
+
+Abrir uma conexão nova ao PostgreSQL alojado custa mais (TCP, TLS e
+autenticação) do que as próprias consultas, por isso as conexões são
+reaproveitadas num pool limitado e partilhado entre as threads do servidor.
+Cada pedido do Flask retira uma conexão na primeira vez que precisa dela e
+devolve-a automaticamente no fim do contexto da aplicação.
+"""
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from flask import g
+
+import metricas
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+# Configuração do pool (pode ser ajustada por variáveis de ambiente)
+POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+POOL_MAX = int(os.environ.get('DB_POOL_MAX', '10'))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))        # segundos à espera de uma conexão livre
+POOL_MAX_IDADE = float(os.environ.get('DB_POOL_MAX_IDADE', '1800'))  # recicla conexões com mais de 30 minutos
+POOL_CHECAGEM = float(os.environ.get('DB_POOL_CHECAGEM', '30'))      # testa conexões ociosas há mais de 30 segundos
+
+# Erros que indicam que a conexão em si ficou inutilizável
+ERROS_DE_CONEXAO = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+class PoolEsgotado(Exception):
+    """Nenhuma conexão ficou livre dentro do tempo limite."""
+
+
+class _Conexao:
+    """Uma conexão do pool e os instantes usados para decidir se ainda presta."""
+    __slots__ = ('conn', 'criada_em', 'devolvida_em')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.criada_em = self.devolvida_em = time.monotonic()
+
+
+class PoolConexoes:
+    """Pool de conexões limitado e seguro entre threads.
+
+    Quando todas as conexões estão em uso, `obter()` espera até `timeout`
+    segundos por uma devolução antes de desistir com `PoolEsgotado`.
+    Conexões ociosas há muito tempo são testadas antes de serem entregues, e
+    as que passaram de `max_idade` são fechadas e substituídas.
+    """
+
+    def __init__(self, dsn, minimo=POOL_MIN, maximo=POOL_MAX, timeout=POOL_TIMEOUT,
+                 max_idade=POOL_MAX_IDADE, checagem=POOL_CHECAGEM):
+        self.dsn = dsn
+        self.minimo = minimo
+        self.maximo = maximo
+        self.timeout = timeout
+        self.max_idade = max_idade
+        self.checagem = checagem
+
+        self._cond = threading.Condition()
+        self._ociosas = []   # usada como pilha: a conexão mais recente é a mais "quente"
+        self._em_uso = {}    # id(conn) -> _Conexao
+        self._total = 0      # conexões abertas ou a abrir
+
+        self._checkouts = 0
+        self._falhas = 0
+        self._recicladas = 0
+        self._espera_total = 0.0
+        self._espera_max = 0.0
+
+        for _ in range(minimo):
+            self._ociosas.append(self._nova())
+            self._total += 1
+
+    def _nova(self):
+        return _Conexao(psycopg2.connect(self.dsn))
+
+    def _fechar(self, item):
+        try:
+            item.conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _saudavel(self, item):
+        """Verifica se uma conexão ociosa ainda pode ser entregue."""
+        agora = time.monotonic()
+        if item.conn.closed or agora - item.criada_em > self.max_idade:
+            return False
+        if agora - item.devolvida_em > self.checagem:
+            try:
+                with item.conn.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                item.conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def obter(self):
+        """Retira uma conexão do pool, esperando se todas estiverem em uso."""
+        inicio = time.monotonic()
+        prazo = inicio + self.timeout
+        with self._cond:
+            while True:
+                if self._ociosas:
+                    item = self._ociosas.pop()
+                    break
+                if self._total < self.maximo:
+                    # Reserva a vaga já; a conexão é aberta fora do lock
+                    self._total += 1
+                    item = None
+                    break
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    self._falhas += 1
+                    raise PoolEsgotado(f"Nenhuma conexão livre após {self.timeout:g}s ({self.maximo} em uso).")
+                self._cond.wait(restante)
+
+        if item is not None and not self._saudavel(item):
+            self._fechar(item)
+            item = None
+            with self._cond:
+                self._recicladas += 1
+
+        if item is None:
+            try:
+                item = self._nova()
+            except Exception:
+                with self._cond:
+                    self._total -= 1
+                    self._falhas += 1
+                    self._cond.notify()
+                raise
+
+        espera = time.monotonic() - inicio
+        with self._cond:
+            self._em_uso[id(item.conn)] = item
+            self._checkouts += 1
+            self._espera_total += espera
+            self._espera_max = max(self._espera_max, espera)
+        metricas.registrar_espera_pool(espera)
+        return item.conn
+
+    def devolver(self, conn, descartar=False):
+        """Devolve uma conexão ao pool, desfazendo qualquer transação pendente."""
+        with self._cond:
+            item = self._em_uso.pop(id(conn), None)
+        if item is None:
+            return
+
+        if not descartar and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                descartar = True
+
+        agora = time.monotonic()
+        if descartar or conn.closed or agora - item.criada_em > self.max_idade:
+            self._fechar(item)
+            with self._cond:
+                self._total -= 1
+                self._recicladas += 1
+                self._cond.notify()
+            return
+
+        item.devolvida_em = agora
+        with self._cond:
+            self._ociosas.append(item)
+            self._cond.notify()
+
+    @contextmanager
+    def conexao(self):
+        """Empresta uma conexão durante um bloco `with` (para uso fora dos pedidos)."""
+        conn = self.obter()
+        descartar = False
+        try:
+            yield conn
+        except ERROS_DE_CONEXAO:
+            descartar = True
+            raise
+        finally:
+            self.devolver(conn, descartar=descartar)
+
+    def fechar(self):
+        """Fecha todas as conexões ociosas (as que estão em uso fecham ao ser devolvidas)."""
+        with self._cond:
+            ociosas, self._ociosas = self._ociosas, []
+            self._total -= len(ociosas)
+        for item in ociosas:
+            self._fechar(item)
+
+    def estatisticas(self):
+        """Retorna um retrato do estado e dos contadores do pool."""
+        with self._cond:
+            return {
+                'em_uso': len(self._em_uso),
+                'ociosas': len(self._ociosas),
+                'total': self._total,
+                'maximo': self.maximo,
+                'checkouts': self._checkouts,
+                'falhas_checkout': self._falhas,
+                'recicladas': self._recicladas,
+                'espera_media_ms': round(1000 * self._espera_total / self._checkouts, 3) if self._checkouts else 0.0,
+                'espera_max_ms': round(1000 * self._espera_max, 3),
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Retorna o pool partilhado, criando-o na primeira utilização."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PoolConexoes(DATABASE_URL)
+    return _pool
+
+
+def get_db_connection():
+    """Retorna a conexão do pedido atual, retirada do pool na primeira chamada."""
+    if 'db_conn' not in g:
+        g.db_conn = get_pool().obter()
+    return g.db_conn
+
+
+def devolver_conexao(exc=None):
+    """Devolve ao pool a conexão do pedido atual (registada no teardown do Flask)."""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        get_pool().devolver(conn, descartar=isinstance(exc, ERROS_DE_CONEXAO))
+
+
+def init_app(app):
+    """Liga a devolução automática das conexões ao fim de cada contexto da aplicação."""
+    app.teardown_appcontext(devolver_conexao)
+
+
+# --- CONSULTAS PREPARADAS ---
+# As consultas fixas dos endpoints de leitura são preparadas uma vez por
+# conexão (PREPARE) e depois só executadas (EXECUTE), poupando a análise e o
+# planeamento em cada pedido. Usam parâmetros posicionais do PostgreSQL ($1, $2...).
+
+CONSULTAS = {}
+_preparadas = weakref.WeakKeyDictionary()  # conexão -> nomes já preparados nela
+
+
+def registrar_consulta(nome, sql):
+    """Regista uma consulta para ser executada como prepared statement."""
+    CONSULTAS[nome] = sql
+    return nome
+
+
+def executar(cursor, nome, params=()):
+    """Executa a consulta registada `nome`, preparando-a na primeira vez em cada conexão."""
+    preparadas = _preparadas.setdefault(cursor.connection, set())
+    if nome not in preparadas:
+        cursor.execute(f"PREPARE {nome} AS {CONSULTAS[nome]}")
+        preparadas.add(nome)
+    with metricas.medir_consulta(nome, cursor):
+        if params:
+            marcadores = ', '.join(['%s'] * len(params))
+            cursor.execute(f"EXECUTE {nome} ({marcadores})", tuple(params))
+        else:
+            cursor.execute(f"EXECUTE {nome}")
@@ -1,251 +1,299 @@
+import base64
+import json
+import logging
 import os
-import re
-import unicodedata
-from datetime import datetime, date
-import psycopg2
-from psycopg2.extras import RealDictCursor, execute_values
-from flask import Flask, request, jsonify
+from datetime import date, timedelta
+from flask import Flask, Response, request, jsonify, abort, stream_with_context
 from flask_cors import CORS
 
+import acesso_dados
+import armazenamento
+import arquivo_precos
+import autocompletar
+import metricas
+from cache import em_cache, escopo_dia, CATALOGO
+from importacao import ler_linhas
+from otimizador_lista import totais_por_loja, melhor_divisao
+
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'), format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 CORS(app)
+metricas.init_app(app)
+armazenamento.init_app(app)
+
+@app.errorhandler(400)
+def erro_pedido_invalido(e):
+    return jsonify({"error": e.description}), 400
+
+@app.errorhandler(acesso_dados.PoolEsgotado)
+def erro_pool_esgotado(e):
+    return jsonify({"status": "error", "message": "Servidor ocupado, tente novamente em instantes."}), 503
+
+# Limites de resultados do autocompletar (por omissão e máximo)
+AUTOCOMPLETE_LIMITE = 10
+AUTOCOMPLETE_LIMITE_MAXIMO = 50
+
+# Granularidades aceites pelo histórico e o intervalo por omissão (dias até hoje)
+GRANULARIDADES_HISTORICO = ('dia', 'semana', 'mes')
+HISTORICO_DIAS_PADRAO = 365
 
-DATABASE_URL = os.environ.get('DATABASE_URL')
+# Limite de itens aceites por /api/lista/otimizar
+LISTA_MAX_ITENS = 500
+
+def codificar_cursor(oferta):
+    """Cursor opaco da página seguinte: o par (produto_nome, id) da última oferta."""
+    return base64.urlsafe_b64encode(json.dumps([oferta['produto_nome'], oferta['id']]).encode('utf-8')).decode('ascii')
+
+def decodificar_cursor(valor):
+    try:
+        produto_nome, id_oferta = json.loads(base64.urlsafe_b64decode(valor.encode('ascii')))
+        return str(produto_nome), int(id_oferta)
+    except (ValueError, TypeError, UnicodeError):
+        abort(400, description="Cursor de paginação inválido.")
+
+def data_do_pedido():
+    """Lê o parâmetro opcional `data` (AAAA-MM-DD) do pedido; por omissão, hoje."""
+    valor = request.args.get('data')
+    if not valor:
+        return date.today()
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        abort(400, description="Data inválida; use o formato AAAA-MM-DD.")
 
-def get_db_connection():
-    """Cria e retorna uma conexão com a base de dados PostgreSQL."""
-    conn = psycopg2.connect(DATABASE_URL)
-    return conn
+def normalizar_data(params):
+    """Preenche/normaliza `data` nos parâmetros usados como chave de cache."""
+    params['data'] = data_do_pedido().isoformat()
+
+def escopos_do_dia(params):
+    return [escopo_dia(date.fromisoformat(params['data']))]
 
 @app.route('/api/importar', methods=['POST'])
 def importar_dados():
-    dados_brutos = request.get_data(as_text=True)
-    if not dados_brutos:
-        return jsonify({"status": "error", "message": "Nenhum dado enviado."}), 400
-    
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
+    banco = armazenamento.do_pedido()
     try:
-        # --- LÓGICA DE IMPORTAÇÃO OTIMIZADA ---
-
-        # 1. Pré-carregar dados existentes para evitar queries dentro do loop
-        cursor.execute("SELECT nome, id FROM supermercados")
-        supermercados_map = {row['nome']: row['id'] for row in cursor.fetchall()}
-        
-        cursor.execute("SELECT nome, id FROM categorias")
-        categorias_map = {row['nome']: row['id'] for row in cursor.fetchall()}
-
-        cursor.execute("SELECT nome, id_categoria, id FROM produtos")
-        produtos_map = {(row['nome'], row['id_categoria']): row['id'] for row in cursor.fetchall()}
-
-        # Listas para guardar novos itens e dados de preços
-        novos_supermercados = set()
-        novas_categorias = set()
-        dados_precos_para_inserir = []
-
-        # 2. Processar cada linha em memória
-        for linha in dados_brutos.strip().split('\n'):
-            if not linha.strip() or '\t' not in linha: continue
-            colunas = linha.split('\t')
-            if len(colunas) < 5: continue
-            data_validade_raw, nome_supermercado, nome_produto_raw, valor_raw, nome_categoria = [c.strip() for c in colunas]
-
-            if nome_supermercado not in supermercados_map:
-                novos_supermercados.add(nome_supermercado)
-            if nome_categoria not in categorias_map:
-                novas_categorias.add(nome_categoria)
-
-            datas_processadas = []
-            try:
-                partes_data = data_validade_raw.split('/')
-                mes_ano_str = f"{partes_data[1]}/{partes_data[2]}"
-                dias_str = partes_data[0]
-                if '-' in dias_str:
-                    inicio, fim = map(int, dias_str.split('-'))
-                    for dia in range(inicio, fim + 1):
-                        datas_processadas.append(datetime.strptime(f"{dia}/{mes_ano_str}", '%d/%m/%Y').date())
-                else:
-                    datas_processadas.append(datetime.strptime(data_validade_raw, '%d/%m/%Y').date())
-            except (ValueError, IndexError): continue
-            valor_match = re.search(r'[\d.,]+', valor_raw)
-            if not valor_match: continue
-            valor_numerico_str = valor_match.group().replace('.', '').replace(',', '.')
-            valor_final = float(valor_numerico_str)
-            unidade = re.sub(r'R\$\s*[\d.,]+', '', valor_raw).strip()
-            obs_match = re.search(r'\((.*?)\)', nome_produto_raw)
-            observacoes = obs_match.group(1) if obs_match else None
-            nome_produto = re.sub(r'\s*\(.*?\)\s*', '', nome_produto_raw).strip()
-
-            for data_valida in datas_processadas:
-                dados_precos_para_inserir.append({
-                    "nome_supermercado": nome_supermercado,
-                    "nome_categoria": nome_categoria,
-                    "nome_produto": nome_produto,
-                    "valor": valor_final,
-                    "unidade": unidade,
-                    "data_validade": data_valida,
-                    "observacoes": observacoes
-                })
-
-        # 3. Inserir novos supermercados e categorias em massa (se houver)
-        if novos_supermercados:
-            execute_values(cursor, "INSERT INTO supermercados (nome) VALUES %s ON CONFLICT (nome) DO NOTHING", [(s,) for s in novos_supermercados])
-            cursor.execute("SELECT nome, id FROM supermercados")
-            supermercados_map = {row['nome']: row['id'] for row in cursor.fetchall()}
-        
-        if novas_categorias:
-            execute_values(cursor, "INSERT INTO categorias (nome) VALUES %s ON CONFLICT (nome) DO NOTHING", [(c,) for c in novas_categorias])
-            cursor.execute("SELECT nome, id FROM categorias")
-            categorias_map = {row['nome']: row['id'] for row in cursor.fetchall()}
-
-        # 4. Identificar e inserir novos produtos em massa
-        novos_produtos = set()
-        for preco in dados_precos_para_inserir:
-            id_categoria = categorias_map.get(preco['nome_categoria'])
-            if id_categoria and (preco['nome_produto'], id_categoria) not in produtos_map:
-                novos_produtos.add((preco['nome_produto'], id_categoria))
-        
-        if novos_produtos:
-            execute_values(cursor, "INSERT INTO produtos (nome, id_categoria) VALUES %s", list(novos_produtos))
-            cursor.execute("SELECT nome, id_categoria, id FROM produtos")
-            produtos_map = {(row['nome'], row['id_categoria']): row['id'] for row in cursor.fetchall()}
-
-        # 5. Apagar e inserir preços em massa (a operação mais importante)
-        if dados_precos_para_inserir:
-            delete_tuples = []
-            for preco in dados_precos_para_inserir:
-                id_supermercado = supermercados_map.get(preco['nome_supermercado'])
-                id_categoria = categorias_map.get(preco['nome_categoria'])
-                id_produto = produtos_map.get((preco['nome_produto'], id_categoria))
-                if id_produto and id_supermercado:
-                    delete_tuples.append((id_produto, id_supermercado, preco['data_validade']))
-            
-            if delete_tuples:
-                delete_query = """
-                    DELETE FROM precos_historicos p
-                    USING (VALUES %s) AS v(id_produto, id_supermercado, data_validade)
-                    WHERE p.id_produto = v.id_produto
-                      AND p.id_supermercado = v.id_supermercado
-                      AND p.data_validade = v.data_validade
-                """
-                execute_values(cursor, delete_query, delete_tuples)
-
-            insert_tuples = []
-            for preco in dados_precos_para_inserir:
-                id_supermercado = supermercados_map.get(preco['nome_supermercado'])
-                id_categoria = categorias_map.get(preco['nome_categoria'])
-                id_produto = produtos_map.get((preco['nome_produto'], id_categoria))
-                if id_produto and id_supermercado:
-                    insert_tuples.append((id_produto, id_supermercado, preco['valor'], preco['unidade'], preco['data_validade'], preco['observacoes']))
-
-            if insert_tuples:
-                execute_values(cursor, "INSERT INTO precos_historicos (id_produto, id_supermercado, valor, unidade, data_validade, observacoes) VALUES %s", insert_tuples)
-
-        conn.commit()
-        
+        # O corpo é lido linha a linha e gravado como tarefa; no PostgreSQL a importação corre em
+        # segundo plano. Com ?autoritativa=1, as ofertas gravadas que a folha não trouxer são retiradas.
+        autoritativa = request.args.get('autoritativa', '0') not in ('', '0', 'false')
+        id_tarefa, nova = banco.criar_importacao(ler_linhas(request.stream), autoritativa)
     except Exception as e:
-        conn.rollback()
-        print(f"Erro ao importar: {e}")
+        banco.desfazer()
+        logger.exception("Erro ao importar")
         return jsonify({"status": "error", "message": f"Erro no servidor: {e}"}), 500
-    finally:
-        cursor.close()
-        conn.close()
-        
-    return jsonify({"status": "success", "message": f"{len(dados_precos_para_inserir)} registros de ofertas processados com sucesso!"}), 200
+    if id_tarefa is None:
+        return jsonify({"status": "error", "message": "Nenhum dado enviado."}), 400
+
+    if nova and armazenamento.ARMAZENAMENTO == 'sqlite':
+        mensagem = "Importação concluída."
+    elif nova:
+        mensagem = "Importação recebida e colocada na fila."
+    else:
+        mensagem = "Estes dados já foram enviados; a importação existente foi reaproveitada."
+    return jsonify({"status": "accepted", "message": mensagem, "job_id": id_tarefa, "nova": nova}), 202
+
+@app.route('/api/importar/<int:job_id>', methods=['GET'])
+def get_estado_importacao(job_id):
+    tarefa = armazenamento.do_pedido().obter_importacao(job_id)
+    if tarefa is None:
+        return jsonify({"error": "Importação não encontrada"}), 404
+    return jsonify(tarefa)
 
 @app.route('/api/filtros', methods=['GET'])
+@em_cache(lambda params: [CATALOGO])
 def get_filtros():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    cursor.execute('SELECT id, nome FROM supermercados ORDER BY nome')
-    supermercados = cursor.fetchall()
-    cursor.execute('SELECT id, nome FROM categorias ORDER BY nome')
-    categorias = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return jsonify({'supermercados': supermercados, 'categorias': categorias})
+    return jsonify(armazenamento.do_pedido().filtros())
+
+# Tamanho máximo de uma página de /api/ofertas
+OFERTAS_LIMITE_MAXIMO = 1000
 
 @app.route('/api/ofertas', methods=['GET'])
+@em_cache(escopos_do_dia, normalizar_data)
 def get_ofertas():
-    data_selecionada = request.args.get('data') or date.today().strftime('%Y-%m-%d')
+    """Ofertas de um dia, ordenadas pelo nome do produto.
+
+    Com `limit`, devolve uma página ({"ofertas": [...], "proximo_cursor": ...});
+    a seguinte pede-se com `cursor=<proximo_cursor>`. Sem `limit`, todas as
+    ofertas são enviadas em streaming a partir de um cursor do lado do
+    servidor, como array JSON ou, com `formato=ndjson`, uma oferta por linha.
+    """
+    data_selecionada = data_do_pedido()
     busca = request.args.get('busca', '')
     supermercado_id = request.args.get('supermercado', '')
     categoria_id = request.args.get('categoria', '')
-    
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
-    query = "SELECT p.nome as produto_nome, ph.valor, ph.unidade, ph.observacoes, ph.id_produto, s.nome as supermercado_nome, c.nome as categoria_nome FROM precos_historicos ph JOIN produtos p ON ph.id_produto = p.id JOIN supermercados s ON ph.id_supermercado = s.id JOIN categorias c ON p.id_categoria = c.id WHERE ph.data_validade = %s"
-    params = [data_selecionada]
-
-    if busca:
-        # --- CORREÇÃO APLICADA AQUI ---
-        # Agora usamos a função unaccent() do PostgreSQL, que ignora acentos e maiúsculas/minúsculas
-        query += " AND unaccent(p.nome) ILIKE unaccent(%s)"
-        params.append(f'%{busca}%')
-    if supermercado_id:
-        query += " AND s.id = %s"
-        params.append(supermercado_id)
-    if categoria_id:
-        query += " AND c.id = %s"
-        params.append(categoria_id)
-    
-    query += " ORDER BY p.nome"
-    cursor.execute(query, tuple(params))
-    ofertas = cursor.fetchall()
-    
-    cursor.close()
-    conn.close()
-    return jsonify(ofertas)
+    limite = request.args.get('limit', '').strip()
+    banco = armazenamento.do_pedido()
+
+    if limite:
+        # Um limit inválido não pode cair no streaming de todas as ofertas
+        if not limite.isdigit() or not 1 <= int(limite) <= OFERTAS_LIMITE_MAXIMO:
+            abort(400, description=f"limit deve ser um inteiro entre 1 e {OFERTAS_LIMITE_MAXIMO}.")
+        limite = int(limite)
+        cursor_pagina = request.args.get('cursor')
+        # Sem cursor começa do início: ('', 0) vem antes de qualquer (nome, id)
+        apos = decodificar_cursor(cursor_pagina) if cursor_pagina else ('', 0)
+        ofertas = banco.ofertas(data_selecionada, busca, supermercado_id, categoria_id, limite, apos)
+        proximo = codificar_cursor(ofertas[-1]) if len(ofertas) == limite else None
+        return jsonify({'ofertas': ofertas, 'proximo_cursor': proximo})
+
+    ndjson = request.args.get('formato') == 'ndjson'
+
+    def gerar():
+        separador = '' if ndjson else '['
+        with metricas.medir_serializacao_em_fluxo():
+            for oferta in banco.ofertas_em_fluxo(data_selecionada, busca, supermercado_id, categoria_id):
+                if ndjson:
+                    yield app.json.dumps(oferta) + '\n'
+                else:
+                    yield separador + app.json.dumps(oferta)
+                    separador = ','
+        if not ndjson:
+            yield ']' if separador == ',' else '[]'
+
+    mimetype = 'application/x-ndjson' if ndjson else 'application/json'
+    return Response(stream_with_context(gerar()), mimetype=mimetype)
+
+def juntar_historico_arquivado(historico, supermercados, id_produto, inicio, fim):
+    """Acrescenta ao histórico diário da base os dias dos meses já arquivados em ficheiro."""
+    nomes = {s['id']: s['nome'] for s in supermercados}
+    na_base = {(h['periodo'], h['supermercado_nome']) for h in historico}
+    for (data, id_supermercado), valor in arquivo_precos.leitor.historico(id_produto, inicio, fim).items():
+        nome = nomes.get(id_supermercado)
+        # Uma partição recriada depois do arquivo tem os dados mais recentes
+        if nome is None or (data, nome) in na_base:
+            continue
+        historico.append({"periodo": data, "supermercado_nome": nome, "valor_minimo": valor,
+                          "valor_medio": valor, "valor_maximo": valor, "num_dias": 1})
+    historico.sort(key=lambda h: (h['periodo'], h['supermercado_nome']))
+    return historico
 
 @app.route('/api/produto/<int:id_produto>/historico', methods=['GET'])
 def get_historico_produto(id_produto):
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    cursor.execute("SELECT ph.valor, ph.data_registro, s.nome AS supermercado_nome FROM precos_historicos ph JOIN supermercados s ON ph.id_supermercado = s.id WHERE ph.id_produto = %s ORDER BY ph.data_registro", (id_produto,))
-    historico = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return jsonify(historico)
+    """Preço mínimo, médio e máximo do produto em cada supermercado, por dia, semana ou mês de validade.
+
+    Parâmetros opcionais: `inicio` e `fim` (AAAA-MM-DD; por omissão o último ano
+    até hoje) e `granularidade` (dia, semana ou mes; por omissão, dia).
+    """
+    granularidade = request.args.get('granularidade') or 'dia'
+    if granularidade not in GRANULARIDADES_HISTORICO:
+        abort(400, description=f"Granularidade inválida; use {', '.join(GRANULARIDADES_HISTORICO)}.")
+    try:
+        fim = date.fromisoformat(request.args['fim']) if request.args.get('fim') else date.today()
+        inicio = (date.fromisoformat(request.args['inicio']) if request.args.get('inicio')
+                  else fim - timedelta(days=HISTORICO_DIAS_PADRAO))
+    except ValueError:
+        abort(400, description="Data inválida; use o formato AAAA-MM-DD.")
+    if inicio > fim:
+        abort(400, description="'inicio' não pode ser depois de 'fim'.")
+
+    banco = armazenamento.do_pedido()
+    if granularidade == 'dia':
+        historico = banco.historico(id_produto, granularidade, inicio, fim)
+        if arquivo_precos.leitor.tem_meses(inicio, fim):
+            historico = juntar_historico_arquivado(historico, banco.supermercados(), id_produto, inicio, fim)
+        return jsonify(historico)
+    # O período que contém `inicio` também entra, mesmo começando antes
+    if granularidade == 'semana':
+        inicio -= timedelta(days=inicio.weekday())
+    else:
+        inicio = inicio.replace(day=1)
+    return jsonify(banco.historico(id_produto, granularidade, inicio, fim))
 
 @app.route('/api/produtos-em-oferta', methods=['GET'])
+@em_cache(escopos_do_dia, normalizar_data)
 def get_produtos_em_oferta():
-    data_hoje = date.today()
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    query = """
-        SELECT p.id, p.nome, ph.valor, s.nome as supermercado_nome
-        FROM precos_historicos ph
-        JOIN produtos p ON ph.id_produto = p.id
-        JOIN supermercados s ON ph.id_supermercado = s.id
-        WHERE ph.data_validade = %s AND ph.valor = (
-            SELECT MIN(ph2.valor)
-            FROM precos_historicos ph2
-            WHERE ph2.id_produto = ph.id_produto AND ph2.data_validade = %s
-        )
-        GROUP BY p.id, p.nome, ph.valor, s.nome
-        ORDER BY p.nome
-    """
-    cursor.execute(query, (data_hoje, data_hoje))
-    produtos = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return jsonify(produtos)
+    return jsonify(armazenamento.do_pedido().produtos_em_oferta(data_do_pedido()))
 
 @app.route('/api/produto/todas-ofertas-hoje', methods=['GET'])
+@em_cache(escopos_do_dia, normalizar_data)
 def get_todas_ofertas_hoje():
     id_produto = request.args.get('id', type=int)
     if not id_produto:
         return jsonify({"error": "ID do produto é obrigatório"}), 400
-    data_hoje = date.today()
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    cursor.execute("SELECT ph.valor, s.nome as supermercado_nome FROM precos_historicos ph JOIN supermercados s ON ph.id_supermercado = s.id WHERE ph.id_produto = %s AND ph.data_validade = %s ORDER BY ph.valor ASC", (id_produto, data_hoje))
-    ofertas = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return jsonify(ofertas)
+    ofertas = armazenamento.do_pedido().ofertas_produto(data_do_pedido(), id_produto)
+    # As ofertas já vêm ordenadas da mais barata para a mais cara
+    return jsonify(ofertas or [])
+
+@app.route('/api/autocomplete', methods=['GET'])
+def get_autocomplete():
+    """Produtos cujo nome começa pelo texto `q` (sem distinguir acentos), os em oferta hoje primeiro."""
+    limite = request.args.get('limit', '').strip() or str(AUTOCOMPLETE_LIMITE)
+    # Com type=int um limit que não é número cairia no valor por omissão sem aviso
+    if not limite.isdigit() or not 1 <= int(limite) <= AUTOCOMPLETE_LIMITE_MAXIMO:
+        abort(400, description=f"'limit' tem de ser um inteiro entre 1 e {AUTOCOMPLETE_LIMITE_MAXIMO}.")
+    return jsonify(autocompletar.indice.buscar(request.args.get('q', ''), int(limite)))
+
+@app.route('/api/lista/otimizar', methods=['POST'])
+def otimizar_lista():
+    """Preços de uma lista de compras em cada supermercado e a forma mais barata de a comprar.
+
+    Corpo JSON: {"ids": [...], "data": "AAAA-MM-DD" (opcional), "max_lojas": N (opcional)}.
+    """
+    corpo = request.get_json(silent=True) or {}
+    ids = corpo.get('ids')
+    if not isinstance(ids, list) or not ids or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        abort(400, description="Indique a lista de produtos em 'ids' (números inteiros).")
+    if len(ids) > LISTA_MAX_ITENS:
+        abort(400, description=f"A lista tem mais de {LISTA_MAX_ITENS} produtos.")
+    max_lojas = corpo.get('max_lojas')
+    if max_lojas is not None and (not isinstance(max_lojas, int) or isinstance(max_lojas, bool) or max_lojas < 1):
+        abort(400, description="'max_lojas' tem de ser um inteiro positivo.")
+    try:
+        data_consulta = date.fromisoformat(corpo['data']) if corpo.get('data') else date.today()
+    except (TypeError, ValueError):
+        abort(400, description="Data inválida; use o formato AAAA-MM-DD.")
+    ids = list(dict.fromkeys(ids))
+
+    por_id = {row['id']: row for row in armazenamento.do_pedido().ofertas_lista(data_consulta, ids)}
+
+    itens = [por_id[i] for i in ids if i in por_id]
+    indisponiveis = [i for i in ids if i not in por_id]
+    precos = [{o['supermercado_nome']: float(o['valor']) for o in item['ofertas']} for item in itens]
+    lojas = sorted({loja for por_loja in precos for loja in por_loja})
+
+    totais = [
+        {"supermercado_nome": loja, "total": round(total, 2), "itens_encontrados": encontrados,
+         "completa": encontrados == len(itens)}
+        for loja, (total, encontrados) in totais_por_loja(precos, lojas).items()
+    ]
+    totais.sort(key=lambda t: (not t['completa'], -t['itens_encontrados'], t['total'], t['supermercado_nome']))
+    melhor_loja_unica = totais[0] if totais and totais[0]['completa'] else None
+
+    divisao = None
+    if itens:
+        escolhidas, total, exato, nos = melhor_divisao(precos, max_lojas)
+        por_loja = {loja: [] for loja in escolhidas}
+        for item, precos_item in zip(itens, precos):
+            if not escolhidas:
+                break
+            loja = min((l for l in escolhidas if l in precos_item), key=lambda l: (precos_item[l], l))
+            por_loja[loja].append({"id": item['id'], "nome": item['nome'], "valor": precos_item[loja]})
+        divisao = {
+            "max_lojas": max_lojas,
+            # None quando nenhum conjunto de até max_lojas supermercados tem a lista toda
+            "total": round(total, 2) if escolhidas else None,
+            "exato": exato,
+            "nos_explorados": nos,
+            "lojas": [
+                {"supermercado_nome": loja, "subtotal": round(sum(i['valor'] for i in itens_loja), 2), "itens": itens_loja}
+                for loja, itens_loja in por_loja.items() if itens_loja
+            ],
+        }
+
+    return jsonify({
+        "data": data_consulta.isoformat(),
+        "itens": [{"id": item['id'], "nome": item['nome'], "ofertas": item['ofertas']} for item in itens],
+        "indisponiveis": indisponiveis,
+        "lojas": totais,
+        "melhor_loja_unica": melhor_loja_unica,
+        "divisao": divisao,
+    })
+
+@app.route('/api/pool', methods=['GET'])
+def get_estatisticas_pool():
+    """Estatísticas do pool de conexões (em uso, ociosas, tempos de espera e falhas)."""
+    return jsonify(armazenamento.estatisticas_conexoes())
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,334 @@
+"""Armazenamento dos dados da API: PostgreSQL em produção ou SQLite para correr localmente.
+
+Os endpoints não falam diretamente com a base: pedem a `do_pedido()` um
+`Armazenamento` ligado à conexão do pedido e usam os seus métodos. A
+implementação é escolhida por ARMAZENAMENTO:
+
+* `postgres` (por omissão): `ArmazenamentoPostgres`, sobre o pool e as
+  consultas preparadas de acesso_dados.py, com a importação assíncrona de
+  tarefas_importacao.py;
+* `sqlite`: `ArmazenamentoSQLite`, de armazenamento_sqlite.py, num
+  ficheiro local e com a importação feita dentro do próprio pedido.
+
+As consultas de leitura são escritas aqui uma vez, com parâmetros `$n`, e
+servem às duas bases. O arquivo de partições, as migrações e a verificação
+de planos continuam a existir só no PostgreSQL.
+"""
+import os
+import time
+from abc import ABC, abstractmethod
+
+from psycopg2.extras import RealDictCursor
+
+import acesso_dados
+import metricas
+import tarefas_importacao
+from acesso_dados import registrar_consulta, executar
+
+ARMAZENAMENTOS = ('postgres', 'sqlite')
+ARMAZENAMENTO = os.environ.get('ARMAZENAMENTO', 'postgres')
+
+# Linhas lidas de cada vez quando as ofertas são enviadas em streaming
+OFERTAS_LINHAS_POR_LEITURA = 500
+# Nome da consulta das ofertas em streaming nas métricas (não é preparada: corre num cursor com nome)
+CONSULTA_OFERTAS_FLUXO = 'ofertas_fluxo'
+
+# --- CONSULTAS DE LEITURA (preparadas em cada conexão do PostgreSQL) ---
+
+CONSULTA_SUPERMERCADOS = registrar_consulta('filtros_supermercados', 'SELECT id, nome FROM supermercados ORDER BY nome')
+CONSULTA_CATEGORIAS = registrar_consulta('filtros_categorias', 'SELECT id, nome FROM categorias ORDER BY nome')
+
+# Histórico de um produto entre duas datas de validade: dia a dia, direto das ofertas...
+CONSULTA_HISTORICO_DIA = registrar_consulta('historico_produto_dia', """
+    SELECT ph.data_validade AS periodo, s.nome AS supermercado_nome,
+           ph.valor AS valor_minimo, ph.valor AS valor_medio, ph.valor AS valor_maximo, 1 AS num_dias
+    FROM precos_historicos ph
+    JOIN supermercados s ON ph.id_supermercado = s.id
+    WHERE ph.id_produto = $1 AND ph.data_validade BETWEEN $2 AND $3
+    ORDER BY ph.data_validade, s.nome
+""")
+
+# ...ou por semana/mês, da tabela historico_resumido (ver resumos.py)
+CONSULTA_HISTORICO_RESUMIDO = registrar_consulta('historico_produto_resumido', """
+    SELECT h.periodo, s.nome AS supermercado_nome,
+           h.valor_minimo, h.valor_medio, h.valor_maximo, h.num_dias
+    FROM historico_resumido h
+    JOIN supermercados s ON h.id_supermercado = s.id
+    WHERE h.id_produto = $1 AND h.granularidade = $2 AND h.periodo BETWEEN $3 AND $4
+    ORDER BY h.periodo, s.nome
+""")
+
+# Lê da tabela pré-calculada melhores_ofertas_dia (ver resumos.py); um produto com o
+# menor preço empatado em vários supermercados aparece uma vez por supermercado.
+CONSULTA_PRODUTOS_EM_OFERTA = registrar_consulta('produtos_em_oferta', """
+    SELECT p.id, p.nome, m.valor_minimo AS valor, unnest(m.supermercados) AS supermercado_nome
+    FROM melhores_ofertas_dia m
+    JOIN produtos p ON m.id_produto = p.id
+    WHERE m.data = $1
+    ORDER BY p.nome, supermercado_nome
+""")
+
+CONSULTA_TODAS_OFERTAS_PRODUTO = registrar_consulta('todas_ofertas_produto', """
+    SELECT ofertas FROM melhores_ofertas_dia WHERE data = $1 AND id_produto = $2
+""")
+
+CONSULTA_OFERTAS_LISTA = registrar_consulta('ofertas_lista', """
+    SELECT p.id, p.nome, m.ofertas
+    FROM melhores_ofertas_dia m
+    JOIN produtos p ON m.id_produto = p.id
+    WHERE m.data = $1 AND m.id_produto = ANY($2::int[])
+""")
+
+
+def sql_ofertas(busca, supermercado, categoria, paginada=False, marcador=lambda n: f'${n}'):
+    """Monta a consulta de ofertas para a combinação de filtros pedida.
+
+    A ordem (p.nome, ph.id) é total, o que permite a paginação por chave
+    (keyset): a página seguinte começa logo depois do último par devolvido.
+    `marcador(n)` dá o marcador do n-ésimo parâmetro ($n nas consultas
+    preparadas e no SQLite, %s nos cursores do lado do servidor).
+    """
+    query = "SELECT ph.id, p.nome as produto_nome, ph.valor, ph.unidade, ph.observacoes, ph.id_produto, s.nome as supermercado_nome, c.nome as categoria_nome FROM precos_historicos ph JOIN produtos p ON ph.id_produto = p.id JOIN supermercados s ON ph.id_supermercado = s.id JOIN categorias c ON p.id_categoria = c.id WHERE ph.data_validade = " + marcador(1)
+    n = 1
+    if busca:
+        # Sem acentos e em minúsculas, na mesma forma do índice trigram idx_produtos_nome_busca
+        n += 1
+        query += f" AND f_unaccent(lower(p.nome)) LIKE f_unaccent(lower({marcador(n)}))"
+    if supermercado:
+        n += 1
+        query += f" AND s.id = {marcador(n)}"
+    if categoria:
+        n += 1
+        query += f" AND c.id = {marcador(n)}"
+    if paginada:
+        query += f" AND (p.nome, ph.id) > ({marcador(n + 1)}, {marcador(n + 2)})"
+    query += " ORDER BY p.nome, ph.id"
+    if paginada:
+        query += f" LIMIT {marcador(n + 3)}"
+    return query
+
+
+def consulta_ofertas(busca, supermercado, categoria, paginada=False):
+    """Retorna o nome da consulta preparada de ofertas para a combinação de filtros pedida.
+
+    Cada combinação de filtros opcionais é uma consulta preparada diferente,
+    para que o planeador não tenha de lidar com condições do tipo `$n IS NULL OR ...`.
+    """
+    nome = 'ofertas' + ''.join(['_busca' if busca else '', '_super' if supermercado else '', '_cat' if categoria else '', '_pagina' if paginada else ''])
+    if nome not in acesso_dados.CONSULTAS:
+        registrar_consulta(nome, sql_ofertas(busca, supermercado, categoria, paginada))
+    return nome
+
+
+def parametros_ofertas(data, busca, supermercado, categoria):
+    """Parâmetros de `sql_ofertas` pela mesma ordem dos marcadores (sem os da paginação)."""
+    params = [data]
+    if busca:
+        params.append(f'%{busca}%')
+    if supermercado:
+        params.append(supermercado)
+    if categoria:
+        params.append(categoria)
+    return params
+
+
+def _ler_em_fluxo(nome, cursor, sql, params):
+    """Executa `sql` e gera as linhas em lotes de OFERTAS_LINHAS_POR_LEITURA.
+
+    As métricas da consulta contam só o tempo passado à espera da base,
+    sem o de quem consome as linhas, e as linhas efetivamente lidas.
+    """
+    linhas = 0
+    inicio = time.perf_counter()
+    try:
+        cursor.execute(sql, params)
+        while True:
+            lote = cursor.fetchmany(OFERTAS_LINHAS_POR_LEITURA)
+            if not lote:
+                break
+            linhas += len(lote)
+            pausa = time.perf_counter()
+            yield from lote
+            inicio += time.perf_counter() - pausa
+    finally:
+        metricas.registrar_tempo_consulta(nome, time.perf_counter() - inicio, linhas)
+
+
+class Armazenamento(ABC):
+    """Operações de dados usadas pela API, sobre uma conexão.
+
+    Datas entram e saem como `datetime.date`; as linhas saem como
+    dicionários com os nomes das colunas.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @abstractmethod
+    def supermercados(self):
+        """[{id, nome}] por nome."""
+
+    @abstractmethod
+    def filtros(self):
+        """{'supermercados': [...], 'categorias': [...]}, cada um com id e nome, por nome."""
+
+    @abstractmethod
+    def ofertas(self, data, busca, supermercado, categoria, limite, apos=('', 0)):
+        """Até `limite` ofertas do dia por (nome do produto, id), a começar depois do par `apos`."""
+
+    @abstractmethod
+    def ofertas_em_fluxo(self, data, busca, supermercado, categoria):
+        """Todas as ofertas do dia, pela mesma ordem, lidas da base aos poucos (gerador)."""
+
+    @abstractmethod
+    def historico(self, id_produto, granularidade, inicio, fim):
+        """Preço mínimo, médio e máximo por período e supermercado, entre `inicio` e `fim`."""
+
+    @abstractmethod
+    def produtos_em_oferta(self, data):
+        """Produtos do dia com o menor preço e os supermercados que o praticam."""
+
+    @abstractmethod
+    def ofertas_produto(self, data, id_produto):
+        """Ofertas do produto no dia, da mais barata para a mais cara (None se não houver)."""
+
+    @abstractmethod
+    def ofertas_lista(self, data, ids):
+        """[{id, nome, ofertas}] dos produtos de `ids` com ofertas no dia."""
+
+    @abstractmethod
+    def versoes(self, escopos):
+        """{escopo: versão} dos escopos de `versoes_dados` pedidos que existirem."""
+
+    @abstractmethod
+    def todas_versoes(self):
+        """[(escopo, versão)] de todos os escopos de `versoes_dados`."""
+
+    @abstractmethod
+    def produtos_desde(self, id_produto):
+        """[(id, nome)] dos produtos com id maior do que `id_produto`."""
+
+    @abstractmethod
+    def ids_em_oferta(self, data):
+        """Ids dos produtos com ofertas no dia."""
+
+    @abstractmethod
+    def criar_importacao(self, linhas, autoritativa=False):
+        """Recebe as linhas de uma folha e retorna (id da importação, nova), como `criar_tarefa`."""
+
+    @abstractmethod
+    def obter_importacao(self, id_importacao):
+        """Estado e resultado de uma importação (None se não existir)."""
+
+    @abstractmethod
+    def desfazer(self):
+        """Desfaz a transação em curso, se houver."""
+
+
+class ArmazenamentoPostgres(Armazenamento):
+
+    def _cursor(self):
+        return self.conn.cursor(cursor_factory=RealDictCursor)
+
+    def _consultar(self, nome, params=()):
+        cursor = self._cursor()
+        executar(cursor, nome, params)
+        linhas = cursor.fetchall()
+        cursor.close()
+        return linhas
+
+    def supermercados(self):
+        return self._consultar(CONSULTA_SUPERMERCADOS)
+
+    def filtros(self):
+        return {'supermercados': self.supermercados(), 'categorias': self._consultar(CONSULTA_CATEGORIAS)}
+
+    def ofertas(self, data, busca, supermercado, categoria, limite, apos=('', 0)):
+        params = parametros_ofertas(data, busca, supermercado, categoria) + [*apos, limite]
+        return self._consultar(consulta_ofertas(busca, supermercado, categoria, paginada=True), params)
+
+    def ofertas_em_fluxo(self, data, busca, supermercado, categoria):
+        query = sql_ofertas(busca, supermercado, categoria, marcador=lambda n: '%s')
+        # Cursor com nome = cursor do lado do servidor: as linhas chegam aos poucos
+        cursor = self.conn.cursor(name='ofertas_stream', cursor_factory=RealDictCursor)
+        try:
+            yield from _ler_em_fluxo(CONSULTA_OFERTAS_FLUXO, cursor, query, parametros_ofertas(data, busca, supermercado, categoria))
+        finally:
+            cursor.close()
+            self.conn.rollback()
+
+    def historico(self, id_produto, granularidade, inicio, fim):
+        if granularidade == 'dia':
+            return self._consultar(CONSULTA_HISTORICO_DIA, (id_produto, inicio, fim))
+        return self._consultar(CONSULTA_HISTORICO_RESUMIDO, (id_produto, granularidade, inicio, fim))
+
+    def produtos_em_oferta(self, data):
+        return self._consultar(CONSULTA_PRODUTOS_EM_OFERTA, (data,))
+
+    def ofertas_produto(self, data, id_produto):
+        linhas = self._consultar(CONSULTA_TODAS_OFERTAS_PRODUTO, (data, id_produto))
+        return linhas[0]['ofertas'] if linhas else None
+
+    def ofertas_lista(self, data, ids):
+        return self._consultar(CONSULTA_OFERTAS_LISTA, (data, ids))
+
+    def _linhas(self, sql, params):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def versoes(self, escopos):
+        return dict(self._linhas("SELECT escopo, versao FROM versoes_dados WHERE escopo = ANY(%s)", (list(escopos),)))
+
+    def todas_versoes(self):
+        return self._linhas("SELECT escopo, versao FROM versoes_dados", ())
+
+    def produtos_desde(self, id_produto):
+        return self._linhas("SELECT id, nome FROM produtos WHERE id > %s", (id_produto,))
+
+    def ids_em_oferta(self, data):
+        return [linha[0] for linha in self._linhas("SELECT id_produto FROM melhores_ofertas_dia WHERE data = %s", (data,))]
+
+    def criar_importacao(self, linhas, autoritativa=False):
+        id_tarefa, nova = tarefas_importacao.criar_tarefa(self.conn, linhas, autoritativa)
+        if nova:
+            tarefas_importacao.trabalhador.avisar()
+        return id_tarefa, nova
+
+    def obter_importacao(self, id_importacao):
+        return tarefas_importacao.obter_tarefa(self.conn, id_importacao)
+
+    def desfazer(self):
+        self.conn.rollback()
+
+
+def do_pedido():
+    """O armazenamento configurado, ligado à conexão do pedido (ou da thread) atual."""
+    if ARMAZENAMENTO == 'sqlite':
+        # Importado só quando é preciso: armazenamento_sqlite importa deste módulo a classe base e as consultas
+        import armazenamento_sqlite
+        return armazenamento_sqlite.ArmazenamentoSQLite(armazenamento_sqlite.conexao_sqlite())
+    return ArmazenamentoPostgres(acesso_dados.get_db_connection())
+
+
+def estatisticas_conexoes():
+    """Estado das conexões: o pool do PostgreSQL ou o ficheiro SQLite em uso."""
+    if ARMAZENAMENTO == 'sqlite':
+        import armazenamento_sqlite
+        return {'armazenamento': 'sqlite', 'caminho': os.path.abspath(armazenamento_sqlite.SQLITE_CAMINHO)}
+    return acesso_dados.get_pool().estatisticas()
+
+
+def init_app(app):
+    """Prepara o armazenamento configurado para servir a aplicação."""
+    if ARMAZENAMENTO not in ARMAZENAMENTOS:
+        raise ValueError(f"ARMAZENAMENTO inválido: {ARMAZENAMENTO!r} (use {' ou '.join(ARMAZENAMENTOS)}).")
+    if ARMAZENAMENTO == 'sqlite':
+        import armazenamento_sqlite
+        armazenamento_sqlite.init_app(app)
+    else:
+        acesso_dados.init_app(app)
+        tarefas_importacao.init_app(app)
@@ -0,0 +1,282 @@
+"""Armazenamento SQLite (ARMAZENAMENTO=sqlite), para correr a API sem servidor de base de dados.
+
+Os dados ficam no ficheiro SQLITE_CAMINHO, com o esquema de database.py,
+em modo WAL e com uma conexão por thread. As consultas de leitura são as
+de armazenamento.py; só as que usam arrays ou JSON do PostgreSQL têm aqui
+uma versão própria.
+
+A importação segue os passos de importacao.py e resumos.py com o mesmo SQL
+sempre que os dialetos o permitem, e numa só transação: corre dentro do
+próprio pedido e a importação devolvida já está concluída.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+from datetime import date, datetime
+
+import cache
+import database
+import metricas
+import tarefas_importacao
+from acesso_dados import CONSULTAS
+from armazenamento import (
+    Armazenamento, CONSULTA_CATEGORIAS, CONSULTA_HISTORICO_DIA, CONSULTA_HISTORICO_RESUMIDO, CONSULTA_OFERTAS_FLUXO,
+    CONSULTA_OFERTAS_LISTA, CONSULTA_PRODUTOS_EM_OFERTA, CONSULTA_SUPERMERCADOS, CONSULTA_TODAS_OFERTAS_PRODUTO,
+    _ler_em_fluxo, consulta_ofertas, parametros_ofertas, sql_ofertas,
+)
+from importacao import (
+    ANOTAR_PENDENTES_SQLITE, CONTAR_OFERTAS_SQLITE, COMPARAR_OFERTAS_SQLITE, CRIAR_OFERTAS_IMPORTADAS_SQLITE,
+    INSERIR_CATEGORIAS, INSERIR_PRODUTOS, INSERIR_SUPERMERCADOS, RESOLVER_OFERTAS_SQLITE, RETIRAR_AUSENTES_SQLITE,
+    TABELA_STAGING, UPSERT_PRECOS_SQLITE, FolhaRecebida, ResumoImportacao, analisar_em_lotes,
+)
+from resumos import atualizar_resumos_sqlite
+
+logger = logging.getLogger(__name__)
+
+SQLITE_CAMINHO = database.DATABASE
+
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_converter('DATE', lambda valor: date.fromisoformat(valor.decode()))
+sqlite3.register_converter('TIMESTAMP', lambda valor: datetime.fromisoformat(valor.decode()))
+sqlite3.register_converter('BOOLEAN', lambda valor: valor != b'0')
+
+PRODUTOS_EM_OFERTA_SQLITE = """
+    SELECT p.id, p.nome, m.valor_minimo AS valor, s.value AS supermercado_nome
+    FROM melhores_ofertas_dia m
+    JOIN produtos p ON m.id_produto = p.id
+    JOIN json_each(m.supermercados) s
+    WHERE m.data = $1
+    ORDER BY p.nome, supermercado_nome
+"""
+
+OFERTAS_LISTA_SQLITE = """
+    SELECT p.id, p.nome, m.ofertas
+    FROM melhores_ofertas_dia m
+    JOIN produtos p ON m.id_produto = p.id
+    WHERE m.data = $1 AND m.id_produto IN (SELECT value FROM json_each($2))
+"""
+
+# As tabelas temporárias duram o que dura a conexão: são esvaziadas no início de cada importação
+CRIAR_STAGING = [
+    TABELA_STAGING,
+    CRIAR_OFERTAS_IMPORTADAS_SQLITE,
+    "DELETE FROM staging_ofertas",
+    "DELETE FROM ofertas_importadas",
+]
+
+INSERIR_STAGING = """
+    INSERT INTO staging_ofertas (linha, data_validade, supermercado, categoria, produto, valor, unidade, observacoes)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_local = threading.local()
+
+
+def sem_acentos(texto):
+    """Equivalente à `f_unaccent` do PostgreSQL, registada em cada conexão SQLite."""
+    if texto is None:
+        return None
+    return ''.join(c for c in unicodedata.normalize('NFD', texto) if not unicodedata.combining(c))
+
+
+def conexao_sqlite():
+    """Conexão SQLite desta thread, aberta na primeira utilização."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        # Sem transações implícitas: as escritas abrem a sua com BEGIN IMMEDIATE
+        conn = sqlite3.connect(SQLITE_CAMINHO, detect_types=sqlite3.PARSE_DECLTYPES, isolation_level=None)
+        database.configurar_conexao(conn)
+        conn.create_function('f_unaccent', 1, sem_acentos, deterministic=True)
+        _local.conn = conn
+    return conn
+
+
+def _dicionario(cursor, linha):
+    return {coluna[0]: valor for coluna, valor in zip(cursor.description, linha)}
+
+
+def _numerados(params):
+    """Parâmetros de uma consulta com marcadores $1, $2... no formato do sqlite3."""
+    return {str(n): valor for n, valor in enumerate(params, 1)}
+
+
+def _importacao_existente(cursor, hash_conteudo):
+    linha = cursor.execute("SELECT id FROM importacoes WHERE hash_conteudo = ?", (hash_conteudo,)).fetchone()
+    return linha[0] if linha else None
+
+
+class ArmazenamentoSQLite(Armazenamento):
+
+    def _consultar(self, nome, sql, params=()):
+        cursor = self.conn.cursor()
+        cursor.row_factory = _dicionario
+        inicio = time.perf_counter()
+        try:
+            cursor.execute(sql, _numerados(params))
+            linhas = cursor.fetchall()
+        finally:
+            cursor.close()
+        # O rowcount de um SELECT no sqlite3 é sempre -1: contam-se as linhas lidas
+        metricas.registrar_tempo_consulta(nome, time.perf_counter() - inicio, len(linhas))
+        return linhas
+
+    def supermercados(self):
+        return self._consultar(CONSULTA_SUPERMERCADOS, CONSULTAS[CONSULTA_SUPERMERCADOS])
+
+    def filtros(self):
+        return {'supermercados': self.supermercados(),
+                'categorias': self._consultar(CONSULTA_CATEGORIAS, CONSULTAS[CONSULTA_CATEGORIAS])}
+
+    def ofertas(self, data, busca, supermercado, categoria, limite, apos=('', 0)):
+        params = parametros_ofertas(data, busca, supermercado, categoria) + [*apos, limite]
+        nome = consulta_ofertas(busca, supermercado, categoria, paginada=True)
+        return self._consultar(nome, CONSULTAS[nome], params)
+
+    def ofertas_em_fluxo(self, data, busca, supermercado, categoria):
+        cursor = self.conn.cursor()
+        cursor.row_factory = _dicionario
+        try:
+            yield from _ler_em_fluxo(CONSULTA_OFERTAS_FLUXO, cursor, sql_ofertas(busca, supermercado, categoria),
+                                    _numerados(parametros_ofertas(data, busca, supermercado, categoria)))
+        finally:
+            cursor.close()
+
+    def historico(self, id_produto, granularidade, inicio, fim):
+        if granularidade == 'dia':
+            return self._consultar(CONSULTA_HISTORICO_DIA, CONSULTAS[CONSULTA_HISTORICO_DIA], (id_produto, inicio, fim))
+        return self._consultar(CONSULTA_HISTORICO_RESUMIDO, CONSULTAS[CONSULTA_HISTORICO_RESUMIDO],
+                               (id_produto, granularidade, inicio, fim))
+
+    def produtos_em_oferta(self, data):
+        return self._consultar(CONSULTA_PRODUTOS_EM_OFERTA, PRODUTOS_EM_OFERTA_SQLITE, (data,))
+
+    def ofertas_produto(self, data, id_produto):
+        linhas = self._consultar(CONSULTA_TODAS_OFERTAS_PRODUTO, CONSULTAS[CONSULTA_TODAS_OFERTAS_PRODUTO],
+                                 (data, id_produto))
+        return json.loads(linhas[0]['ofertas']) if linhas else None
+
+    def ofertas_lista(self, data, ids):
+        linhas = self._consultar(CONSULTA_OFERTAS_LISTA, OFERTAS_LISTA_SQLITE, (data, json.dumps(ids)))
+        for linha in linhas:
+            linha['ofertas'] = json.loads(linha['ofertas'])
+        return linhas
+
+    def versoes(self, escopos):
+        return dict(self.conn.execute("SELECT escopo, versao FROM versoes_dados WHERE escopo IN (SELECT value FROM json_each(?))",
+                                      (json.dumps(list(escopos)),)).fetchall())
+
+    def todas_versoes(self):
+        return self.conn.execute("SELECT escopo, versao FROM versoes_dados").fetchall()
+
+    def produtos_desde(self, id_produto):
+        return self.conn.execute("SELECT id, nome FROM produtos WHERE id > ?", (id_produto,)).fetchall()
+
+    def ids_em_oferta(self, data):
+        return [linha[0] for linha in self.conn.execute("SELECT id_produto FROM melhores_ofertas_dia WHERE data = ?", (data,))]
+
+    def _carregar_staging(self, cursor, folha, resumo):
+        """Analisa a folha em lotes, como no COPY do PostgreSQL, e grava as ofertas em staging_ofertas."""
+        inicio = time.perf_counter()
+        for lote in analisar_em_lotes(folha.linhas(), resumo):
+            cursor.executemany(INSERIR_STAGING, zip(
+                lote.linhas, lote.datas, lote.supermercados, lote.categorias,
+                lote.produtos, lote.valores, lote.unidades, lote.observacoes))
+        metricas.registrar_etapa('analise', resumo.tempo_analise)
+        metricas.registrar_etapa('copy', time.perf_counter() - inicio - resumo.tempo_analise)
+
+    def criar_importacao(self, linhas, autoritativa=False):
+        """Importa a folha no próprio pedido; a importação devolvida já está concluída."""
+        inicio = time.perf_counter()
+        cursor = self.conn.cursor()
+        try:
+            with FolhaRecebida(linhas, autoritativa) as folha:
+                if not folha.total_linhas:
+                    return None, False
+                # Uma folha repetida é reconhecida pelo hash antes de ser analisada
+                existente = _importacao_existente(cursor, folha.hash)
+                if existente is not None:
+                    return existente, False
+
+                resumo = ResumoImportacao()
+                for comando in CRIAR_STAGING:
+                    cursor.execute(comando)
+                self._carregar_staging(cursor, folha, resumo)
+
+            # Um só escritor de cada vez: o lock é pedido logo, não na primeira escrita
+            cursor.execute("BEGIN IMMEDIATE")
+            existente = _importacao_existente(cursor, folha.hash)
+            if existente is not None:
+                cursor.execute("ROLLBACK")
+                return existente, False
+
+            with metricas.medir_etapa('resolucao'):
+                cursor.execute(INSERIR_SUPERMERCADOS)
+                cursor.execute(INSERIR_CATEGORIAS)
+                cursor.execute(INSERIR_PRODUTOS)
+                cursor.execute(RESOLVER_OFERTAS_SQLITE)
+            with metricas.medir_etapa('upsert'):
+                cursor.execute(COMPARAR_OFERTAS_SQLITE)
+                resumo.inseridos, resumo.atualizados, resumo.inalterados = cursor.execute(CONTAR_OFERTAS_SQLITE).fetchone()
+                cursor.execute(ANOTAR_PENDENTES_SQLITE)
+                cursor.execute(UPSERT_PRECOS_SQLITE)
+            retiradas = []
+            if autoritativa:
+                with metricas.medir_etapa('retirada'):
+                    retiradas = cursor.execute(RETIRAR_AUSENTES_SQLITE).fetchall()
+                    cursor.executemany("INSERT INTO historico_pendente (id_produto, data) VALUES (?, ?) ON CONFLICT DO NOTHING",
+                                       retiradas)
+            with metricas.medir_etapa('resumos'):
+                datas = atualizar_resumos_sqlite(cursor)
+            cache.registrar_alteracoes_sqlite(cursor, datas)
+
+            resultado = {'ofertas': resumo.ofertas, 'inseridos': resumo.inseridos, 'atualizados': resumo.atualizados,
+                         'inalterados': resumo.inalterados, 'rejeitados': resumo.rejeitados, 'retirados': len(retiradas)}
+            cursor.execute("""
+                INSERT INTO importacoes (hash_conteudo, etapa, autoritativa, total_linhas, linhas_processadas,
+                                         total_blocos, blocos_processados, resultado, erros)
+                VALUES (?, ?, ?, ?, ?, 1, 1, ?, ?)
+            """, (folha.hash, tarefas_importacao.CONCLUIDA, autoritativa, folha.total_linhas, resumo.linhas,
+                  json.dumps(resultado), json.dumps(resumo.rejeicoes.amostra[:tarefas_importacao.MAX_ERROS_DETALHADOS])))
+            id_importacao = cursor.lastrowid
+            cursor.execute("COMMIT")
+        except Exception:
+            self.desfazer()
+            raise
+        finally:
+            cursor.close()
+        cache.versoes.expirar()
+
+        metricas.contar_linhas_importacao(inseridas=resumo.inseridos, atualizadas=resumo.atualizados,
+                                          inalteradas=resumo.inalterados, rejeitadas=resumo.rejeitados,
+                                          retiradas=len(retiradas))
+        duracao = time.perf_counter() - inicio
+        logger.info("Importação %s concluída: %d linhas em %.1f s (%.0f linhas/s), %s",
+                    id_importacao, folha.total_linhas, duracao, folha.total_linhas / duracao if duracao else 0, resultado)
+        return id_importacao, True
+
+    def obter_importacao(self, id_importacao):
+        cursor = self.conn.cursor()
+        cursor.row_factory = _dicionario
+        cursor.execute("""
+            SELECT id, etapa, autoritativa, total_linhas, linhas_processadas, total_blocos, blocos_processados,
+                   resultado, erros, criada_em, atualizada_em
+            FROM importacoes WHERE id = ?
+        """, (id_importacao,))
+        tarefa = cursor.fetchone()
+        cursor.close()
+        if tarefa is not None:
+            tarefa['resultado'] = json.loads(tarefa['resultado']) if tarefa['resultado'] else None
+            tarefa['erros'] = json.loads(tarefa['erros'])
+        return tarefa
+
+    def desfazer(self):
+        if self.conn.in_transaction:
+            self.conn.rollback()
+
+
+def init_app(app):
+    """Cria no ficheiro SQLITE_CAMINHO as tabelas e os índices que faltarem."""
+    database.criar_esquema(conexao_sqlite())
@@ -0,0 +1,274 @@
+"""Arquivo das partições antigas de `precos_historicos` em ficheiros CSV comprimidos.
+
+`precos_historicos` está particionada por mês de validade (migração 9). As
+partições com mais de ARQUIVO_RETENCAO_MESES meses são exportadas para
+`precos_historicos_AAAA_MM-<carimbo>.csv.gz` em ARQUIVO_PRECOS_DIR e depois
+desligadas (DETACH) e apagadas da base.
+
+A exportação segue uma ordem que sobrevive a uma interrupção: o ficheiro é
+escrito como `.tmp`, a partição é desligada e apagada na mesma transação
+que a bloqueou para escrita, e só depois do commit o `.tmp` ganha o nome
+final. Um `.tmp` que sobre de uma execução anterior é concluído se a
+partição já não existir, ou apagado se ainda existir.
+
+O histórico diário de um produto continua a ver estes meses: `leitor` lê os
+ficheiros sob pedido, só até às linhas do produto (estão ordenados por
+produto), e guarda em memória o histórico dos produtos lidos há menos tempo. O histórico por
+semana ou mês vem de `historico_resumido`, que não é arquivada. Reimportar
+ofertas de um mês já arquivado recria a partição desse mês: o histórico
+diário junta as duas fontes, mas os agregados dos períodos tocados passam a
+refletir só o que está na base.
+
+Uso (por exemplo num cron diário):
+    python arquivo_precos.py [--meses 24] [--diretorio caminho]
+"""
+import argparse
+import csv
+import gzip
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+
+import psycopg2
+from psycopg2 import sql
+
+ARQUIVO_PRECOS_DIR = os.environ.get('ARQUIVO_PRECOS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'arquivo_precos'))
+ARQUIVO_RETENCAO_MESES = int(os.environ.get('ARQUIVO_RETENCAO_MESES', '24'))
+# Quantos pares (ficheiro mensal, produto) o leitor mantém em memória
+ARQUIVO_CACHE_PRODUTOS = int(os.environ.get('ARQUIVO_CACHE_PRODUTOS', '1000'))
+
+COLUNAS = ('id', 'id_produto', 'id_supermercado', 'valor', 'unidade', 'data_validade', 'observacoes', 'data_registro')
+
+RE_PARTICAO = re.compile(r'^precos_historicos_(\d{4})_(\d{2})$')
+RE_FICHEIRO = re.compile(r'^precos_historicos_(\d{4})_(\d{2})-(\w+)\.csv\.gz$')
+
+LISTAR_PARTICOES = """
+    SELECT c.relname
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'precos_historicos'::regclass
+"""
+
+
+def _mes(ano, mes):
+    return date(int(ano), int(mes), 1)
+
+
+def _somar_meses(mes, quantos):
+    total = mes.year * 12 + mes.month - 1 + quantos
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def _particao(mes):
+    return f"precos_historicos_{mes:%Y_%m}"
+
+
+def _fsync(caminho):
+    with open(caminho, 'rb') as ficheiro:
+        os.fsync(ficheiro.fileno())
+
+
+def concluir_pendentes(conn, diretorio=ARQUIVO_PRECOS_DIR):
+    """Resolve os `.tmp` deixados por uma exportação interrompida."""
+    if not os.path.isdir(diretorio):
+        return
+    cursor = conn.cursor()
+    try:
+        for nome in os.listdir(diretorio):
+            if not nome.endswith('.tmp'):
+                continue
+            correspondencia = RE_FICHEIRO.match(nome[:-len('.tmp')])
+            if correspondencia is None:
+                continue
+            cursor.execute("SELECT to_regclass(%s)", (_particao(_mes(*correspondencia.groups()[:2])),))
+            caminho = os.path.join(diretorio, nome)
+            if cursor.fetchone()[0] is None:
+                # O commit que apagou a partição chegou a acontecer: o ficheiro é o arquivo dela
+                os.replace(caminho, caminho[:-len('.tmp')])
+            else:
+                os.remove(caminho)
+        conn.rollback()
+    finally:
+        cursor.close()
+
+
+def arquivar_particao(conn, mes, diretorio=ARQUIVO_PRECOS_DIR):
+    """Exporta a partição do mês para um CSV.gz e retira-a da base. Retorna (linhas, caminho)."""
+    os.makedirs(diretorio, exist_ok=True)
+    particao = sql.Identifier(_particao(mes))
+    carimbo = datetime.now().strftime('%Y%m%dT%H%M%S')
+    caminho = os.path.join(diretorio, f"{_particao(mes)}-{carimbo}.csv.gz")
+    temporario = caminho + '.tmp'
+
+    cursor = conn.cursor()
+    try:
+        # O DETACH precisa de ACCESS EXCLUSIVE na tabela-mãe e na partição: os dois locks são
+        # pedidos logo, pela ordem em que uma importação os toma, para não haver um reforço de
+        # lock a meio (e um deadlock com uma importação à espera da partição). Até ao commit,
+        # nada lê nem escreve em precos_historicos.
+        cursor.execute(sql.SQL("LOCK TABLE ONLY precos_historicos, ONLY {} IN ACCESS EXCLUSIVE MODE").format(particao))
+        copia = sql.SQL("COPY (SELECT {} FROM {} ORDER BY id_produto, data_validade) TO STDOUT WITH (FORMAT csv, HEADER)").format(
+            sql.SQL(', ').join(map(sql.Identifier, COLUNAS)), particao)
+        with gzip.open(temporario, 'wt', encoding='utf-8', newline='') as ficheiro:
+            cursor.copy_expert(copia.as_string(conn), ficheiro)
+        linhas = cursor.rowcount
+        _fsync(temporario)
+
+        cursor.execute(sql.SQL("ALTER TABLE precos_historicos DETACH PARTITION {}").format(particao))
+        cursor.execute(sql.SQL("DROP TABLE {}").format(particao))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    finally:
+        cursor.close()
+
+    os.replace(temporario, caminho)
+    return linhas, caminho
+
+
+def arquivar(conn, meses=ARQUIVO_RETENCAO_MESES, diretorio=ARQUIVO_PRECOS_DIR, hoje=None):
+    """Arquiva as partições com validade anterior a `meses` meses antes do mês atual.
+
+    Retorna uma lista de (partição, linhas, caminho do ficheiro).
+    """
+    concluir_pendentes(conn, diretorio)
+    limite = _somar_meses((hoje or date.today()).replace(day=1), -meses)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(LISTAR_PARTICOES)
+        antigas = []
+        for (nome,) in cursor.fetchall():
+            correspondencia = RE_PARTICAO.match(nome)
+            if correspondencia and _mes(*correspondencia.groups()) < limite:
+                antigas.append(_mes(*correspondencia.groups()))
+        antigas.sort()
+        conn.rollback()
+    finally:
+        cursor.close()
+
+    arquivadas = []
+    for mes in antigas:
+        linhas, caminho = arquivar_particao(conn, mes, diretorio)
+        arquivadas.append((_particao(mes), linhas, caminho))
+    return arquivadas
+
+
+class LeitorArquivo:
+    """Leitura sob pedido dos meses arquivados, com o histórico dos últimos produtos lidos em memória.
+
+    Os ficheiros estão ordenados por produto: a leitura percorre o ficheiro
+    comprimido só até passar do produto pedido e guarda apenas as linhas
+    dele, por isso a memória não depende do tamanho dos meses arquivados.
+    """
+
+    def __init__(self, diretorio=ARQUIVO_PRECOS_DIR, max_produtos=ARQUIVO_CACHE_PRODUTOS):
+        self.diretorio = diretorio
+        self.max_produtos = max_produtos
+        self._lista = []
+        self._lista_mtime = None
+        self._carregados = OrderedDict()  # (caminho, id_produto) -> [(data, id_supermercado, valor)]
+        self._lock = threading.Lock()
+
+    def _ficheiros(self):
+        """[(mês, caminho)] por ordem de nome: para o mesmo mês, o arquivo mais recente vem depois."""
+        try:
+            mtime = os.stat(self.diretorio).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        if mtime != self._lista_mtime:
+            lista = []
+            for nome in sorted(os.listdir(self.diretorio)):
+                correspondencia = RE_FICHEIRO.match(nome)
+                if correspondencia:
+                    lista.append((_mes(*correspondencia.groups()[:2]), os.path.join(self.diretorio, nome)))
+            self._lista, self._lista_mtime = lista, mtime
+        return self._lista
+
+    @staticmethod
+    def _ler_produto(caminho, id_produto):
+        precos = []
+        with gzip.open(caminho, 'rt', encoding='utf-8', newline='') as ficheiro:
+            leitor = csv.reader(ficheiro)
+            colunas = next(leitor, None)
+            if colunas is None:
+                return precos
+            i_produto, i_supermercado = colunas.index('id_produto'), colunas.index('id_supermercado')
+            i_data, i_valor = colunas.index('data_validade'), colunas.index('valor')
+            for linha in leitor:
+                if not linha[i_produto]:
+                    # Os NULL vêm no fim da ordenação
+                    break
+                produto = int(linha[i_produto])
+                if produto < id_produto:
+                    continue
+                if produto > id_produto:
+                    break
+                if linha[i_data] and linha[i_supermercado]:
+                    precos.append((date.fromisoformat(linha[i_data]), int(linha[i_supermercado]), float(linha[i_valor])))
+        return precos
+
+    def _carregar(self, caminho, id_produto):
+        chave = (caminho, id_produto)
+        with self._lock:
+            precos = self._carregados.get(chave)
+            if precos is not None:
+                self._carregados.move_to_end(chave)
+                return precos
+        precos = self._ler_produto(caminho, id_produto)
+        with self._lock:
+            self._carregados[chave] = precos
+            while len(self._carregados) > self.max_produtos:
+                self._carregados.popitem(last=False)
+        return precos
+
+    def tem_meses(self, inicio, fim):
+        """Indica se há algum mês arquivado entre `inicio` e `fim`."""
+        primeiro = inicio.replace(day=1)
+        return any(primeiro <= mes <= fim for mes, _ in self._ficheiros())
+
+    def historico(self, id_produto, inicio, fim):
+        """Retorna {(data de validade, id do supermercado): valor} arquivados para o produto no intervalo."""
+        primeiro = inicio.replace(day=1)
+        precos = {}
+        for mes, caminho in self._ficheiros():
+            if primeiro <= mes <= fim:
+                for data, id_supermercado, valor in self._carregar(caminho, id_produto):
+                    if inicio <= data <= fim:
+                        precos[(data, id_supermercado)] = valor
+        return precos
+
+
+leitor = LeitorArquivo()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Arquiva em CSV.gz as partições antigas de precos_historicos.')
+    parser.add_argument('--meses', type=int, default=ARQUIVO_RETENCAO_MESES,
+                        help='meses de validade mantidos na base, além do atual')
+    parser.add_argument('--diretorio', default=ARQUIVO_PRECOS_DIR, help='onde gravar os ficheiros')
+    args = parser.parse_args()
+
+    database_url = os.environ.get('DATABASE_URL_EXT') or os.environ.get('DATABASE_URL')
+    if not database_url:
+        print("Erro: A variável de ambiente DATABASE_URL_EXT (ou DATABASE_URL) não foi definida.")
+        sys.exit(2)
+
+    conn = psycopg2.connect(database_url)
+    try:
+        arquivadas = arquivar(conn, args.meses, args.diretorio)
+        for particao, linhas, caminho in arquivadas:
+            print(f"{particao}: {linhas} linhas em {caminho}")
+        if not arquivadas:
+            print("Nenhuma partição para arquivar.")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
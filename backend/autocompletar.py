@@ -0,0 +1,135 @@
+"""Índice em memória para o autocompletar de produtos por prefixo.
+
+Os nomes dos produtos ficam normalizados (minúsculas, sem acentos) em listas
+ordenadas; um prefixo corresponde a um intervalo contíguo, encontrado por
+busca binária (`bisect`). Há duas listas: todos os produtos e só os que
+estão em oferta hoje, para que estes venham primeiro sem percorrer todos os
+resultados de um prefixo curto.
+
+O índice acompanha as versões de `versoes_dados` (ver cache.py): quando o
+catálogo muda, só os produtos com id acima do maior já indexado (menos
+uma pequena margem) são lidos e intercalados; quando muda o dia de hoje (ou a data vira), é relida a lista
+de produtos em oferta. Uma consulta normal não toca na base.
+"""
+import heapq
+import threading
+import unicodedata
+from bisect import bisect_left
+from datetime import date
+
+import armazenamento
+import cache
+
+# Fim de intervalo para a busca por prefixo: maior do que qualquer caractere de um nome
+_FIM = '\U0010ffff'
+# Ids abaixo do maior já indexado que voltam a ser lidos: duas importações em paralelo
+# podem confirmar produtos fora da ordem dos ids
+JANELA_IDS = 1000
+
+
+def normalizar(texto):
+    """Minúsculas e sem acentos, como `f_unaccent(lower(...))` na base."""
+    decomposto = unicodedata.normalize('NFD', texto.lower())
+    return ''.join(c for c in decomposto if not unicodedata.combining(c))
+
+
+class _Estado:
+    """Fotografia imutável do índice; é trocada inteira a cada atualização."""
+
+    def __init__(self, todos, em_oferta, ids_em_oferta, nomes, versoes, dia):
+        self.todos = todos              # [(nome normalizado, id)], ordenada
+        self.em_oferta = em_oferta      # idem, só produtos em oferta no `dia`
+        self.ids_em_oferta = ids_em_oferta
+        self.nomes = nomes              # id -> nome original
+        self.maior_id = max(nomes, default=0)
+        self.versoes = versoes          # versões de (catálogo, dia) com que foi construída
+        self.dia = dia
+
+
+def _intervalo(lista, prefixo):
+    return bisect_left(lista, (prefixo,)), bisect_left(lista, (prefixo + _FIM,))
+
+
+class IndiceProdutos:
+    def __init__(self):
+        self._estado = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _escopos(dia):
+        return [cache.CATALOGO, cache.escopo_dia(dia)]
+
+    def atualizar(self, banco, dia=None):
+        """Lê do armazenamento `banco` o que mudou desde a última atualização e troca o estado."""
+        dia = dia or date.today()
+        escopos = self._escopos(dia)
+        with self._lock:
+            anterior = self._estado
+            # As versões são lidas antes dos dados: no pior caso o índice fica mais novo do que elas
+            lidas = banco.versoes(escopos)
+            versoes = [lidas.get(escopo, 0) for escopo in escopos]
+            if anterior is not None and anterior.versoes == versoes and anterior.dia == dia:
+                return
+
+            maior_id = anterior.maior_id if anterior else 0
+            novos = [(id_produto, nome) for id_produto, nome in banco.produtos_desde(maior_id - JANELA_IDS)
+                     if anterior is None or id_produto not in anterior.nomes]
+            if anterior is not None and anterior.dia == dia and anterior.versoes[1] == versoes[1]:
+                ids_em_oferta = anterior.ids_em_oferta
+            else:
+                ids_em_oferta = frozenset(banco.ids_em_oferta(dia))
+
+            nomes = dict(anterior.nomes) if anterior else {}
+            nomes.update(novos)
+            entradas_novas = sorted((normalizar(nome), id_produto) for id_produto, nome in novos)
+            if anterior is None:
+                todos = entradas_novas
+            else:
+                todos = list(heapq.merge(anterior.todos, entradas_novas))
+            if anterior is not None and ids_em_oferta is anterior.ids_em_oferta:
+                em_oferta = list(heapq.merge(anterior.em_oferta, [e for e in entradas_novas if e[1] in ids_em_oferta]))
+            else:
+                em_oferta = [e for e in todos if e[1] in ids_em_oferta]
+            self._estado = _Estado(todos, em_oferta, ids_em_oferta, nomes, versoes, dia)
+
+    def _sincronizar(self):
+        """Atualiza o índice se as versões conhecidas deste processo mudaram (ou se a data virou)."""
+        dia = date.today()
+        estado = self._estado
+        # Só a igualdade diz que o índice está em dia: as transações podem confirmar fora da
+        # ordem da sequência, e a versão gravada de um escopo pode então ser menor do que a anterior
+        if estado is not None and estado.dia == dia and estado.versoes == cache.versoes.obter(self._escopos(dia)):
+            return estado
+        self.atualizar(armazenamento.do_pedido(), dia)
+        return self._estado
+
+    def buscar(self, texto, limite=10):
+        """Até `limite` produtos cujo nome começa por `texto`: primeiro os em oferta hoje, depois por nome."""
+        prefixo = normalizar(texto.strip())
+        if not prefixo or limite <= 0:
+            return []
+        estado = self._sincronizar()
+
+        resultado = []
+        inicio, fim = _intervalo(estado.em_oferta, prefixo)
+        for _, id_produto in estado.em_oferta[inicio:min(fim, inicio + limite)]:
+            resultado.append({'id': id_produto, 'nome': estado.nomes[id_produto], 'em_oferta': True})
+        if len(resultado) < limite:
+            inicio, fim = _intervalo(estado.todos, prefixo)
+            for posicao in range(inicio, fim):
+                id_produto = estado.todos[posicao][1]
+                if id_produto in estado.ids_em_oferta:
+                    continue
+                resultado.append({'id': id_produto, 'nome': estado.nomes[id_produto], 'em_oferta': False})
+                if len(resultado) >= limite:
+                    break
+        return resultado
+
+    def estatisticas(self):
+        estado = self._estado
+        if estado is None:
+            return {'produtos': 0, 'em_oferta': 0, 'dia': None}
+        return {'produtos': len(estado.todos), 'em_oferta': len(estado.em_oferta), 'dia': estado.dia.isoformat()}
+
+
+indice = IndiceProdutos()
@@ -0,0 +1,252 @@
+"""Teste de carga da API com dados sintéticos, para comparar os armazenamentos.
+
+Para cada armazenamento: importa uma folha sintética por mês (ver
+dados_sinteticos.py) por `/api/importar` e mede as linhas/s até a
+importação ficar concluída; depois envia pedidos a `/api/ofertas`,
+`/api/produtos-em-oferta` e ao histórico de produtos com cada nível de
+concorrência e mostra as latências p50/p95/p99 e os pedidos/s.
+
+Uso:
+    python benchmark_api.py                                    # SQLite num ficheiro temporário
+    python benchmark_api.py --armazenamentos sqlite postgres   # compara os dois
+    python benchmark_api.py --meses 6 --produtos 5000 --concorrencia 1 8 32 --pedidos 500
+    python benchmark_api.py --url http://localhost:8000 --rotulo gunicorn
+
+Sem `--url`, a aplicação corre no próprio processo com o cliente de testes
+do Flask (um cliente por thread) e cada armazenamento é medido num processo
+à parte, porque o armazenamento é escolhido pelas variáveis de ambiente ao
+importar os módulos. O PostgreSQL usa DATABASE_URL e grava lá as ofertas
+sintéticas: use uma base de testes. A cache de respostas fica desligada
+(CACHE_ATIVO=0) para medir o armazenamento; `--cache` liga-a.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import dados_sinteticos
+
+ENDPOINTS = ('ofertas', 'produtos-em-oferta', 'historico')
+GRANULARIDADES = ('dia', 'semana', 'mes')
+
+
+class ClienteLocal:
+    """Pedidos à aplicação no próprio processo, com um cliente de testes do Flask por thread."""
+
+    def __init__(self, app):
+        self._app = app
+        self._local = threading.local()
+
+    def pedir(self, metodo, caminho, corpo=None):
+        cliente = getattr(self._local, 'cliente', None)
+        if cliente is None:
+            cliente = self._local.cliente = self._app.test_client()
+        resposta = cliente.open(caminho, method=metodo, data=corpo, content_type='text/plain; charset=utf-8')
+        return resposta.status_code, resposta.get_json(silent=True)
+
+
+class ClienteHttp:
+    """Pedidos a um servidor já em execução."""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def pedir(self, metodo, caminho, corpo=None):
+        pedido = urllib.request.Request(self.url + caminho, data=corpo, method=metodo,
+                                        headers={'Content-Type': 'text/plain; charset=utf-8'})
+        try:
+            with urllib.request.urlopen(pedido, timeout=120) as resposta:
+                estado, conteudo = resposta.status, resposta.read()
+        except urllib.error.HTTPError as e:
+            estado, conteudo = e.code, e.read()
+        try:
+            return estado, json.loads(conteudo)
+        except ValueError:
+            return estado, None
+
+
+def percentil(ordenados, fracao):
+    """Percentil pelo método do posto mais próximo, sobre uma lista já ordenada."""
+    return ordenados[min(len(ordenados) - 1, max(0, int(round(fracao * len(ordenados))) - 1))]
+
+
+def importar(cliente, folhas):
+    """Importa as folhas uma a uma e espera que cada uma fique concluída. Retorna o resumo."""
+    linhas = 0
+    inicio = time.perf_counter()
+    for mes, folha in folhas:
+        estado, corpo = cliente.pedir('POST', '/api/importar', '\n'.join(folha).encode('utf-8'))
+        if estado != 202:
+            raise RuntimeError(f"Importação de {mes:%m/%Y} falhou ({estado}): {corpo}")
+        if not corpo['nova']:
+            print(f"Aviso: a folha de {mes:%m/%Y} já tinha sido importada; as linhas/s não a contam.", file=sys.stderr)
+            continue
+        while True:
+            estado, tarefa = cliente.pedir('GET', f"/api/importar/{corpo['job_id']}")
+            if tarefa['etapa'] == 'concluida':
+                break
+            if tarefa['etapa'] == 'erro':
+                raise RuntimeError(f"Importação de {mes:%m/%Y} falhou: {tarefa['erros']}")
+            time.sleep(0.02)
+        linhas += len(folha)
+    duracao = time.perf_counter() - inicio
+    return {'linhas': linhas, 'segundos': duracao, 'linhas_s': linhas / duracao if duracao else 0}
+
+
+def preparar_pedidos(cliente, folhas, catalogo, pedidos, rnd):
+    """Monta os caminhos a pedir a cada endpoint, com dias e produtos sorteados nos meses importados."""
+    primeiro = folhas[0][0]
+    ultimo = (folhas[-1][0] + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+    dias = [primeiro + timedelta(days=i) for i in range((ultimo - primeiro).days + 1)]
+    ids = set()
+    for dia in rnd.sample(dias, min(5, len(dias))):
+        estado, produtos = cliente.pedir('GET', f'/api/produtos-em-oferta?data={dia}')
+        if estado != 200:
+            raise RuntimeError(f"/api/produtos-em-oferta respondeu {estado}")
+        ids.update(produto['id'] for produto in produtos)
+    if not ids:
+        raise RuntimeError("Nenhum produto em oferta depois da importação.")
+    ids = sorted(ids)
+    termos = sorted({produto.nome.split()[0][:4] for produto in catalogo.produtos})
+
+    caminhos = {endpoint: [] for endpoint in ENDPOINTS}
+    for _ in range(pedidos):
+        caminho = f'/api/ofertas?data={rnd.choice(dias)}&limit=100'
+        if rnd.random() < 0.25:
+            caminho += f'&busca={urllib.request.quote(rnd.choice(termos))}'
+        caminhos['ofertas'].append(caminho)
+        caminhos['produtos-em-oferta'].append(f'/api/produtos-em-oferta?data={rnd.choice(dias)}')
+        caminhos['historico'].append(f'/api/produto/{rnd.choice(ids)}/historico?inicio={primeiro}&fim={ultimo}'
+                                     f'&granularidade={rnd.choice(GRANULARIDADES)}')
+    return caminhos
+
+
+def medir_endpoint(cliente, caminhos, concorrencia):
+    """Envia os pedidos com `concorrencia` threads; retorna latências em ms, pedidos/s e erros."""
+    def pedir(caminho):
+        inicio = time.perf_counter()
+        estado, _ = cliente.pedir('GET', caminho)
+        return time.perf_counter() - inicio, estado
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        resultados = list(executor.map(pedir, caminhos))
+    duracao = time.perf_counter() - inicio
+    tempos = sorted(tempo * 1000 for tempo, _ in resultados)
+    return {
+        'p50': percentil(tempos, 0.50),
+        'p95': percentil(tempos, 0.95),
+        'p99': percentil(tempos, 0.99),
+        'pedidos_s': len(caminhos) / duracao,
+        'erros': sum(1 for _, estado in resultados if estado != 200),
+    }
+
+
+def executar(args, cliente):
+    catalogo = dados_sinteticos.gerar_catalogo(args.supermercados, args.produtos, args.seed)
+    folhas = dados_sinteticos.gerar_folhas(catalogo, args.meses, args.inicio, args.cobertura, args.seed)
+    resultado = {'importacao': importar(cliente, folhas), 'leituras': []}
+    caminhos = preparar_pedidos(cliente, folhas, catalogo, args.pedidos, random.Random(args.seed))
+    for concorrencia in args.concorrencia:
+        for endpoint in ENDPOINTS:
+            medida = medir_endpoint(cliente, caminhos[endpoint], concorrencia)
+            resultado['leituras'].append(dict(medida, endpoint=endpoint, concorrencia=concorrencia))
+    return resultado
+
+
+def executar_local(args, nome):
+    """Mede um armazenamento com a aplicação neste processo."""
+    diretorio = None
+    os.environ['ARMAZENAMENTO'] = nome
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    if not args.cache:
+        os.environ['CACHE_ATIVO'] = '0'
+    if nome == 'sqlite':
+        if args.sqlite_caminho:
+            os.environ['SQLITE_CAMINHO'] = args.sqlite_caminho
+        else:
+            diretorio = tempfile.mkdtemp(prefix='benchmark_api_')
+            os.environ['SQLITE_CAMINHO'] = os.path.join(diretorio, 'supermercado.db')
+    elif not os.environ.get('DATABASE_URL'):
+        print("Erro: A variável de ambiente DATABASE_URL não foi definida.")
+        sys.exit(2)
+    try:
+        import app  # só depois das variáveis de ambiente: o armazenamento é escolhido ao importar
+        return executar(args, ClienteLocal(app.app))
+    finally:
+        if diretorio:
+            shutil.rmtree(diretorio, ignore_errors=True)
+
+
+def executar_processo(args, nome):
+    """Mede um armazenamento num processo filho e lê o resultado em JSON."""
+    argumentos = [sys.executable, os.path.abspath(__file__), '--json', '--armazenamentos', nome]
+    for opcao in ('meses', 'supermercados', 'produtos', 'cobertura', 'pedidos', 'seed', 'sqlite_caminho', 'inicio'):
+        valor = getattr(args, opcao)
+        if valor is not None:
+            argumentos += [f"--{opcao.replace('_', '-')}", str(valor)]
+    argumentos += ['--concorrencia'] + [str(c) for c in args.concorrencia]
+    if args.cache:
+        argumentos.append('--cache')
+    processo = subprocess.run(argumentos, stdout=subprocess.PIPE, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if processo.returncode != 0:
+        raise RuntimeError(f"O benchmark de {nome} terminou com o código {processo.returncode}.")
+    return json.loads(processo.stdout)[nome]
+
+
+def imprimir(resultados):
+    print(f"{'armazenamento':<14} {'linhas':>9} {'segundos':>9} {'linhas/s':>10}")
+    for nome, resultado in resultados.items():
+        importacao = resultado['importacao']
+        print(f"{nome:<14} {importacao['linhas']:>9} {importacao['segundos']:>9.2f} {importacao['linhas_s']:>10,.0f}")
+    print()
+    print(f"{'armazenamento':<14} {'endpoint':<19} {'conc.':>5} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'pedidos/s':>10} {'erros':>6}")
+    for nome, resultado in resultados.items():
+        for leitura in resultado['leituras']:
+            print(f"{nome:<14} {leitura['endpoint']:<19} {leitura['concorrencia']:>5} {leitura['p50']:>9.1f} {leitura['p95']:>9.1f} "
+                  f"{leitura['p99']:>9.1f} {leitura['pedidos_s']:>10,.0f} {leitura['erros']:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de carga da API por armazenamento.')
+    parser.add_argument('--armazenamentos', nargs='+', choices=('sqlite', 'postgres'), default=['sqlite'])
+    parser.add_argument('--concorrencia', type=int, nargs='+', default=[1, 8], help='threads a enviar pedidos em simultâneo')
+    parser.add_argument('--pedidos', type=int, default=200, help='pedidos por endpoint e nível de concorrência')
+    parser.add_argument('--meses', type=int, default=3)
+    parser.add_argument('--inicio', type=date.fromisoformat, help='primeiro mês das folhas (AAAA-MM-DD); por omissão, o atual')
+    parser.add_argument('--supermercados', type=int, default=8)
+    parser.add_argument('--produtos', type=int, default=2000)
+    parser.add_argument('--cobertura', type=float, default=0.15, help='fração do catálogo em oferta por supermercado e semana')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--cache', action='store_true', help='mantém a cache de respostas ligada')
+    parser.add_argument('--sqlite-caminho', help='ficheiro SQLite a usar; por omissão, um temporário apagado no fim')
+    parser.add_argument('--url', help='mede um servidor já em execução em vez da aplicação no processo')
+    parser.add_argument('--rotulo', default='servidor', help='nome do resultado com --url')
+    parser.add_argument('--json', action='store_true', help='escreve o resultado em JSON')
+    args = parser.parse_args()
+
+    if args.url:
+        resultados = {args.rotulo: executar(args, ClienteHttp(args.url))}
+    elif len(args.armazenamentos) == 1:
+        resultados = {args.armazenamentos[0]: executar_local(args, args.armazenamentos[0])}
+    else:
+        resultados = {nome: executar_processo(args, nome) for nome in args.armazenamentos}
+
+    if args.json:
+        json.dump(resultados, sys.stdout)
+    else:
+        imprimir(resultados)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Benchmark do parser de ofertas sobre folhas sintéticas.
+
+Uso:
+    python benchmark_parser.py                    # 100 mil e 1 milhão de linhas
+    python benchmark_parser.py --linhas 250000 --repeticoes 5
+    python benchmark_parser.py --minimo 200000    # falha se ficar abaixo de 200 mil linhas/s
+
+Cada tamanho é gerado uma vez e analisado várias vezes com `analisar_lote`;
+as caches do parser são limpas antes de cada repetição para medir também
+o custo do primeiro contacto com cada validade, preço e produto.
+
+Uma versão curta corre com os testes (pytest-benchmark):
+    python -m pytest tests/test_parser_ofertas.py --benchmark-only
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+
+import parser_ofertas
+
+SUPERMERCADOS = ['Super Econômico', 'Atacadão Central', 'Mercado do Bairro', 'Hiper Bom Preço', 'Comper', 'Fort Atacadista', 'Assaí']
+CATEGORIAS = ['Mercearia', 'Açougue', 'Hortifruti', 'Bebidas', 'Limpeza', 'Higiene', 'Frios e Laticínios', 'Padaria']
+UNIDADES = ['un', 'kg', 'pct', 'cx', 'L', '500g']
+
+
+def gerar_folha(total, produtos=5000, seed=42):
+    """Gera `total` linhas no formato do painel, com cerca de 1% de linhas inválidas."""
+    rnd = random.Random(seed)
+    linhas = []
+    for _ in range(total):
+        sorteio = rnd.random()
+        if sorteio < 0.005:
+            linhas.append('linha colada sem colunas')
+            continue
+        mes = rnd.randint(1, 12)
+        if sorteio < 0.01:
+            validade = f'31/{mes:02d}/2025x'
+        elif sorteio < 0.6:
+            inicio = rnd.randint(1, 20)
+            validade = f'{inicio}-{inicio + rnd.randint(1, 8)}/{mes:02d}/2025'
+        else:
+            validade = f'{rnd.randint(1, 28):02d}/{mes:02d}/2025'
+        produto = f'Produto {rnd.randrange(produtos)}'
+        if rnd.random() < 0.3:
+            produto += f' ({rnd.choice(["leve 3 pague 2", "cartão fidelidade", "unidade"])})'
+        valor = f'R$ {rnd.randint(1, 99)},{rnd.randint(0, 99):02d} {rnd.choice(UNIDADES)}'
+        linhas.append('\t'.join([validade, rnd.choice(SUPERMERCADOS), produto, valor, rnd.choice(CATEGORIAS)]))
+    return linhas
+
+
+def limpar_caches():
+    parser_ofertas.expandir_validade.cache_clear()
+    parser_ofertas.analisar_valor.cache_clear()
+    parser_ofertas.analisar_produto.cache_clear()
+
+
+def medir(linhas, repeticoes):
+    """Retorna os tempos de cada repetição e o último lote analisado."""
+    tempos = []
+    lote = None
+    for _ in range(repeticoes):
+        limpar_caches()
+        inicio = time.perf_counter()
+        lote = parser_ofertas.analisar_lote(linhas)
+        tempos.append(time.perf_counter() - inicio)
+    return tempos, lote
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do parser de ofertas.')
+    parser.add_argument('--linhas', type=int, nargs='+', default=[100_000, 1_000_000], help='tamanhos das folhas sintéticas')
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--minimo', type=float, default=0, help='linhas/s mínimas (mediana); abaixo disso o script sai com erro')
+    args = parser.parse_args()
+
+    print(f"{'linhas':>10} {'ofertas':>11} {'rejeitadas':>10} {'melhor (s)':>11} {'mediana (s)':>11} {'linhas/s':>12} {'ofertas/s':>12}")
+    abaixo_do_minimo = False
+    for total in args.linhas:
+        linhas = gerar_folha(total, seed=args.seed)
+        tempos, lote = medir(linhas, args.repeticoes)
+        mediana = statistics.median(tempos)
+        linhas_s = total / mediana
+        print(f"{total:>10} {len(lote):>11} {lote.rejeicoes.total:>10} {min(tempos):>11.3f} {mediana:>11.3f} {linhas_s:>12,.0f} {len(lote) / mediana:>12,.0f}")
+        if args.minimo and linhas_s < args.minimo:
+            abaixo_do_minimo = True
+
+    if abaixo_do_minimo:
+        print(f"Regressão: parser abaixo de {args.minimo:,.0f} linhas/s.")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
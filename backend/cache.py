@@ -0,0 +1,259 @@
+"""Cache das respostas dos endpoints de leitura, invalidado pelas importações.
+
+Os dados só mudam quando uma importação é processada. Cada importação
+incrementa, na mesma transação em que grava, a versão dos escopos que tocou
+(`catalogo` e um `dia:AAAA-MM-DD` por dia de validade) na tabela
+`versoes_dados`. A chave de cache de uma resposta inclui as versões dos
+escopos de que ela depende, por isso uma importação torna as entradas
+antigas inalcançáveis sem ser preciso apagá-las: o LRU acaba por descartá-las.
+
+A mesma chave dá um ETag forte. Pedidos com `If-None-Match` igual recebem
+304 sem tocar na base nem serializar JSON.
+
+As respostas ficam num LRU em memória, limitado em entradas e em bytes.
+Opcionalmente são também partilhadas entre processos através de um backend
+externo (Redis, com CACHE_REDIS_URL). `BackendMemoria` imita esse backend
+dentro do processo, para testes e para correr sem Redis.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import request, make_response
+
+import armazenamento
+
+CACHE_ATIVO = os.environ.get('CACHE_ATIVO', '1') != '0'
+CACHE_MAX_ENTRADAS = int(os.environ.get('CACHE_MAX_ENTRADAS', '1000'))
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+CACHE_TTL_COMPARTILHADO = int(os.environ.get('CACHE_TTL_COMPARTILHADO', '3600'))
+# Intervalo máximo (segundos) entre consultas às versões gravadas pelas importações de outros processos
+CACHE_INTERVALO_VERSOES = float(os.environ.get('CACHE_INTERVALO_VERSOES', '1'))
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+
+CATALOGO = 'catalogo'
+
+REGISTRAR_ALTERACOES = """
+    INSERT INTO versoes_dados (escopo, versao)
+    SELECT escopo, nextval('versoes_dados_seq') FROM unnest(%s::text[]) AS escopo
+    ON CONFLICT (escopo) DO UPDATE SET versao = EXCLUDED.versao
+"""
+
+# No SQLite não há sequências: as versões continuam a crescer entre escopos a partir da maior gravada
+REGISTRAR_ALTERACOES_SQLITE = """
+    INSERT INTO versoes_dados (escopo, versao)
+    SELECT value, (SELECT coalesce(max(versao), 0) FROM versoes_dados) + key + 1 FROM json_each(?) WHERE true
+    ON CONFLICT (escopo) DO UPDATE SET versao = excluded.versao
+"""
+
+
+def escopo_dia(data):
+    return f"dia:{data.isoformat()}"
+
+
+def _escopos_alterados(datas, catalogo):
+    escopos = sorted({escopo_dia(d) for d in datas})
+    if catalogo:
+        escopos.insert(0, CATALOGO)
+    return escopos
+
+
+def registrar_alteracoes(cursor, datas, catalogo=True):
+    """Incrementa (na transação atual) as versões dos escopos tocados por uma importação."""
+    escopos = _escopos_alterados(datas, catalogo)
+    if escopos:
+        cursor.execute(REGISTRAR_ALTERACOES, (escopos,))
+
+
+def registrar_alteracoes_sqlite(cursor, datas, catalogo=True):
+    """O mesmo que `registrar_alteracoes`, numa conexão SQLite."""
+    escopos = _escopos_alterados(datas, catalogo)
+    if escopos:
+        cursor.execute(REGISTRAR_ALTERACOES_SQLITE, (json.dumps(escopos),))
+
+
+class CacheLRU:
+    """LRU em memória, seguro entre threads, limitado em entradas e em bytes."""
+
+    def __init__(self, max_entradas=CACHE_MAX_ENTRADAS, max_bytes=CACHE_MAX_BYTES):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self._entradas = OrderedDict()  # chave -> (corpo, mimetype)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    def obter(self, chave):
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                self.falhas += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self.acertos += 1
+            return entrada
+
+    def guardar(self, chave, corpo, mimetype):
+        # Uma resposta enorme expulsaria tudo o resto; essas não ficam em cache
+        if len(corpo) > self.max_bytes // 4:
+            return
+        with self._lock:
+            antiga = self._entradas.pop(chave, None)
+            if antiga is not None:
+                self._bytes -= len(antiga[0])
+            self._entradas[chave] = (corpo, mimetype)
+            self._bytes += len(corpo)
+            while len(self._entradas) > self.max_entradas or self._bytes > self.max_bytes:
+                _, (removido, _) = self._entradas.popitem(last=False)
+                self._bytes -= len(removido)
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._bytes = 0
+
+    def estatisticas(self):
+        with self._lock:
+            return {'entradas': len(self._entradas), 'bytes': self._bytes,
+                    'acertos': self.acertos, 'falhas': self.falhas}
+
+
+class BackendMemoria:
+    """Backend partilhado dentro do próprio processo (substituto do Redis em testes)."""
+
+    def __init__(self):
+        self._dados = {}
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            entrada = self._dados.get(chave)
+            if entrada is None:
+                return None
+            valor, expira_em = entrada
+            if expira_em < time.monotonic():
+                del self._dados[chave]
+                return None
+            return valor
+
+    def guardar(self, chave, valor, ttl):
+        with self._lock:
+            self._dados[chave] = (valor, time.monotonic() + ttl)
+
+
+class BackendRedis:
+    """Backend partilhado entre processos e instâncias, num servidor Redis."""
+
+    def __init__(self, url):
+        import redis  # dependência opcional, só necessária com CACHE_REDIS_URL
+        self._redis = redis.Redis.from_url(url)
+
+    def obter(self, chave):
+        return self._redis.get(chave)
+
+    def guardar(self, chave, valor, ttl):
+        self._redis.set(chave, valor, ex=ttl)
+
+
+class VersoesDados:
+    """Cópia local das versões de `versoes_dados`, relida inteira a cada intervalo.
+
+    As versões vêm de uma sequência, mas as transações podem confirmar por
+    outra ordem que não a do `nextval`: pedir só as versões acima da maior já
+    vista perderia uma importação que confirmou depois de outra mais nova. A
+    tabela tem uma linha por dia com ofertas (e a do catálogo), por isso
+    relê-la toda é barato.
+    """
+
+    def __init__(self, intervalo=CACHE_INTERVALO_VERSOES):
+        self.intervalo = intervalo
+        self._versoes = {}
+        self._verificada_em = float('-inf')
+        self._lock = threading.Lock()
+
+    def expirar(self):
+        """Força a próxima leitura a ir à base (usado depois de uma importação neste processo)."""
+        self._verificada_em = float('-inf')
+
+    def _atualizar(self):
+        self._versoes = dict(armazenamento.do_pedido().todas_versoes())
+
+    def obter(self, escopos):
+        if time.monotonic() - self._verificada_em > self.intervalo:
+            with self._lock:
+                if time.monotonic() - self._verificada_em > self.intervalo:
+                    self._atualizar()
+                    self._verificada_em = time.monotonic()
+        return [self._versoes.get(escopo, 0) for escopo in escopos]
+
+
+lru = CacheLRU()
+versoes = VersoesDados()
+compartilhado = BackendRedis(CACHE_REDIS_URL) if CACHE_REDIS_URL else None
+
+
+def parametros_normalizados(normalizar=None):
+    """Parâmetros do pedido sem valores vazios e com espaços aparados."""
+    params = {chave: valor.strip() for chave, valor in request.args.items() if valor.strip()}
+    if normalizar:
+        normalizar(params)
+    return params
+
+
+def em_cache(escopos, normalizar=None):
+    """Decorador que põe em cache a resposta JSON de um endpoint GET.
+
+    `escopos(params)` diz de que escopos de dados a resposta depende.
+    `normalizar(params)`, se indicado, reescreve os parâmetros na sua forma
+    canónica (por exemplo, preenche a data de hoje), para que pedidos
+    equivalentes partilhem a mesma entrada.
+    """
+    def decorador(view):
+        @wraps(view)
+        def envolvida(*args, **kwargs):
+            if not CACHE_ATIVO:
+                return view(*args, **kwargs)
+
+            params = parametros_normalizados(normalizar)
+            lista_escopos = escopos(params)
+            versao = ','.join(map(str, versoes.obter(lista_escopos)))
+            chave = f"{request.path}?{urlencode(sorted(params.items()))}#{versao}"
+            etag = hashlib.sha1(chave.encode('utf-8')).hexdigest()
+
+            if request.if_none_match.contains(etag):
+                resposta = make_response('', 304)
+            else:
+                entrada = lru.obter(chave)
+                if entrada is None and compartilhado is not None:
+                    corpo = compartilhado.obter(chave)
+                    if corpo is not None:
+                        entrada = (corpo, 'application/json')
+                        lru.guardar(chave, *entrada)
+                if entrada is None:
+                    resposta = make_response(view(*args, **kwargs))
+                    if resposta.status_code != 200:
+                        return resposta
+                    if resposta.is_streamed:
+                        # Não fica em cache, mas o corpo é o mesmo para a mesma chave: vale o ETag
+                        resposta.set_etag(etag)
+                        resposta.headers['Cache-Control'] = 'no-cache'
+                        return resposta
+                    entrada = (resposta.get_data(), resposta.mimetype)
+                    lru.guardar(chave, *entrada)
+                    if compartilhado is not None:
+                        compartilhado.guardar(chave, entrada[0], CACHE_TTL_COMPARTILHADO)
+                resposta = make_response(entrada[0], 200)
+                resposta.mimetype = entrada[1]
+
+            resposta.set_etag(etag)
+            # O navegador pode guardar a resposta, mas revalida-a sempre (com If-None-Match)
+            resposta.headers['Cache-Control'] = 'no-cache'
+            return resposta
+        return envolvida
+    return decorador
@@ -1,6 +1,8 @@
 import os
 import psycopg2
 
+from migracoes import aplicar_migracoes
+
 # Tenta ler o URL da base de dados a partir da variável de ambiente
 DATABASE_URL = os.environ.get('DATABASE_URL_EXT')
 
@@ -8,48 +10,24 @@ if not DATABASE_URL:
     print("Erro: A variável de ambiente DATABASE_URL_EXT não foi definida.")
     print("Por favor, execute o comando 'set' ou 'export' antes de correr este script.")
 else:
-    # As queries de criação de tabelas para PostgreSQL
+    # Apaga tudo para um novo começo limpo (cuidado: destrói os dados!).
+    # Para atualizar uma base existente sem perder dados use migracoes.py.
     commands = (
         """
+        DROP TABLE IF EXISTS schema_versao CASCADE;
+        DROP TABLE IF EXISTS versoes_dados CASCADE;
+        DROP SEQUENCE IF EXISTS versoes_dados_seq;
+        DROP TABLE IF EXISTS historico_pendente CASCADE;
+        DROP TABLE IF EXISTS historico_resumido CASCADE;
+        DROP TABLE IF EXISTS melhores_ofertas_dia CASCADE;
+        DROP TABLE IF EXISTS importacoes_chaves CASCADE;
+        DROP TABLE IF EXISTS importacoes_blocos CASCADE;
+        DROP TABLE IF EXISTS importacoes CASCADE;
         DROP TABLE IF EXISTS precos_historicos CASCADE;
         DROP TABLE IF EXISTS produtos CASCADE;
         DROP TABLE IF EXISTS categorias CASCADE;
         DROP TABLE IF EXISTS supermercados CASCADE;
         """,
-        """
-        CREATE TABLE supermercados (
-            id SERIAL PRIMARY KEY,
-            nome TEXT UNIQUE NOT NULL
-        );
-        """,
-        """
-        CREATE TABLE categorias (
-            id SERIAL PRIMARY KEY,
-            nome TEXT UNIQUE NOT NULL
-        );
-        """,
-        """
-        CREATE TABLE produtos (
-            id SERIAL PRIMARY KEY,
-            nome TEXT NOT NULL,
-            id_categoria INTEGER,
-            FOREIGN KEY (id_categoria) REFERENCES categorias (id)
-        );
-        """,
-        """
-        CREATE TABLE precos_historicos (
-            id SERIAL PRIMARY KEY,
-            id_produto INTEGER,
-            id_supermercado INTEGER,
-            valor REAL NOT NULL,
-            unidade TEXT,
-            data_validade DATE,
-            observacoes TEXT,
-            data_registro DATE DEFAULT CURRENT_DATE,
-            FOREIGN KEY (id_produto) REFERENCES produtos (id),
-            FOREIGN KEY (id_supermercado) REFERENCES supermercados (id)
-        );
-        """
     )
 
     conn = None
@@ -62,6 +40,8 @@ else:
         # Fecha a comunicação e guarda as alterações
         cur.close()
         conn.commit()
+        # As tabelas e os índices são criados pelas migrações numeradas
+        aplicar_migracoes(conn)
         print("Tabelas criadas com sucesso no PostgreSQL!")
     except (Exception, psycopg2.DatabaseError) as error:
         print(error)
@@ -0,0 +1,125 @@
+"""Dados sintéticos para testes de carga: catálogo e folhas de ofertas de vários meses.
+
+O catálogo tem supermercados, categorias e produtos com um preço de
+referência. Cada folha mensal traz, para cada supermercado, as ofertas da
+semana (validade em intervalo, `1-7/05/2025`) e algumas de um só dia, no
+formato colado no painel do administrador (ver parser_ofertas.py). Os
+preços variam à volta da referência, por isso o mesmo produto tem preços
+diferentes entre supermercados e ao longo do tempo. Tudo é determinado pela
+semente: a mesma semente gera sempre as mesmas folhas.
+
+Uso:
+    python dados_sinteticos.py --meses 6 --produtos 5000 --diretorio folhas/
+"""
+import argparse
+import calendar
+import os
+import random
+from collections import namedtuple
+from datetime import date
+
+SUPERMERCADOS = ['Super Econômico', 'Atacadão Central', 'Mercado do Bairro', 'Hiper Bom Preço', 'Comper',
+                 'Fort Atacadista', 'Assaí', 'Carrefour', 'Pão de Açúcar', 'Extra', 'Big Bompreço', 'Nordestão']
+CATEGORIAS = {
+    'Mercearia': ['Arroz', 'Feijão', 'Açúcar', 'Café', 'Macarrão', 'Óleo de Soja', 'Farinha de Trigo', 'Molho de Tomate'],
+    'Açougue': ['Picanha', 'Alcatra', 'Frango Inteiro', 'Coxão Mole', 'Linguiça Toscana', 'Patinho Moído'],
+    'Hortifruti': ['Banana Prata', 'Maçã Gala', 'Tomate', 'Batata', 'Cebola', 'Alface Crespa', 'Mamão Formosa'],
+    'Bebidas': ['Refrigerante Cola', 'Suco de Laranja', 'Água Mineral', 'Cerveja Pilsen', 'Chá Gelado'],
+    'Limpeza': ['Detergente', 'Sabão em Pó', 'Água Sanitária', 'Amaciante', 'Desinfetante'],
+    'Higiene': ['Sabonete', 'Creme Dental', 'Shampoo', 'Papel Higiênico', 'Desodorante'],
+    'Frios e Laticínios': ['Leite Integral', 'Queijo Mussarela', 'Presunto', 'Iogurte Natural', 'Manteiga', 'Requeijão'],
+    'Padaria': ['Pão de Forma', 'Bolo de Fubá', 'Biscoito Cream Cracker', 'Torrada'],
+}
+MARCAS = ['Tio João', 'Camil', 'União', 'Pilão', 'Renata', 'Soya', 'Qualitá', 'Nestlé', 'Ypê', 'Omo', 'Seara',
+          'Sadia', 'Itambé', 'Piracanjuba', 'Wickbold', 'Marilan', 'Aurora', 'Dona Benta']
+TAMANHOS = ['', '1kg', '5kg', '500g', '200g', '1L', '2L', '350ml', 'Pacote', 'Caixa 12un']
+UNIDADES = ['un', 'kg', 'pct', 'cx', 'L']
+OBSERVACOES = ['leve 3 pague 2', 'cartão fidelidade', 'unidade', 'a partir de 2 unidades']
+
+Produto = namedtuple('Produto', 'nome categoria preco unidade')
+Catalogo = namedtuple('Catalogo', 'supermercados categorias produtos')
+
+
+def gerar_catalogo(supermercados=8, produtos=2000, seed=42):
+    """Gera um catálogo com nomes de produto únicos e um preço de referência para cada um."""
+    rnd = random.Random(seed)
+    nomes_supermercados = [SUPERMERCADOS[i % len(SUPERMERCADOS)] + (f' {i // len(SUPERMERCADOS) + 1}' if i >= len(SUPERMERCADOS) else '')
+                           for i in range(supermercados)]
+    vistos = set()
+    lista = []
+    while len(lista) < produtos:
+        categoria = rnd.choice(list(CATEGORIAS))
+        nome = ' '.join(parte for parte in (rnd.choice(CATEGORIAS[categoria]), rnd.choice(MARCAS), rnd.choice(TAMANHOS)) if parte)
+        if nome in vistos:
+            # Mais combinações do que as listas dão: as repetidas ganham uma linha de produto
+            nome = f'{nome} Linha {len(lista)}'
+        vistos.add(nome)
+        lista.append(Produto(nome, categoria, round(rnd.uniform(1.5, 80), 2), rnd.choice(UNIDADES)))
+    return Catalogo(nomes_supermercados, list(CATEGORIAS), lista)
+
+
+def _meses(inicio, quantos):
+    ano, mes = inicio.year, inicio.month
+    for _ in range(quantos):
+        yield ano, mes
+        ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+
+
+def _valor(valor):
+    return f'R$ {valor:.2f}'.replace('.', ',')
+
+
+def gerar_folha(catalogo, ano, mes, cobertura=0.15, rnd=None):
+    """Linhas da folha de um mês: por supermercado, `cobertura` do catálogo em oferta a cada semana."""
+    rnd = rnd or random.Random(f'{ano}-{mes}')
+    ultimo_dia = calendar.monthrange(ano, mes)[1]
+    linhas = []
+    for supermercado in catalogo.supermercados:
+        # Cada supermercado tem um nível de preços próprio
+        nivel = rnd.uniform(0.85, 1.15)
+        for inicio in range(1, ultimo_dia + 1, 7):
+            fim = min(inicio + 6, ultimo_dia)
+            for produto in rnd.sample(catalogo.produtos, int(len(catalogo.produtos) * cobertura)):
+                valor = max(0.5, produto.preco * nivel * rnd.uniform(0.8, 1.1))
+                nome = produto.nome
+                if rnd.random() < 0.1:
+                    nome += f' ({rnd.choice(OBSERVACOES)})'
+                if rnd.random() < 0.2:
+                    # Oferta relâmpago de um só dia
+                    validade = f'{rnd.randint(inicio, fim):02d}/{mes:02d}/{ano}'
+                else:
+                    validade = f'{inicio}-{fim}/{mes:02d}/{ano}'
+                linhas.append('\t'.join([validade, supermercado, nome, f'{_valor(valor)} {produto.unidade}', produto.categoria]))
+    rnd.shuffle(linhas)
+    return linhas
+
+
+def gerar_folhas(catalogo, meses=3, inicio=None, cobertura=0.15, seed=42):
+    """Gera [(date do primeiro dia do mês, linhas)] para `meses` meses a partir de `inicio`."""
+    inicio = inicio or date.today().replace(day=1)
+    rnd = random.Random(seed)
+    return [(date(ano, mes, 1), gerar_folha(catalogo, ano, mes, cobertura, rnd)) for ano, mes in _meses(inicio, meses)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gera folhas de ofertas sintéticas, uma por mês.')
+    parser.add_argument('--meses', type=int, default=3)
+    parser.add_argument('--inicio', type=date.fromisoformat, help='primeiro mês (AAAA-MM-DD); por omissão, o atual')
+    parser.add_argument('--supermercados', type=int, default=8)
+    parser.add_argument('--produtos', type=int, default=2000)
+    parser.add_argument('--cobertura', type=float, default=0.15, help='fração do catálogo em oferta por supermercado e semana')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--diretorio', default='.', help='onde gravar as folhas (folha_AAAA_MM.tsv)')
+    args = parser.parse_args()
+
+    catalogo = gerar_catalogo(args.supermercados, args.produtos, args.seed)
+    os.makedirs(args.diretorio, exist_ok=True)
+    for mes, linhas in gerar_folhas(catalogo, args.meses, args.inicio, args.cobertura, args.seed):
+        caminho = os.path.join(args.diretorio, f'folha_{mes:%Y_%m}.tsv')
+        with open(caminho, 'w', encoding='utf-8') as ficheiro:
+            ficheiro.write('\n'.join(linhas) + '\n')
+        print(f"{caminho}: {len(linhas)} linhas")
+
+
+if __name__ == '__main__':
+    main()
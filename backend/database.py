@@ -1,61 +1,145 @@
-import sqlite3
+"""Esquema da base SQLite, usada para correr a API localmente sem servidor (ARMAZENAMENTO=sqlite).
+
+As tabelas, chaves e índices são os mesmos do PostgreSQL (ver migracoes.py),
+com estas diferenças:
 
-DATABASE = 'supermercado.db'
+* as datas são guardadas como texto AAAA-MM-DD (ordenável) e as colunas
+  declaradas como DATE voltam a `datetime.date` nas leituras;
+* as listas e os JSON de `melhores_ofertas_dia` são texto JSON;
+* `precos_historicos` não é particionada nem tem a coluna `hash_conteudo`;
+* `f_unaccent` é uma função Python registada em cada conexão (ver
+  armazenamento_sqlite.py), por isso a busca sem acentos não tem índice trigram.
 
-def criar_banco():
-    # Conecta ao banco de dados (cria o arquivo se não existir)
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
+Uso:
+    python database.py [caminho]    # apaga e recria o ficheiro da base
+"""
+import os
+import sqlite3
+import sys
 
-    # Apaga as tabelas se já existirem para um novo começo limpo (cuidado ao usar em produção)
-    cursor.execute("DROP TABLE IF EXISTS precos_historicos")
-    cursor.execute("DROP TABLE IF EXISTS produtos")
-    cursor.execute("DROP TABLE IF EXISTS categorias")
-    cursor.execute("DROP TABLE IF EXISTS supermercados")
+DATABASE = os.environ.get('SQLITE_CAMINHO', 'supermercado.db')
 
-    # Cria as tabelas
-    cursor.execute("""
-    CREATE TABLE supermercados (
+ESQUEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS supermercados (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         nome TEXT UNIQUE NOT NULL
     )
-    """)
-
-    cursor.execute("""
-    CREATE TABLE categorias (
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS categorias (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         nome TEXT UNIQUE NOT NULL
     )
-    """)
-
-    cursor.execute("""
-    CREATE TABLE produtos (
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS produtos (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         nome TEXT NOT NULL,
-        id_categoria INTEGER,
-        FOREIGN KEY (id_categoria) REFERENCES categorias (id)
+        id_categoria INTEGER REFERENCES categorias (id)
     )
-    """)
-
-    cursor.execute("""
-    CREATE TABLE precos_historicos (
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS precos_historicos (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        id_produto INTEGER,
-        id_supermercado INTEGER,
+        id_produto INTEGER REFERENCES produtos (id),
+        id_supermercado INTEGER REFERENCES supermercados (id),
         valor REAL NOT NULL,
         unidade TEXT,
-        data_validade TEXT,
+        data_validade DATE,
         observacoes TEXT,
-        data_registro DATE DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (id_produto) REFERENCES produtos (id),
-        FOREIGN KEY (id_supermercado) REFERENCES supermercados (id)
+        data_registro DATE DEFAULT CURRENT_DATE,
+        CONSTRAINT precos_historicos_oferta_key UNIQUE (id_produto, id_supermercado, data_validade)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS importacoes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        hash_conteudo TEXT UNIQUE,
+        etapa TEXT NOT NULL,
+        autoritativa BOOLEAN NOT NULL DEFAULT 0,
+        total_linhas INTEGER NOT NULL DEFAULT 0,
+        linhas_processadas INTEGER NOT NULL DEFAULT 0,
+        total_blocos INTEGER NOT NULL DEFAULT 0,
+        blocos_processados INTEGER NOT NULL DEFAULT 0,
+        resultado TEXT,
+        erros TEXT NOT NULL DEFAULT '[]',
+        criada_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        atualizada_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS melhores_ofertas_dia (
+        data DATE NOT NULL,
+        id_produto INTEGER NOT NULL REFERENCES produtos (id),
+        valor_minimo REAL NOT NULL,
+        supermercados TEXT NOT NULL,
+        num_ofertas INTEGER NOT NULL,
+        ofertas TEXT NOT NULL,
+        PRIMARY KEY (data, id_produto)
     )
-    """)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS versoes_dados (
+        escopo TEXT PRIMARY KEY,
+        versao INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS historico_resumido (
+        id_produto INTEGER NOT NULL REFERENCES produtos (id),
+        granularidade TEXT NOT NULL,
+        periodo DATE NOT NULL,
+        id_supermercado INTEGER NOT NULL REFERENCES supermercados (id),
+        valor_minimo REAL NOT NULL,
+        valor_medio REAL NOT NULL,
+        valor_maximo REAL NOT NULL,
+        num_dias INTEGER NOT NULL,
+        PRIMARY KEY (id_produto, granularidade, periodo, id_supermercado)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS historico_pendente (
+        id_produto INTEGER NOT NULL,
+        data DATE NOT NULL,
+        PRIMARY KEY (id_produto, data)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_precos_validade_produto_valor ON precos_historicos (data_validade, id_produto, valor)",
+    "CREATE INDEX IF NOT EXISTS idx_precos_produto_validade ON precos_historicos (id_produto, data_validade)",
+    "CREATE INDEX IF NOT EXISTS idx_produtos_nome_categoria ON produtos (nome, id_categoria)",
+]
+
+
+def configurar_conexao(conn):
+    """Pragmas de cada conexão: WAL deixa as leituras correr em paralelo com a escrita."""
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute("PRAGMA busy_timeout = 30000")
 
-    print("Banco de dados e tabelas criados com sucesso.")
+
+def criar_esquema(conn):
+    """Cria as tabelas e os índices que faltarem."""
+    for comando in ESQUEMA:
+        conn.execute(comando)
     conn.commit()
-    conn.close()
 
-# Executa a função para criar o banco quando o script for chamado
+
+def criar_banco(caminho=DATABASE):
+    """Apaga o ficheiro da base (se existir) e cria um esquema vazio."""
+    for sufixo in ('', '-wal', '-shm'):
+        if os.path.exists(caminho + sufixo):
+            os.remove(caminho + sufixo)
+    conn = sqlite3.connect(caminho)
+    try:
+        configurar_conexao(conn)
+        criar_esquema(conn)
+    finally:
+        conn.close()
+
+
 if __name__ == '__main__':
-    criar_banco()
\ No newline at end of file
+    caminho = sys.argv[1] if len(sys.argv) > 1 else DATABASE
+    criar_banco(caminho)
+    print(f"Banco de dados SQLite criado em {caminho}.")
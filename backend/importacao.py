@@ -0,0 +1,425 @@
+"""Importação em streaming das ofertas coladas no painel do administrador.
+
+As linhas são lidas uma a uma do corpo do pedido, normalizadas e enviadas
+por COPY para uma tabela temporária de staging. Supermercados, categorias e
+produtos são depois resolvidos com SQL baseado em conjuntos, as partições
+mensais que faltarem são criadas e os preços são gravados em
+`precos_historicos` com um único upsert, que compara o hash do conteúdo de
+cada oferta com o já gravado e só escreve as novas e as alteradas. A memória usada não
+depende do tamanho do envio: nada é acumulado em listas do lado do Python.
+"""
+import hashlib
+import os
+import tempfile
+import time
+
+import metricas
+from parser_ofertas import RelatorioRejeicoes, analisar_lote
+
+# Bytes de uma folha recebida guardados em memória; acima disto a cópia vai para disco
+FOLHA_EM_MEMORIA = int(os.environ.get('IMPORTACAO_FOLHA_EM_MEMORIA', str(8 * 1024 * 1024)))
+
+# A mesma tabela serve ao SQLite (ver armazenamento_sqlite.py), que não tem ON COMMIT
+TABELA_STAGING = """
+    CREATE TEMP TABLE IF NOT EXISTS staging_ofertas (
+        linha INTEGER NOT NULL,
+        data_validade DATE NOT NULL,
+        supermercado TEXT NOT NULL,
+        categoria TEXT NOT NULL,
+        produto TEXT NOT NULL,
+        valor NUMERIC NOT NULL,
+        unidade TEXT,
+        observacoes TEXT
+    )
+"""
+
+CRIAR_STAGING = TABELA_STAGING + " ON COMMIT DELETE ROWS"
+
+COPY_STAGING = "COPY staging_ofertas (linha, data_validade, supermercado, categoria, produto, valor, unidade, observacoes) FROM STDIN"
+
+# O `WHERE true` é para o SQLite, onde um INSERT ... SELECT com ON CONFLICT precisa de WHERE
+# para não ser ambíguo; o PostgreSQL ignora-o
+INSERIR_SUPERMERCADOS = """
+    INSERT INTO supermercados (nome)
+    SELECT DISTINCT supermercado FROM staging_ofertas WHERE true
+    ON CONFLICT (nome) DO NOTHING
+"""
+
+INSERIR_CATEGORIAS = """
+    INSERT INTO categorias (nome)
+    SELECT DISTINCT categoria FROM staging_ofertas WHERE true
+    ON CONFLICT (nome) DO NOTHING
+"""
+
+INSERIR_PRODUTOS = """
+    INSERT INTO produtos (nome, id_categoria)
+    SELECT DISTINCT st.produto, c.id
+    FROM staging_ofertas st
+    JOIN categorias c ON c.nome = st.categoria
+    WHERE NOT EXISTS (
+        SELECT 1 FROM produtos p WHERE p.nome = st.produto AND p.id_categoria = c.id
+    )
+"""
+
+# Se a mesma oferta aparecer várias vezes no envio, vale a última linha. Cada oferta é
+# comparada pelo hash do conteúdo (valor, unidade, observações) com a que já está gravada:
+# só as novas e as alteradas chegam ao INSERT, as iguais não custam nenhuma escrita.
+UPSERT_PRECOS = """
+    WITH ofertas AS (
+        SELECT DISTINCT ON (p.id, s.id, st.data_validade)
+               p.id AS id_produto, s.id AS id_supermercado, st.valor, st.unidade,
+               st.data_validade, st.observacoes,
+               hash_oferta(st.valor::real, st.unidade, st.observacoes) AS hash_conteudo
+        FROM staging_ofertas st
+        JOIN supermercados s ON s.nome = st.supermercado
+        JOIN categorias c ON c.nome = st.categoria
+        JOIN produtos p ON p.nome = st.produto AND p.id_categoria = c.id
+        ORDER BY p.id, s.id, st.data_validade, st.linha DESC
+    ), comparadas AS (
+        SELECT o.*, ph.hash_conteudo IS NOT DISTINCT FROM o.hash_conteudo AS inalterada
+        FROM ofertas o
+        LEFT JOIN precos_historicos ph ON ph.id_produto = o.id_produto
+                                      AND ph.id_supermercado = o.id_supermercado
+                                      AND ph.data_validade = o.data_validade
+    ), alteradas AS (
+        SELECT *, nextval('precos_historicos_id_seq') AS novo_id FROM comparadas WHERE NOT inalterada
+    ), gravadas AS (
+        INSERT INTO precos_historicos (id, id_produto, id_supermercado, valor, unidade, data_validade, observacoes)
+        SELECT novo_id, id_produto, id_supermercado, valor, unidade, data_validade, observacoes FROM alteradas
+        ON CONFLICT (id_produto, id_supermercado, data_validade) DO UPDATE
+        SET valor = EXCLUDED.valor,
+            unidade = EXCLUDED.unidade,
+            observacoes = EXCLUDED.observacoes,
+            data_registro = CURRENT_DATE
+        RETURNING id, id_produto, id_supermercado, data_validade
+    ), pendentes AS (
+        -- Produtos e dias a refletir em historico_resumido quando a importação terminar
+        INSERT INTO historico_pendente (id_produto, data)
+        SELECT DISTINCT id_produto, data_validade FROM gravadas WHERE data_validade IS NOT NULL
+        ON CONFLICT DO NOTHING
+    ), chaves AS (
+        -- Numa folha autoritativa, as ofertas vistas ficam anotadas para retirar as que faltarem
+        INSERT INTO importacoes_chaves (id_importacao, id_supermercado, id_produto, data_validade)
+        SELECT %(autoritativa)s, id_supermercado, id_produto, data_validade FROM comparadas
+        WHERE %(autoritativa)s IS NOT NULL
+        ON CONFLICT DO NOTHING
+    )
+    -- Numa tabela particionada não há xmax: uma linha atualizada mantém o id antigo
+    SELECT count(*) FILTER (WHERE g.id = a.novo_id),
+           count(*) FILTER (WHERE g.id <> a.novo_id),
+           (SELECT count(*) FROM comparadas WHERE inalterada),
+           ARRAY(SELECT DISTINCT data_validade FROM gravadas)
+    FROM gravadas g
+    JOIN alteradas a USING (id_produto, id_supermercado, data_validade)
+"""
+
+# No SQLite, sem DISTINCT ON, hash_oferta nem CTEs que escrevem, o mesmo upsert é feito em
+# passos sobre ofertas_importadas: uma linha por oferta da folha, com o estado da comparação
+# (0 nova, 1 alterada, 2 igual à gravada). Ver armazenamento_sqlite.py.
+CRIAR_OFERTAS_IMPORTADAS_SQLITE = """
+    CREATE TEMP TABLE IF NOT EXISTS ofertas_importadas (
+        id_produto INTEGER NOT NULL,
+        id_supermercado INTEGER NOT NULL,
+        data_validade DATE NOT NULL,
+        valor REAL NOT NULL,
+        unidade TEXT,
+        observacoes TEXT,
+        estado INTEGER
+    )
+"""
+
+RESOLVER_OFERTAS_SQLITE = """
+    INSERT INTO ofertas_importadas (id_produto, id_supermercado, data_validade, valor, unidade, observacoes)
+    SELECT p.id, s.id, st.data_validade, st.valor, st.unidade, st.observacoes
+    FROM (
+        SELECT *, row_number() OVER (PARTITION BY supermercado, categoria, produto, data_validade
+                                     ORDER BY linha DESC) AS ordem
+        FROM staging_ofertas
+    ) st
+    JOIN supermercados s ON s.nome = st.supermercado
+    JOIN categorias c ON c.nome = st.categoria
+    JOIN produtos p ON p.nome = st.produto AND p.id_categoria = c.id
+    WHERE st.ordem = 1
+"""
+
+# Compara como `hash_oferta`: valor com 2 casas, unidade e observações
+COMPARAR_OFERTAS_SQLITE = """
+    UPDATE ofertas_importadas AS o
+    SET estado = coalesce((
+        SELECT CASE WHEN round(ph.valor, 2) = round(o.valor, 2) AND ph.unidade IS o.unidade
+                         AND ph.observacoes IS o.observacoes THEN 2 ELSE 1 END
+        FROM precos_historicos ph
+        WHERE ph.id_produto = o.id_produto AND ph.id_supermercado = o.id_supermercado
+          AND ph.data_validade = o.data_validade
+    ), 0)
+"""
+
+CONTAR_OFERTAS_SQLITE = """
+    SELECT count(*) FILTER (WHERE estado = 0), count(*) FILTER (WHERE estado = 1), count(*) FILTER (WHERE estado = 2)
+    FROM ofertas_importadas
+"""
+
+ANOTAR_PENDENTES_SQLITE = """
+    INSERT INTO historico_pendente (id_produto, data)
+    SELECT DISTINCT id_produto, data_validade FROM ofertas_importadas WHERE estado < 2
+    ON CONFLICT DO NOTHING
+"""
+
+UPSERT_PRECOS_SQLITE = """
+    INSERT INTO precos_historicos (id_produto, id_supermercado, valor, unidade, data_validade, observacoes)
+    SELECT id_produto, id_supermercado, valor, unidade, data_validade, observacoes
+    FROM ofertas_importadas WHERE estado < 2
+    ON CONFLICT (id_produto, id_supermercado, data_validade) DO UPDATE
+    SET valor = excluded.valor,
+        unidade = excluded.unidade,
+        observacoes = excluded.observacoes,
+        data_registro = CURRENT_DATE
+"""
+
+# Quantas linhas são analisadas de cada vez antes de seguirem para o COPY
+LINHAS_POR_LOTE = 1000
+
+
+class ResumoImportacao:
+    """Contadores de uma importação e o relatório das linhas rejeitadas."""
+
+    def __init__(self):
+        self.linhas = 0
+        self.ofertas = 0
+        self.inseridos = 0
+        self.atualizados = 0
+        self.inalterados = 0
+        self.rejeicoes = RelatorioRejeicoes()
+        self.datas = set()  # dias de validade com ofertas gravadas, para atualizar as tabelas derivadas
+        self.tempo_analise = 0.0  # segundos gastos a analisar as linhas
+
+    @property
+    def rejeitados(self):
+        return self.rejeicoes.total
+
+    def como_dict(self):
+        return {
+            'linhas': self.linhas,
+            'ofertas': self.ofertas,
+            'inseridos': self.inseridos,
+            'atualizados': self.atualizados,
+            'inalterados': self.inalterados,
+            'rejeitados': self.rejeitados,
+            'rejeicoes_por_motivo': dict(self.rejeicoes.por_motivo),
+            'rejeicoes': self.rejeicoes.amostra,
+        }
+
+
+def ler_linhas(stream, encoding='utf-8'):
+    """Lê um fluxo binário linha a linha, sem o carregar inteiro em memória."""
+    for bruta in stream:
+        yield bruta.decode(encoding, errors='replace').rstrip('\r\n')
+
+
+class FolhaRecebida:
+    """Cópia de uma folha enviada, com o hash SHA-256 das linhas com conteúdo.
+
+    As linhas vão para um ficheiro temporário (em memória até
+    FOLHA_EM_MEMORIA bytes), por isso o hash fica conhecido, e uma folha
+    repetida é reconhecida, antes de se gravar ou importar alguma linha. As
+    linhas em branco não contam para o hash mas ficam na cópia, para as
+    rejeições indicarem o número da linha na folha original.
+    """
+
+    def __init__(self, linhas, autoritativa=False):
+        hash_conteudo = hashlib.sha256()
+        if autoritativa:
+            # A mesma folha enviada como autoritativa é outra importação
+            hash_conteudo.update(b'autoritativa\n')
+        self.total_linhas = 0
+        self._ficheiro = tempfile.SpooledTemporaryFile(FOLHA_EM_MEMORIA, mode='w+', encoding='utf-8', newline='\n')
+        for linha in linhas:
+            self._ficheiro.write(linha + '\n')
+            if linha.strip():
+                hash_conteudo.update(linha.encode('utf-8'))
+                hash_conteudo.update(b'\n')
+                self.total_linhas += 1
+        self.hash = hash_conteudo.hexdigest()
+
+    def linhas(self):
+        """As linhas da folha pela ordem em que chegaram, incluindo as em branco."""
+        self._ficheiro.seek(0)
+        for linha in self._ficheiro:
+            yield linha[:-1]
+
+    def close(self):
+        self._ficheiro.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _campo_copy(valor):
+    """Formata um valor para o formato de texto do COPY (\\N é NULL)."""
+    if valor is None:
+        return '\\N'
+    return str(valor).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def analisar_em_lotes(linhas, resumo, primeira=1):
+    """Analisa as linhas em lotes de LINHAS_POR_LOTE e gera os `LoteOfertas`, contando-os em `resumo`."""
+    for bloco in _blocos(linhas, LINHAS_POR_LOTE):
+        inicio = time.perf_counter()
+        lote = analisar_lote(bloco, primeira_linha=primeira, rejeicoes=resumo.rejeicoes)
+        resumo.tempo_analise += time.perf_counter() - inicio
+        primeira += len(bloco)
+        resumo.linhas += lote.total_linhas
+        resumo.ofertas += len(lote)
+        yield lote
+
+
+def _linhas_copy(linhas, resumo, primeira):
+    """Gera as linhas do COPY para a staging, analisando a entrada em lotes limitados."""
+    for lote in analisar_em_lotes(linhas, resumo, primeira):
+        colunas = zip(lote.linhas, lote.datas, lote.supermercados, lote.categorias,
+                      lote.produtos, lote.valores, lote.unidades, lote.observacoes)
+        for numero, data_valida, *campos in colunas:
+            yield f"{numero}\t{data_valida.isoformat()}\t" + '\t'.join(map(_campo_copy, campos)) + '\n'
+
+
+def _blocos(iteravel, tamanho):
+    """Agrupa um iterável em listas de até `tamanho` elementos."""
+    bloco = []
+    for item in iteravel:
+        bloco.append(item)
+        if len(bloco) >= tamanho:
+            yield bloco
+            bloco = []
+    if bloco:
+        yield bloco
+
+
+class _FluxoCopy:
+    """Adapta um gerador de linhas a um objeto tipo ficheiro lido pelo COPY."""
+
+    def __init__(self, linhas):
+        self._linhas = iter(linhas)
+        self._resto = ''
+
+    def read(self, tamanho=8192):
+        partes = [self._resto]
+        lidos = len(self._resto)
+        for linha in self._linhas:
+            partes.append(linha)
+            lidos += len(linha)
+            if tamanho >= 0 and lidos >= tamanho:
+                break
+        dados = ''.join(partes)
+        if tamanho >= 0:
+            dados, self._resto = dados[:tamanho], dados[tamanho:]
+        else:
+            self._resto = ''
+        return dados
+
+
+def importar_linhas(conn, linhas, primeira_linha=1, autoritativa=None):
+    """Importa as linhas do panfleto dentro da transação atual de `conn`.
+
+    Não faz commit: quem chama decide se confirma ou desfaz. `primeira_linha`
+    é o número da primeira linha na folha original (usado nas rejeições).
+    `autoritativa`, se indicado, é o id da importação em cujas chaves as
+    ofertas vistas são anotadas (ver `retirar_ausentes`). Retorna um
+    `ResumoImportacao` com as contagens de inseridos, atualizados,
+    inalterados e rejeitados.
+    """
+    resumo = ResumoImportacao()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(CRIAR_STAGING)
+        # A staging só se esvazia no commit: outra importação na mesma transação deixou lá as suas linhas
+        cursor.execute("TRUNCATE staging_ofertas")
+        inicio = time.perf_counter()
+        cursor.copy_expert(COPY_STAGING, _FluxoCopy(_linhas_copy(linhas, resumo, primeira_linha)))
+        # A análise corre dentro do COPY, à medida que ele lê as linhas
+        metricas.registrar_etapa('analise', resumo.tempo_analise)
+        metricas.registrar_etapa('copy', time.perf_counter() - inicio - resumo.tempo_analise)
+        if resumo.ofertas:
+            with metricas.medir_etapa('resolucao'):
+                cursor.execute("ANALYZE staging_ofertas")
+                cursor.execute(INSERIR_SUPERMERCADOS)
+                cursor.execute(INSERIR_CATEGORIAS)
+                cursor.execute(INSERIR_PRODUTOS)
+            with metricas.medir_etapa('particoes'):
+                # As ofertas de um mês sem partição iriam parar à partição padrão
+                cursor.execute("SELECT garantir_particoes_precos(ARRAY(SELECT DISTINCT data_validade FROM staging_ofertas))")
+            with metricas.medir_etapa('upsert'):
+                cursor.execute(UPSERT_PRECOS, {'autoritativa': autoritativa})
+                resumo.inseridos, resumo.atualizados, resumo.inalterados, datas_gravadas = cursor.fetchone()
+            resumo.datas.update(datas_gravadas)
+    finally:
+        cursor.close()
+    return resumo
+
+
+# As ofertas de cada supermercado entre a primeira e a última data da folha que não
+# vieram nela são apagadas
+RETIRAR_AUSENTES = """
+    WITH faixas AS (
+        SELECT id_supermercado, min(data_validade) AS inicio, max(data_validade) AS fim
+        FROM importacoes_chaves
+        WHERE id_importacao = %(id)s
+        GROUP BY id_supermercado
+    ), retiradas AS (
+        DELETE FROM precos_historicos ph
+        USING faixas f
+        WHERE ph.id_supermercado = f.id_supermercado
+          AND ph.data_validade BETWEEN f.inicio AND f.fim
+          AND NOT EXISTS (
+              SELECT 1 FROM importacoes_chaves k
+              WHERE k.id_importacao = %(id)s
+                AND k.id_supermercado = ph.id_supermercado
+                AND k.id_produto = ph.id_produto
+                AND k.data_validade = ph.data_validade
+          )
+        RETURNING ph.id_produto, ph.data_validade
+    ), pendentes AS (
+        INSERT INTO historico_pendente (id_produto, data)
+        SELECT DISTINCT id_produto, data_validade FROM retiradas
+        ON CONFLICT DO NOTHING
+    )
+    SELECT count(*), ARRAY(SELECT DISTINCT data_validade FROM retiradas) FROM retiradas
+"""
+
+
+# No SQLite a importação corre numa só transação e as ofertas vistas estão em ofertas_importadas
+RETIRAR_AUSENTES_SQLITE = """
+    WITH faixas AS (
+        SELECT id_supermercado, min(data_validade) AS inicio, max(data_validade) AS fim
+        FROM ofertas_importadas
+        GROUP BY id_supermercado
+    )
+    DELETE FROM precos_historicos AS ph
+    WHERE EXISTS (
+        SELECT 1 FROM faixas f
+        WHERE f.id_supermercado = ph.id_supermercado AND ph.data_validade BETWEEN f.inicio AND f.fim
+    ) AND NOT EXISTS (
+        SELECT 1 FROM ofertas_importadas o
+        WHERE o.id_supermercado = ph.id_supermercado AND o.id_produto = ph.id_produto
+          AND o.data_validade = ph.data_validade
+    )
+    RETURNING id_produto, data_validade
+"""
+
+def retirar_ausentes(cursor, id_importacao):
+    """Apaga as ofertas que uma folha autoritativa deixou de trazer e retorna (retiradas, datas).
+
+    A folha é autoritativa para cada supermercado que traz, entre a primeira
+    e a última data de validade desse supermercado. As chaves anotadas da
+    importação são apagadas na mesma transação, por isso repetir a chamada
+    depois de um commit não retira mais nada.
+    """
+    cursor.execute("SELECT 1 FROM importacoes_chaves WHERE id_importacao = %s LIMIT 1", (id_importacao,))
+    if cursor.fetchone() is None:
+        return 0, []
+    cursor.execute(RETIRAR_AUSENTES, {'id': id_importacao})
+    retiradas, datas = cursor.fetchone()
+    cursor.execute("DELETE FROM importacoes_chaves WHERE id_importacao = %s", (id_importacao,))
+    return retiradas, datas
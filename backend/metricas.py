@@ -0,0 +1,275 @@
+"""Métricas da aplicação no formato de texto do Prometheus, expostas em /metrics.
+
+São registados:
+
+* a latência de cada rota (histograma por rota, método e estado) e o
+  tamanho das respostas, incluindo as enviadas em streaming;
+* a espera por uma conexão do pool e o tempo de serialização do JSON;
+* o tempo e as linhas de cada consulta registada (por nome da consulta),
+  incluindo a das ofertas em streaming, com um log opcional das que
+  passarem de METRICAS_CONSULTA_LENTA_MS;
+* o tempo de cada etapa das importações e as linhas processadas.
+
+As séries são guardadas em memória no próprio processo; cada observação é
+uma busca binária nos limites do histograma e uma soma protegida por um
+lock, por isso pode ficar ligado em produção (METRICAS_ATIVAS=0 desliga).
+Com vários workers do gunicorn, cada um expõe as suas próprias séries.
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+
+logger = logging.getLogger(__name__)
+
+METRICAS_ATIVAS = os.environ.get('METRICAS_ATIVAS', '1') != '0'
+# Consultas mais lentas do que isto (ms) são registadas no log; 0 desliga
+METRICAS_CONSULTA_LENTA_MS = float(os.environ.get('METRICAS_CONSULTA_LENTA_MS', '0'))
+
+LIMITES_SEGUNDOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LIMITES_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+LIMITES_LINHAS = (1, 10, 100, 1000, 10000, 100000)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _rotulos(nomes, valores):
+    if not nomes:
+        return ''
+    return '{' + ','.join(f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)) + '}'
+
+
+class Contador:
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome, self.ajuda, self.rotulos = nome, ajuda, tuple(rotulos)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, quantidade=1, *valores):
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0) + quantidade
+
+    def texto(self):
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} counter"]
+        with self._lock:
+            for valores, total in sorted(self._valores.items()):
+                linhas.append(f"{self.nome}{_rotulos(self.rotulos, valores)} {total}")
+        return linhas
+
+
+class Medidor:
+    """Valor instantâneo, lido por uma função no momento da exposição."""
+
+    def __init__(self, nome, ajuda, rotulos, ler):
+        self.nome, self.ajuda, self.rotulos, self._ler = nome, ajuda, tuple(rotulos), ler
+
+    def texto(self):
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} gauge"]
+        try:
+            valores = self._ler()
+        except Exception:
+            logger.exception("Erro ao ler a métrica %s", self.nome)
+            return linhas
+        for rotulos, valor in sorted(valores.items()):
+            linhas.append(f"{self.nome}{_rotulos(self.rotulos, rotulos)} {valor}")
+        return linhas
+
+
+class Histograma:
+    def __init__(self, nome, ajuda, rotulos=(), limites=LIMITES_SEGUNDOS):
+        self.nome, self.ajuda, self.rotulos = nome, ajuda, tuple(rotulos)
+        self.limites = tuple(limites)
+        self._series = {}  # valores dos rótulos -> [contagens por balde..., soma, total]
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *valores):
+        posicao = bisect_left(self.limites, valor)
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = [0] * (len(self.limites) + 1) + [0.0, 0]
+            serie[posicao] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def texto(self):
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} histogram"]
+        with self._lock:
+            series = sorted((valores, list(serie)) for valores, serie in self._series.items())
+        for valores, serie in series:
+            acumulado = 0
+            for limite, contagem in zip(self.limites + ('+Inf',), serie):
+                acumulado += contagem
+                linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos + ('le',), valores + (limite,))} {acumulado}")
+            linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, valores)} {serie[-2]}")
+            linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, valores)} {serie[-1]}")
+        return linhas
+
+
+def _estatisticas_pool():
+    import armazenamento
+    if armazenamento.ARMAZENAMENTO != 'postgres':
+        return {}
+    estatisticas = armazenamento.estatisticas_conexoes()
+    return {(chave,): estatisticas[chave] for chave in ('em_uso', 'ociosas', 'total', 'maximo')}
+
+
+pedidos = Histograma('http_pedido_segundos', 'Latência dos pedidos HTTP por rota.', ('rota', 'metodo', 'estado'))
+respostas = Histograma('http_resposta_bytes', 'Tamanho do corpo das respostas HTTP.', ('rota',), LIMITES_BYTES)
+serializacao = Histograma('json_serializacao_segundos', 'Tempo a serializar respostas JSON.', ('rota',))
+espera_pool = Histograma('pool_espera_segundos', 'Espera por uma conexão do pool.')
+consultas = Histograma('sql_consulta_segundos', 'Tempo de cada consulta registada.', ('consulta',))
+linhas_consultas = Histograma('sql_consulta_linhas', 'Linhas devolvidas ou afetadas por consulta.', ('consulta',), LIMITES_LINHAS)
+etapas_importacao = Histograma('importacao_etapa_segundos', 'Tempo de cada etapa das importações.', ('etapa',))
+linhas_importacao = Contador('importacao_linhas_total', 'Linhas das importações, por resultado.', ('resultado',))
+conexoes_pool = Medidor('pool_conexoes', 'Conexões do pool por estado.', ('estado',), _estatisticas_pool)
+
+REGISTRO = [pedidos, respostas, serializacao, espera_pool, consultas, linhas_consultas,
+           etapas_importacao, linhas_importacao, conexoes_pool]
+
+
+def _rota():
+    regra = request.url_rule
+    return regra.rule if regra is not None else 'desconhecida'
+
+
+def registrar_tempo_consulta(nome, segundos, linhas):
+    """Regista o tempo e as linhas de uma consulta e, se ela for lenta, escreve-a no log."""
+    if not METRICAS_ATIVAS:
+        return
+    consultas.observar(segundos, nome)
+    linhas_consultas.observar(linhas, nome)
+    if METRICAS_CONSULTA_LENTA_MS and segundos * 1000 >= METRICAS_CONSULTA_LENTA_MS:
+        logger.warning("Consulta lenta: %s demorou %.1f ms (%d linhas)", nome, segundos * 1000, linhas)
+
+
+@contextmanager
+def medir_consulta(nome, cursor):
+    """Mede uma consulta registada; no fim lê as linhas em `cursor.rowcount`."""
+    if not METRICAS_ATIVAS:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar_tempo_consulta(nome, time.perf_counter() - inicio, max(cursor.rowcount, 0))
+
+
+def registrar_etapa(etapa, segundos):
+    if METRICAS_ATIVAS:
+        etapas_importacao.observar(segundos, etapa)
+
+
+@contextmanager
+def medir_etapa(etapa):
+    """Mede uma etapa de uma importação."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar_etapa(etapa, time.perf_counter() - inicio)
+
+
+def registrar_espera_pool(segundos):
+    if METRICAS_ATIVAS:
+        espera_pool.observar(segundos)
+
+
+def contar_linhas_importacao(**contagens):
+    if METRICAS_ATIVAS:
+        for resultado, quantidade in contagens.items():
+            if quantidade:
+                linhas_importacao.inc(quantidade, resultado)
+
+
+def texto():
+    """Todas as métricas no formato de texto do Prometheus (versão 0.0.4)."""
+    linhas = []
+    for metrica in REGISTRO:
+        linhas.extend(metrica.texto())
+    return '\n'.join(linhas) + '\n'
+
+
+class ProvedorJSONMedido(DefaultJSONProvider):
+    """O provedor JSON do Flask, a medir quanto tempo leva cada serialização.
+
+    Dentro de `medir_serializacao_em_fluxo` os tempos são somados e a
+    resposta inteira conta como uma só serialização.
+    """
+
+    def dumps(self, obj, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            if METRICAS_ATIVAS and has_request_context():
+                duracao = time.perf_counter() - inicio
+                acumulado = g.get('metricas_serializacao')
+                if acumulado is None:
+                    serializacao.observar(duracao, _rota())
+                else:
+                    g.metricas_serializacao = acumulado + duracao
+
+
+@contextmanager
+def medir_serializacao_em_fluxo():
+    """Regista a serialização de uma resposta em streaming (um dumps por linha) como uma só."""
+    if not METRICAS_ATIVAS:
+        yield
+        return
+    g.metricas_serializacao = 0.0
+    try:
+        yield
+    finally:
+        serializacao.observar(g.pop('metricas_serializacao', 0.0), _rota())
+
+
+def _contar_bytes(corpo, rota):
+    """Percorre um corpo em streaming e regista o total de bytes quando termina."""
+    total = 0
+    try:
+        for parte in corpo:
+            # As partes podem vir como texto: conta-se o tamanho já codificado, não os caracteres
+            total += len(parte.encode('utf-8') if isinstance(parte, str) else parte)
+            yield parte
+    finally:
+        respostas.observar(total, rota)
+
+
+def _antes_do_pedido():
+    g.metricas_inicio = time.perf_counter()
+
+
+def _depois_do_pedido(resposta):
+    inicio = g.pop('metricas_inicio', None)
+    if inicio is None:
+        return resposta
+    rota = _rota()
+    pedidos.observar(time.perf_counter() - inicio, rota, request.method, resposta.status_code)
+    if resposta.is_streamed:
+        # A latência acima é até ao primeiro byte; o tamanho só se sabe no fim do envio
+        resposta.response = _contar_bytes(resposta.response, rota)
+    else:
+        respostas.observar(resposta.content_length or 0, rota)
+    return resposta
+
+
+def init_app(app):
+    """Liga as medições aos pedidos e regista o endpoint /metrics."""
+    if not METRICAS_ATIVAS:
+        return
+    app.json = ProvedorJSONMedido(app)
+    app.before_request(_antes_do_pedido)
+    app.after_request(_depois_do_pedido)
+
+    @app.route('/metrics', methods=['GET'])
+    def get_metricas():
+        return Response(texto(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,495 @@
+"""Migrações numeradas do esquema PostgreSQL.
+
+Cada migração é aplicada uma única vez, na sua própria transação, e a versão
+aplicada fica registada em `schema_versao`. Nada aqui apaga dados: para
+recomeçar do zero use create_tables.py.
+
+Uso:
+    python migracoes.py                     # aplica as migrações pendentes
+    python migracoes.py --verificar-planos  # falha se alguma consulta quente fizer seq scan
+
+A verificação de planos semeia um conjunto de dados sintético dentro de uma
+transação que é desfeita no fim; mesmo assim, prefira corrê-la numa base de
+testes. A mesma verificação corre nos testes (tests/test_migracoes.py)
+quando DATABASE_URL está definida.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+
+import psycopg2
+
+MIGRACOES = [
+    (1, 'esquema base', [
+        """
+        CREATE TABLE IF NOT EXISTS supermercados (
+            id SERIAL PRIMARY KEY,
+            nome TEXT UNIQUE NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS categorias (
+            id SERIAL PRIMARY KEY,
+            nome TEXT UNIQUE NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS produtos (
+            id SERIAL PRIMARY KEY,
+            nome TEXT NOT NULL,
+            id_categoria INTEGER,
+            FOREIGN KEY (id_categoria) REFERENCES categorias (id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS precos_historicos (
+            id SERIAL PRIMARY KEY,
+            id_produto INTEGER,
+            id_supermercado INTEGER,
+            valor REAL NOT NULL,
+            unidade TEXT,
+            data_validade DATE,
+            observacoes TEXT,
+            data_registro DATE DEFAULT CURRENT_DATE,
+            FOREIGN KEY (id_produto) REFERENCES produtos (id),
+            FOREIGN KEY (id_supermercado) REFERENCES supermercados (id)
+        )
+        """,
+    ]),
+    (2, 'chave única das ofertas para o upsert da importação', [
+        # Bases antigas podem ter ofertas repetidas: fica só a registada mais recentemente
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_constraint
+                WHERE conrelid = 'precos_historicos'::regclass AND contype = 'u'
+            ) THEN
+                DELETE FROM precos_historicos ph
+                USING precos_historicos outro
+                WHERE ph.id_produto = outro.id_produto
+                  AND ph.id_supermercado = outro.id_supermercado
+                  AND ph.data_validade = outro.data_validade
+                  AND ph.id < outro.id;
+                ALTER TABLE precos_historicos
+                    ADD CONSTRAINT precos_historicos_oferta_key UNIQUE (id_produto, id_supermercado, data_validade);
+            END IF;
+        END
+        $$
+        """,
+    ]),
+    (3, 'tarefas de importação', [
+        """
+        CREATE TABLE IF NOT EXISTS importacoes (
+            id SERIAL PRIMARY KEY,
+            hash_conteudo TEXT UNIQUE,
+            etapa TEXT NOT NULL,
+            total_linhas INTEGER NOT NULL DEFAULT 0,
+            linhas_processadas INTEGER NOT NULL DEFAULT 0,
+            total_blocos INTEGER NOT NULL DEFAULT 0,
+            blocos_processados INTEGER NOT NULL DEFAULT 0,
+            resultado JSONB,
+            erros JSONB NOT NULL DEFAULT '[]',
+            criada_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+            atualizada_em TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS importacoes_blocos (
+            id_importacao INTEGER NOT NULL REFERENCES importacoes (id) ON DELETE CASCADE,
+            ordem INTEGER NOT NULL,
+            conteudo TEXT NOT NULL,
+            PRIMARY KEY (id_importacao, ordem)
+        )
+        """,
+    ]),
+    (4, 'índices das consultas de leitura', [
+        # /api/ofertas e /api/produtos-em-oferta: ofertas de um dia, com o menor preço por produto
+        "CREATE INDEX IF NOT EXISTS idx_precos_validade_produto_valor ON precos_historicos (data_validade, id_produto, valor)",
+        # /api/produto/<id>/historico
+        "CREATE INDEX IF NOT EXISTS idx_precos_produto_registro ON precos_historicos (id_produto, data_registro)",
+        # A importação procura produtos por (nome, categoria)
+        "CREATE INDEX IF NOT EXISTS idx_produtos_nome_categoria ON produtos (nome, id_categoria)",
+    ]),
+    (5, 'busca de produtos sem acentos com pg_trgm', [
+        "CREATE EXTENSION IF NOT EXISTS unaccent",
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        # unaccent() é STABLE e não pode ser usada num índice; este invólucro fixa o
+        # dicionário e pode ser declarado IMMUTABLE.
+        """
+        CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+        AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_produtos_nome_busca ON produtos USING gin (f_unaccent(lower(nome)) gin_trgm_ops)",
+    ]),
+    (6, 'melhores ofertas por dia', [
+        """
+        CREATE TABLE IF NOT EXISTS melhores_ofertas_dia (
+            data DATE NOT NULL,
+            id_produto INTEGER NOT NULL REFERENCES produtos (id),
+            valor_minimo REAL NOT NULL,
+            supermercados TEXT[] NOT NULL,
+            num_ofertas INTEGER NOT NULL,
+            ofertas JSONB NOT NULL,
+            PRIMARY KEY (data, id_produto)
+        )
+        """,
+        """
+        INSERT INTO melhores_ofertas_dia (data, id_produto, valor_minimo, supermercados, num_ofertas, ofertas)
+        SELECT data_validade, id_produto,
+               min(valor),
+               array_agg(supermercado_nome ORDER BY supermercado_nome) FILTER (WHERE valor = minimo),
+               count(*),
+               jsonb_agg(jsonb_build_object('valor', valor, 'supermercado_nome', supermercado_nome, 'id_supermercado', id_supermercado)
+                         ORDER BY valor, supermercado_nome)
+        FROM (
+            SELECT ph.data_validade, ph.id_produto, ph.valor, s.id AS id_supermercado, s.nome AS supermercado_nome,
+                   min(ph.valor) OVER (PARTITION BY ph.data_validade, ph.id_produto) AS minimo
+            FROM precos_historicos ph
+            JOIN supermercados s ON ph.id_supermercado = s.id
+            WHERE ph.data_validade IS NOT NULL
+        ) ofertas
+        GROUP BY data_validade, id_produto
+        ON CONFLICT DO NOTHING
+        """,
+        # Dias tocados por cada importação, recalculados quando ela termina
+        "ALTER TABLE importacoes ADD COLUMN IF NOT EXISTS datas_afetadas DATE[] NOT NULL DEFAULT '{}'",
+    ]),
+    (7, 'versões dos dados para invalidar o cache', [
+        "CREATE SEQUENCE IF NOT EXISTS versoes_dados_seq",
+        """
+        CREATE TABLE IF NOT EXISTS versoes_dados (
+            escopo TEXT PRIMARY KEY,
+            versao BIGINT NOT NULL
+        )
+        """,
+    ]),
+    (8, 'histórico agregado por semana e por mês', [
+        # Preço mínimo, médio e máximo de cada produto em cada supermercado por período
+        """
+        CREATE TABLE IF NOT EXISTS historico_resumido (
+            id_produto INTEGER NOT NULL REFERENCES produtos (id),
+            granularidade TEXT NOT NULL,
+            periodo DATE NOT NULL,
+            id_supermercado INTEGER NOT NULL REFERENCES supermercados (id),
+            valor_minimo REAL NOT NULL,
+            valor_medio REAL NOT NULL,
+            valor_maximo REAL NOT NULL,
+            num_dias INTEGER NOT NULL,
+            PRIMARY KEY (id_produto, granularidade, periodo, id_supermercado)
+        )
+        """,
+        # (produto, dia) gravados por uma importação e ainda não refletidos em historico_resumido
+        """
+        CREATE TABLE IF NOT EXISTS historico_pendente (
+            id_produto INTEGER NOT NULL,
+            data DATE NOT NULL,
+            PRIMARY KEY (id_produto, data)
+        )
+        """,
+        # /api/produto/<id>/historico passa a filtrar por intervalo de validade
+        "CREATE INDEX IF NOT EXISTS idx_precos_produto_validade ON precos_historicos (id_produto, data_validade)",
+        "DROP INDEX IF EXISTS idx_precos_produto_registro",
+        """
+        INSERT INTO historico_resumido (id_produto, granularidade, periodo, id_supermercado,
+                                        valor_minimo, valor_medio, valor_maximo, num_dias)
+        SELECT ph.id_produto, g.granularidade, date_trunc(g.unidade, ph.data_validade)::date, ph.id_supermercado,
+               min(ph.valor), avg(ph.valor), max(ph.valor), count(*)
+        FROM precos_historicos ph
+        CROSS JOIN (VALUES ('semana', 'week'), ('mes', 'month')) AS g (granularidade, unidade)
+        WHERE ph.data_validade IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT DO NOTHING
+        """,
+    ]),
+    (9, 'precos_historicos particionada por mês de validade', [
+        # Cria as partições mensais que faltam para as datas indicadas. O advisory lock
+        # por mês evita que duas importações tentem criar a mesma partição.
+        """
+        CREATE OR REPLACE FUNCTION garantir_particoes_precos(datas DATE[]) RETURNS INTEGER
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            mes DATE;
+            particao TEXT;
+            criadas INTEGER := 0;
+        BEGIN
+            FOR mes IN SELECT DISTINCT date_trunc('month', d)::date FROM unnest(datas) AS d WHERE d IS NOT NULL LOOP
+                particao := 'precos_historicos_' || to_char(mes, 'YYYY_MM');
+                PERFORM pg_advisory_xact_lock(hashtext(particao));
+                IF to_regclass(particao) IS NULL THEN
+                    EXECUTE format('CREATE TABLE %I PARTITION OF precos_historicos FOR VALUES FROM (%L) TO (%L)',
+                                   particao, mes, (mes + interval '1 month')::date);
+                    criadas := criadas + 1;
+                END IF;
+            END LOOP;
+            RETURN criadas;
+        END
+        $$
+        """,
+        "ALTER TABLE precos_historicos RENAME TO precos_historicos_antiga",
+        # O nome passa para a chave da nova tabela; a migração 2 não a cria se já havia outra chave única
+        "ALTER TABLE precos_historicos_antiga DROP CONSTRAINT IF EXISTS precos_historicos_oferta_key",
+        "DROP INDEX IF EXISTS idx_precos_validade_produto_valor",
+        "DROP INDEX IF EXISTS idx_precos_produto_validade",
+        # A sequência dos ids passa para a nova tabela em vez de ser apagada com a antiga
+        "ALTER SEQUENCE precos_historicos_id_seq OWNED BY NONE",
+        # Sem chave primária em `id`: num particionamento, as chaves únicas têm de incluir data_validade
+        """
+        CREATE TABLE precos_historicos (
+            id INTEGER NOT NULL DEFAULT nextval('precos_historicos_id_seq'),
+            id_produto INTEGER REFERENCES produtos (id),
+            id_supermercado INTEGER REFERENCES supermercados (id),
+            valor REAL NOT NULL,
+            unidade TEXT,
+            data_validade DATE,
+            observacoes TEXT,
+            data_registro DATE DEFAULT CURRENT_DATE,
+            CONSTRAINT precos_historicos_oferta_key UNIQUE (id_produto, id_supermercado, data_validade)
+        ) PARTITION BY RANGE (data_validade)
+        """,
+        "ALTER SEQUENCE precos_historicos_id_seq OWNED BY precos_historicos.id",
+        # Só recebe ofertas sem data de validade: as importações criam a partição do mês antes de gravar
+        "CREATE TABLE precos_historicos_padrao PARTITION OF precos_historicos DEFAULT",
+        "SELECT garantir_particoes_precos(ARRAY(SELECT DISTINCT data_validade FROM precos_historicos_antiga))",
+        """
+        INSERT INTO precos_historicos (id, id_produto, id_supermercado, valor, unidade, data_validade, observacoes, data_registro)
+        SELECT id, id_produto, id_supermercado, valor, unidade, data_validade, observacoes, data_registro
+        FROM precos_historicos_antiga
+        """,
+        "DROP TABLE precos_historicos_antiga",
+        "CREATE INDEX IF NOT EXISTS idx_precos_validade_produto_valor ON precos_historicos (data_validade, id_produto, valor)",
+        "CREATE INDEX IF NOT EXISTS idx_precos_produto_validade ON precos_historicos (id_produto, data_validade)",
+        "ANALYZE precos_historicos",
+    ]),
+    (10, 'hash do conteúdo das ofertas e folhas autoritativas', [
+        # O valor passa por numeric com 2 casas: o texto de um REAL depende de extra_float_digits
+        """
+        CREATE OR REPLACE FUNCTION hash_oferta(valor REAL, unidade TEXT, observacoes TEXT) RETURNS BYTEA
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE
+        AS $$ SELECT decode(md5(format('%s|%L|%L', round(valor::numeric, 2), unidade, observacoes)), 'hex') $$
+        """,
+        """
+        ALTER TABLE precos_historicos ADD COLUMN IF NOT EXISTS hash_conteudo BYTEA
+            GENERATED ALWAYS AS (hash_oferta(valor, unidade, observacoes)) STORED
+        """,
+        "ALTER TABLE importacoes ADD COLUMN IF NOT EXISTS autoritativa BOOLEAN NOT NULL DEFAULT false",
+        # Ofertas vistas por uma importação autoritativa, até ela retirar as que faltarem
+        """
+        CREATE TABLE IF NOT EXISTS importacoes_chaves (
+            id_importacao INTEGER NOT NULL REFERENCES importacoes (id) ON DELETE CASCADE,
+            id_supermercado INTEGER NOT NULL,
+            id_produto INTEGER NOT NULL,
+            data_validade DATE NOT NULL,
+            PRIMARY KEY (id_importacao, id_supermercado, id_produto, data_validade)
+        )
+        """,
+    ]),
+    (11, 'número da linha de origem dos blocos de importação', [
+        "ALTER TABLE importacoes_blocos ADD COLUMN IF NOT EXISTS primeira_linha INTEGER",
+    ]),
+]
+
+CRIAR_SCHEMA_VERSAO = """
+    CREATE TABLE IF NOT EXISTS schema_versao (
+        versao INTEGER PRIMARY KEY,
+        descricao TEXT NOT NULL,
+        aplicada_em TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+# Chave do advisory lock que impede duas instâncias de migrar ao mesmo tempo
+LOCK_MIGRACOES = 4_137_001
+
+
+def versao_atual(conn):
+    """Retorna a maior versão aplicada (0 se nenhuma)."""
+    with conn.cursor() as cursor:
+        cursor.execute(CRIAR_SCHEMA_VERSAO)
+        cursor.execute("SELECT COALESCE(MAX(versao), 0) FROM schema_versao")
+        versao = cursor.fetchone()[0]
+    conn.commit()
+    return versao
+
+
+def aplicar_migracoes(conn, ate=None):
+    """Aplica, por ordem, as migrações ainda não registadas. Retorna as versões aplicadas."""
+    aplicadas = []
+    versao = versao_atual(conn)
+    for numero, descricao, comandos in MIGRACOES:
+        if numero <= versao or (ate is not None and numero > ate):
+            continue
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (LOCK_MIGRACOES,))
+            # Outra instância pode ter aplicado esta migração enquanto esperávamos pelo lock
+            cursor.execute("SELECT 1 FROM schema_versao WHERE versao = %s", (numero,))
+            if cursor.fetchone() is None:
+                for comando in comandos:
+                    cursor.execute(comando)
+                cursor.execute("INSERT INTO schema_versao (versao, descricao) VALUES (%s, %s)", (numero, descricao))
+                aplicadas.append(numero)
+        conn.commit()
+    return aplicadas
+
+
+# --- VERIFICAÇÃO DOS PLANOS DAS CONSULTAS QUENTES ---
+
+SEMEAR_DADOS = [
+    "INSERT INTO supermercados (nome) SELECT 'Supermercado ' || i FROM generate_series(1, %(supermercados)s) i ON CONFLICT DO NOTHING",
+    "INSERT INTO categorias (nome) SELECT 'Categoria ' || i FROM generate_series(1, 20) i ON CONFLICT DO NOTHING",
+    """
+    INSERT INTO produtos (nome, id_categoria)
+    SELECT 'Produto ' || md5(i::text), (SELECT id FROM categorias ORDER BY id OFFSET i %% 20 LIMIT 1)
+    FROM generate_series(1, %(produtos)s) i
+    """,
+    "SELECT garantir_particoes_precos(ARRAY(SELECT generate_series(CURRENT_DATE - %(dias)s, CURRENT_DATE, interval '1 day')::date))",
+    # Cada dia, cerca de 10% dos produtos estão em oferta em alguns supermercados
+    """
+    INSERT INTO precos_historicos (id_produto, id_supermercado, valor, unidade, data_validade)
+    SELECT p.id, s.id, round((random() * 50 + 1)::numeric, 2), 'un', d::date
+    FROM generate_series(CURRENT_DATE - %(dias)s, CURRENT_DATE, interval '1 day') d
+    JOIN produtos p ON random() < 0.1
+    JOIN supermercados s ON random() < 0.25
+    ON CONFLICT DO NOTHING
+    """,
+    """
+    INSERT INTO melhores_ofertas_dia (data, id_produto, valor_minimo, supermercados, num_ofertas, ofertas)
+    SELECT data_validade, id_produto, min(valor), '{}', count(*), '[]'
+    FROM precos_historicos WHERE data_validade >= CURRENT_DATE - %(dias)s
+    GROUP BY data_validade, id_produto
+    ON CONFLICT DO NOTHING
+    """,
+    "ANALYZE supermercados",
+    "ANALYZE categorias",
+    "ANALYZE produtos",
+    "ANALYZE precos_historicos",
+    "ANALYZE melhores_ofertas_dia",
+]
+
+
+def consultas_quentes(id_produto):
+    """Retorna (nome, SQL, parâmetros, tabelas que não podem ter seq scan, de um só dia) das consultas quentes.
+
+    As ofertas são verificadas como a API as corre: a primeira página da
+    paginação por chave e a consulta sem LIMIT das ofertas em streaming.
+    As consultas de um só dia só podem ler uma partição de precos_historicos.
+    """
+    import acesso_dados
+    import armazenamento
+
+    hoje = 'CURRENT_DATE'
+    id_produto = str(id_produto)
+    consultas = []
+    filtros = [(('', '', ''), []), (('x', '', ''), ["'%produto 1a%'"]), (('', '1', '1'), ['1', '1'])]
+    for (busca, supermercado, categoria), params in filtros:
+        proibidas = {'precos_historicos', 'produtos'} if busca else {'precos_historicos'}
+        pagina = armazenamento.consulta_ofertas(busca, supermercado, categoria, paginada=True)
+        consultas.append((pagina, acesso_dados.CONSULTAS[pagina], [hoje, *params, "''", '0', '100'], proibidas, True))
+        fluxo = armazenamento.CONSULTA_OFERTAS_FLUXO + pagina[len('ofertas'):-len('_pagina')]
+        consultas.append((fluxo, armazenamento.sql_ofertas(busca, supermercado, categoria), [hoje, *params], proibidas, True))
+    for nome, params, proibidas, um_dia in [
+        (armazenamento.CONSULTA_HISTORICO_DIA, [id_produto, "CURRENT_DATE - 30", hoje], {'precos_historicos'}, False),
+        (armazenamento.CONSULTA_HISTORICO_RESUMIDO, [id_produto, "'mes'", "CURRENT_DATE - 365", hoje], {'historico_resumido'}, False),
+        (armazenamento.CONSULTA_PRODUTOS_EM_OFERTA, [hoje], {'precos_historicos', 'melhores_ofertas_dia'}, True),
+        (armazenamento.CONSULTA_TODAS_OFERTAS_PRODUTO, [hoje, id_produto], {'precos_historicos', 'melhores_ofertas_dia'}, True),
+    ]:
+        consultas.append((nome, acesso_dados.CONSULTAS[nome], params, proibidas, um_dia))
+    return consultas
+
+
+RE_PARTICAO = re.compile(r'^(precos_historicos)_(\d{4}_\d{2}|padrao)$')
+
+
+def _tabela_base(tabela):
+    """Nome da tabela particionada a que pertence uma partição (ou o próprio nome)."""
+    correspondencia = RE_PARTICAO.match(tabela or '')
+    return correspondencia.group(1) if correspondencia else tabela
+
+
+def _particoes(plano):
+    """Retorna as partições de precos_historicos lidas em qualquer nó do plano."""
+    particoes = set()
+    if RE_PARTICAO.match(plano.get('Relation Name') or ''):
+        particoes.add(plano['Relation Name'])
+    for filho in plano.get('Plans', []):
+        particoes |= _particoes(filho)
+    return particoes
+
+
+def _seq_scans(plano):
+    """Retorna as tabelas lidas com Seq Scan em qualquer nó do plano (partições pelo nome da tabela-mãe)."""
+    tabelas = []
+    if plano.get('Node Type') == 'Seq Scan':
+        tabelas.append(_tabela_base(plano.get('Relation Name')))
+    for filho in plano.get('Plans', []):
+        tabelas.extend(_seq_scans(filho))
+    return tabelas
+
+
+def verificar_planos(conn, semear=True, produtos=5000, supermercados=20, dias=60):
+    """Faz EXPLAIN às consultas quentes e retorna a lista de problemas encontrados.
+
+    Tudo corre numa transação que é desfeita no fim, incluindo os dados semeados.
+    """
+    problemas = []
+    cursor = conn.cursor()
+    try:
+        if semear:
+            parametros = {'produtos': produtos, 'supermercados': supermercados, 'dias': dias}
+            for comando in SEMEAR_DADOS:
+                cursor.execute(comando, parametros)
+        cursor.execute("SELECT COALESCE(min(id_produto), 0) FROM precos_historicos WHERE data_validade = CURRENT_DATE")
+        for nome, sql, params, proibidas, um_dia in consultas_quentes(cursor.fetchone()[0]):
+            cursor.execute(f"PREPARE {nome} AS {sql}")
+            argumentos = f" ({', '.join(params)})" if params else ''
+            cursor.execute(f"EXPLAIN (FORMAT JSON) EXECUTE {nome}{argumentos}")
+            plano = cursor.fetchone()[0]
+            if isinstance(plano, str):
+                plano = json.loads(plano)
+            lidas = set(_seq_scans(plano[0]['Plan']))
+            for tabela in sorted(lidas & proibidas):
+                problemas.append(f"{nome}: Seq Scan em {tabela}")
+            particoes = _particoes(plano[0]['Plan'])
+            if um_dia and len(particoes) > 1:
+                problemas.append(f"{nome}: lê {len(particoes)} partições de precos_historicos")
+            cursor.execute(f"DEALLOCATE {nome}")
+    finally:
+        conn.rollback()
+        cursor.close()
+    return problemas
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Aplica as migrações do esquema PostgreSQL.')
+    parser.add_argument('--ate', type=int, help='aplica só até esta versão')
+    parser.add_argument('--verificar-planos', action='store_true', help='verifica os planos das consultas quentes (não migra)')
+    parser.add_argument('--sem-semear', action='store_true', help='verifica os planos com os dados que já existem')
+    args = parser.parse_args()
+
+    database_url = os.environ.get('DATABASE_URL_EXT') or os.environ.get('DATABASE_URL')
+    if not database_url:
+        print("Erro: A variável de ambiente DATABASE_URL_EXT (ou DATABASE_URL) não foi definida.")
+        sys.exit(2)
+
+    conn = psycopg2.connect(database_url)
+    try:
+        if args.verificar_planos:
+            problemas = verificar_planos(conn, semear=not args.sem_semear)
+            for problema in problemas:
+                print(problema)
+            if problemas:
+                sys.exit(1)
+            print("Nenhuma consulta quente faz Seq Scan nas tabelas grandes.")
+        else:
+            aplicadas = aplicar_migracoes(conn, ate=args.ate)
+            if aplicadas:
+                print(f"Migrações aplicadas: {', '.join(map(str, aplicadas))}.")
+            print(f"Esquema na versão {versao_atual(conn)}.")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
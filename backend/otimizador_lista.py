@@ -0,0 +1,203 @@
+"""Otimização de uma lista de compras entre supermercados.
+
+Dado o preço de cada item em cada supermercado, calcula:
+
+* o total de cada supermercado (e quantos itens da lista ele tem);
+* o supermercado único mais barato entre os que têm a lista completa;
+* a divisão mais barata da lista por no máximo N supermercados, em que cada
+  item é comprado onde for mais barato entre os supermercados escolhidos.
+
+A divisão é um problema de localização de facilidades: não dá para escolher
+loja a loja de forma gulosa. A busca é um branch and bound sobre os
+supermercados. O limite inferior de um ramo é o maior de dois: a soma,
+item a item, do melhor preço entre as lojas já escolhidas e as que ainda
+podem entrar; e o custo atual menos as maiores poupanças individuais das
+lojas que ainda cabem. Lojas dominadas (outra tem todos os seus itens a
+preço igual ou menor) são descartadas logo de início. Uma solução gulosa,
+melhorada por trocas, serve de primeiro limite superior. Se a busca passar
+de `max_nos`, devolve a melhor solução encontrada com `exato=False`.
+"""
+INFINITO = float('inf')
+
+# Limite de nós explorados pelo branch and bound antes de desistir da prova de otimalidade
+MAX_NOS = 20_000
+
+
+def totais_por_loja(precos, lojas):
+    """Retorna {loja: (total, itens_encontrados)} para cada loja."""
+    totais = {}
+    for loja in lojas:
+        total = 0.0
+        encontrados = 0
+        for por_loja in precos:
+            valor = por_loja.get(loja)
+            if valor is not None:
+                total += valor
+                encontrados += 1
+        totais[loja] = (total, encontrados)
+    return totais
+
+
+def _dominadas(precos, lojas):
+    """Lojas que nunca precisam de entrar: outra loja cobre os mesmos itens a preço igual ou menor."""
+    dominadas = set()
+    for a in lojas:
+        for b in lojas:
+            if a == b or b in dominadas:
+                continue
+            if all(b in por_loja and por_loja[b] <= por_loja[a] for por_loja in precos if a in por_loja):
+                # Em caso de empate perfeito, fica a loja que aparece primeiro
+                if all(por_loja.get(a) == por_loja.get(b) for por_loja in precos) and lojas.index(a) < lojas.index(b):
+                    continue
+                dominadas.add(a)
+                break
+    return dominadas
+
+
+def _custo(precos, escolhidas):
+    total = 0.0
+    for por_loja in precos:
+        melhor = min((por_loja[loja] for loja in escolhidas if loja in por_loja), default=None)
+        if melhor is None:
+            return INFINITO
+        total += melhor
+    return total
+
+
+def _gulosa(precos, candidatas, max_lojas):
+    """Solução inicial: junta, uma a uma, a loja que mais baixa o custo (cobertura primeiro)."""
+    escolhidas = []
+    melhores = [INFINITO] * len(precos)
+    while len(escolhidas) < max_lojas:
+        melhor_loja, melhor_chave = None, None
+        for loja in candidatas:
+            if loja in escolhidas:
+                continue
+            descobertos = 0
+            custo = 0.0
+            for i, por_loja in enumerate(precos):
+                valor = min(melhores[i], por_loja.get(loja, INFINITO))
+                if valor == INFINITO:
+                    descobertos += 1
+                else:
+                    custo += valor
+            chave = (descobertos, custo)
+            if melhor_chave is None or chave < melhor_chave:
+                melhor_loja, melhor_chave = loja, chave
+        if melhor_loja is None:
+            break
+        escolhidas.append(melhor_loja)
+        melhores = [min(m, por_loja.get(melhor_loja, INFINITO)) for m, por_loja in zip(melhores, precos)]
+    return _trocas(precos, candidatas, escolhidas)
+
+
+def _trocas(precos, candidatas, escolhidas):
+    """Melhora uma solução trocando uma loja escolhida por outra enquanto o total baixar."""
+    total = _custo(precos, escolhidas)
+    melhorou = True
+    while melhorou:
+        melhorou = False
+        for posicao in range(len(escolhidas)):
+            for loja in candidatas:
+                if loja in escolhidas:
+                    continue
+                tentativa = escolhidas[:posicao] + [loja] + escolhidas[posicao + 1:]
+                custo = _custo(precos, tentativa)
+                if custo < total - 1e-9:
+                    escolhidas, total, melhorou = tentativa, custo, True
+    return escolhidas, total
+
+
+def melhor_divisao(precos, max_lojas=None, max_nos=MAX_NOS):
+    """Escolhe até `max_lojas` lojas que minimizam o total da lista.
+
+    `precos` é uma lista (um elemento por item) de {loja: valor}; todos os
+    itens têm de ter pelo menos uma oferta. Retorna (lojas escolhidas,
+    total, exato, nós explorados). Sem solução viável (nenhum conjunto de
+    até `max_lojas` lojas cobre a lista) retorna ([], inf, True, nós).
+    """
+    lojas = sorted({loja for por_loja in precos for loja in por_loja}, key=str)
+    if not precos:
+        return [], 0.0, True, 0
+    if max_lojas is None or max_lojas >= len(lojas):
+        # Sem limite, cada item vai para a loja mais barata
+        escolhidas = sorted({min(por_loja, key=lambda loja: (por_loja[loja], str(loja))) for por_loja in precos}, key=str)
+        return escolhidas, _custo(precos, escolhidas), True, 0
+
+    dominadas = _dominadas(precos, lojas)
+    candidatas = [loja for loja in lojas if loja not in dominadas]
+    # As lojas com menor total (contando só o que têm) são exploradas primeiro
+    totais = totais_por_loja(precos, candidatas)
+    candidatas.sort(key=lambda loja: (-totais[loja][1], totais[loja][0]))
+
+    melhor_escolha, melhor_total = _gulosa(precos, candidatas, max_lojas)
+
+    # Matriz de preços por candidata (INFINITO onde a loja não tem o item)
+    n_itens = len(precos)
+    matriz = [[por_loja.get(loja, INFINITO) for por_loja in precos] for loja in candidatas]
+    # Só os itens que cada candidata tem: (posição do item, preço)
+    ofertas_loja = [[(i, p) for i, p in enumerate(linha) if p < INFINITO] for linha in matriz]
+    # minimo_restante[k][i]: menor preço do item i nas candidatas k, k+1, ...
+    minimo_restante = [[INFINITO] * n_itens for _ in range(len(candidatas) + 1)]
+    for k in range(len(candidatas) - 1, -1, -1):
+        minimo_restante[k] = list(map(min, minimo_restante[k + 1], matriz[k]))
+
+    nos = 0
+    exato = True
+
+    def limite_inferior(k, vagas, melhores):
+        """Menor total possível a partir deste nó, com no máximo `vagas` lojas a mais.
+
+        Os itens ainda sem loja custam pelo menos o menor preço entre as
+        restantes. Para os já cobertos, juntar várias lojas poupa no máximo a
+        soma do que cada uma pouparia sozinha, por isso só contam as `vagas`
+        maiores poupanças individuais.
+        """
+        restante = minimo_restante[k]
+        cobertos = 0.0
+        descobertos = 0.0
+        simples = 0.0
+        for m, r in zip(melhores, restante):
+            if m == INFINITO:
+                descobertos += r
+            else:
+                cobertos += m
+            simples += m if m < r else r
+        if simples >= melhor_total - 1e-9:
+            return simples
+        poupancas = []
+        for ofertas in ofertas_loja[k:]:
+            poupanca = 0.0
+            for i, p in ofertas:
+                m = melhores[i]
+                if p < m < INFINITO:
+                    poupanca += m - p
+            poupancas.append(poupanca)
+        poupancas.sort(reverse=True)
+        return max(simples, cobertos - sum(poupancas[:vagas]) + descobertos)
+
+    def buscar(k, escolhidas, melhores):
+        nonlocal melhor_escolha, melhor_total, nos, exato
+        nos += 1
+        if nos > max_nos:
+            exato = False
+            return
+        custo_atual = sum(melhores)
+        if custo_atual < melhor_total:
+            melhor_escolha, melhor_total = list(escolhidas), custo_atual
+        vagas = max_lojas - len(escolhidas)
+        if vagas == 0 or k == len(candidatas):
+            return
+        if limite_inferior(k, vagas, melhores) >= melhor_total - 1e-9:
+            return
+        # Ramo 1: a loja k entra
+        escolhidas.append(candidatas[k])
+        buscar(k + 1, escolhidas, list(map(min, melhores, matriz[k])))
+        escolhidas.pop()
+        # Ramo 2: a loja k fica de fora
+        buscar(k + 1, escolhidas, melhores)
+
+    buscar(0, [], [INFINITO] * n_itens)
+    if melhor_total == INFINITO:
+        return [], INFINITO, exato, nos
+    return sorted(melhor_escolha, key=str), melhor_total, exato, nos
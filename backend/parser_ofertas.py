@@ -0,0 +1,179 @@
+"""Parser das linhas de ofertas coladas no painel do administrador.
+
+Cada linha tem 5 colunas separadas por TAB:
+
+    validade    supermercado    produto (obs)    R$ x,xx unidade    categoria
+
+A validade é um dia (`02/05/2025`) ou um intervalo de dias no mesmo mês
+(`1-31/05/2025`), e a linha vale uma oferta por cada dia do intervalo.
+
+Numa folha real as mesmas validades, preços e nomes de produto repetem-se
+milhares de vezes, por isso as partes caras (expansão de datas, preço e
+observações) ficam em cache. Há duas formas de uso:
+
+* `analisar_linha()` normaliza uma linha ou levanta `LinhaInvalida`;
+* `analisar_lote()` processa muitas linhas e devolve as ofertas em colunas
+  (uma lista por campo) junto com o relatório das linhas rejeitadas.
+"""
+from collections import Counter, namedtuple
+from datetime import date
+from functools import lru_cache
+import re
+
+RE_VALIDADE = re.compile(r'^(\d{1,2})(?:\s*-\s*(\d{1,2}))?/(\d{1,2})/(\d{4})$')
+RE_NUMERO = re.compile(r'[\d.,]+')
+RE_PRECO = re.compile(r'R\$\s*[\d.,]+')
+RE_OBSERVACAO = re.compile(r'\((.*?)\)')
+RE_PARENTESES = re.compile(r'\s*\(.*?\)\s*')
+
+# Motivos de rejeição (estáveis, para poderem ser agregados nos relatórios)
+SEM_TAB = 'linha sem separador TAB'
+POUCAS_COLUNAS = 'menos de 5 colunas'
+DATA_INVALIDA = 'data de validade inválida'
+VALOR_INVALIDO = 'valor inválido'
+CAMPO_EM_BRANCO = 'supermercado, produto ou categoria em branco'
+
+# Quantas rejeições são guardadas em detalhe (as restantes só são contadas)
+MAX_REJEICOES_DETALHADAS = 50
+
+Oferta = namedtuple('Oferta', 'datas supermercado categoria produto valor unidade observacoes')
+
+
+class LinhaInvalida(ValueError):
+    """A linha não segue o formato esperado; `motivo` diz porquê."""
+
+    def __init__(self, motivo):
+        super().__init__(motivo)
+        self.motivo = motivo
+
+
+class RelatorioRejeicoes:
+    """Linhas rejeitadas: total, contagem por motivo e uma amostra com o conteúdo."""
+
+    def __init__(self, max_detalhes=MAX_REJEICOES_DETALHADAS):
+        self.total = 0
+        self.por_motivo = Counter()
+        self.amostra = []
+        self.max_detalhes = max_detalhes
+
+    def registrar(self, numero, linha, motivo):
+        self.total += 1
+        self.por_motivo[motivo] += 1
+        if len(self.amostra) < self.max_detalhes:
+            self.amostra.append({'linha': numero, 'motivo': motivo, 'conteudo': linha[:200]})
+
+    def como_dict(self):
+        return {'total': self.total, 'por_motivo': dict(self.por_motivo), 'amostra': self.amostra}
+
+
+class LoteOfertas:
+    """Ofertas de um lote em formato de colunas: uma entrada por dia de validade.
+
+    `linhas` guarda o número da linha de origem de cada oferta, o que permite
+    desempatar ofertas repetidas (vale a última).
+    """
+    __slots__ = ('linhas', 'datas', 'supermercados', 'categorias', 'produtos',
+                 'valores', 'unidades', 'observacoes', 'total_linhas', 'rejeicoes')
+
+    def __init__(self, rejeicoes=None):
+        self.linhas = []
+        self.datas = []
+        self.supermercados = []
+        self.categorias = []
+        self.produtos = []
+        self.valores = []
+        self.unidades = []
+        self.observacoes = []
+        self.total_linhas = 0
+        self.rejeicoes = rejeicoes if rejeicoes is not None else RelatorioRejeicoes()
+
+    def __len__(self):
+        return len(self.datas)
+
+
+@lru_cache(maxsize=4096)
+def expandir_validade(texto):
+    """Converte `02/05/2025` ou `1-31/05/2025` numa tupla de datas."""
+    m = RE_VALIDADE.match(texto)
+    if not m:
+        raise LinhaInvalida(DATA_INVALIDA)
+    dia_inicio, dia_fim, mes, ano = m.groups()
+    inicio = int(dia_inicio)
+    fim = int(dia_fim) if dia_fim else inicio
+    mes, ano = int(mes), int(ano)
+    try:
+        datas = tuple(date(ano, mes, dia) for dia in range(inicio, fim + 1))
+    except ValueError:
+        raise LinhaInvalida(DATA_INVALIDA)
+    if not datas:
+        raise LinhaInvalida(DATA_INVALIDA)
+    return datas
+
+
+@lru_cache(maxsize=8192)
+def analisar_valor(texto):
+    """Converte `R$ 4,99 un` em (4.99, 'un')."""
+    m = RE_NUMERO.search(texto)
+    if not m:
+        raise LinhaInvalida(VALOR_INVALIDO)
+    try:
+        valor = float(m.group().replace('.', '').replace(',', '.'))
+    except ValueError:
+        raise LinhaInvalida(VALOR_INVALIDO)
+    return valor, RE_PRECO.sub('', texto).strip()
+
+
+@lru_cache(maxsize=16384)
+def analisar_produto(texto):
+    """Separa `Arroz (5kg)` em ('Arroz', '5kg'); sem parênteses a observação é None."""
+    m = RE_OBSERVACAO.search(texto)
+    observacoes = m.group(1) if m else None
+    return RE_PARENTESES.sub('', texto).strip(), observacoes
+
+
+def analisar_linha(linha):
+    """Normaliza uma linha do panfleto numa `Oferta` ou levanta `LinhaInvalida`."""
+    colunas = linha.split('\t')
+    if len(colunas) < 5:
+        raise LinhaInvalida(SEM_TAB if len(colunas) == 1 else POUCAS_COLUNAS)
+    validade, supermercado, produto_raw, valor_raw, categoria = [c.strip() for c in colunas[:5]]
+
+    datas = expandir_validade(validade)
+    valor, unidade = analisar_valor(valor_raw)
+    produto, observacoes = analisar_produto(produto_raw)
+    if not supermercado or not produto or not categoria:
+        raise LinhaInvalida(CAMPO_EM_BRANCO)
+    return Oferta(datas, supermercado, categoria, produto, valor, unidade, observacoes)
+
+
+def analisar_lote(linhas, primeira_linha=1, rejeicoes=None):
+    """Analisa um conjunto de linhas e devolve um `LoteOfertas` em colunas.
+
+    Linhas em branco são ignoradas; as restantes linhas inválidas ficam no
+    relatório `lote.rejeicoes` (que pode ser partilhado entre lotes).
+    """
+    lote = LoteOfertas(rejeicoes)
+    registrar = lote.rejeicoes.registrar
+    col_linhas, col_datas = lote.linhas, lote.datas
+    col_supermercados, col_categorias, col_produtos = lote.supermercados, lote.categorias, lote.produtos
+    col_valores, col_unidades, col_observacoes = lote.valores, lote.unidades, lote.observacoes
+
+    for numero, linha in enumerate(linhas, start=primeira_linha):
+        if not linha or linha.isspace():
+            continue
+        lote.total_linhas += 1
+        try:
+            oferta = analisar_linha(linha)
+        except LinhaInvalida as e:
+            registrar(numero, linha, e.motivo)
+            continue
+        n = len(oferta.datas)
+        col_linhas.extend([numero] * n)
+        col_datas.extend(oferta.datas)
+        col_supermercados.extend([oferta.supermercado] * n)
+        col_categorias.extend([oferta.categoria] * n)
+        col_produtos.extend([oferta.produto] * n)
+        col_valores.extend([oferta.valor] * n)
+        col_unidades.extend([oferta.unidade] * n)
+        col_observacoes.extend([oferta.observacoes] * n)
+    return lote
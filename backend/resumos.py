@@ -0,0 +1,172 @@
+"""Tabelas derivadas de `precos_historicos`, atualizadas depois de cada importação.
+
+`melhores_ofertas_dia` guarda, por dia e produto, o menor preço, os
+supermercados que o praticam, o número de ofertas e a lista completa de
+ofertas ordenada por preço. Os endpoints de "produtos em oferta" leem daqui
+em vez de calcular o mínimo com uma subconsulta correlacionada a cada pedido.
+
+`historico_resumido` guarda, por produto, supermercado e semana ou mês de
+validade, o preço mínimo, médio e máximo. O histórico de um produto em
+intervalos longos lê daqui em vez de percorrer todas as suas ofertas.
+
+Só os dias tocados por uma importação são recalculados; no histórico, só os
+períodos dos produtos que ela gravou (anotados em `historico_pendente`).
+
+O SQLite (ver armazenamento_sqlite.py) segue os mesmos passos com
+`atualizar_resumos_sqlite`: as consultas que usam arrays, jsonb_agg ou
+date_trunc têm uma versão `_SQLITE`, as restantes são as mesmas.
+"""
+import json
+
+APAGAR_MELHORES_OFERTAS = "DELETE FROM melhores_ofertas_dia WHERE data = ANY(%s::date[])"
+
+CALCULAR_MELHORES_OFERTAS = """
+    INSERT INTO melhores_ofertas_dia (data, id_produto, valor_minimo, supermercados, num_ofertas, ofertas)
+    SELECT data_validade, id_produto,
+           min(valor),
+           array_agg(supermercado_nome ORDER BY supermercado_nome) FILTER (WHERE valor = minimo),
+           count(*),
+           jsonb_agg(jsonb_build_object('valor', valor, 'supermercado_nome', supermercado_nome, 'id_supermercado', id_supermercado)
+                     ORDER BY valor, supermercado_nome)
+    FROM (
+        SELECT ph.data_validade, ph.id_produto, ph.valor, s.id AS id_supermercado, s.nome AS supermercado_nome,
+               min(ph.valor) OVER (PARTITION BY ph.data_validade, ph.id_produto) AS minimo
+        FROM precos_historicos ph
+        JOIN supermercados s ON ph.id_supermercado = s.id
+        WHERE ph.data_validade = ANY(%s::date[])
+    ) ofertas
+    GROUP BY data_validade, id_produto
+"""
+
+
+# O SQLite só aceita ORDER BY dentro dos agregados a partir da 3.44: a ordem das listas vem de uma janela
+APAGAR_MELHORES_OFERTAS_SQLITE = "DELETE FROM melhores_ofertas_dia WHERE data IN (SELECT value FROM json_each(?))"
+
+CALCULAR_MELHORES_OFERTAS_SQLITE = """
+    INSERT INTO melhores_ofertas_dia (data, id_produto, valor_minimo, supermercados, num_ofertas, ofertas)
+    SELECT data_validade, id_produto, minimo, supermercados, num_ofertas, ofertas
+    FROM (
+        SELECT data_validade, id_produto, minimo,
+               json_group_array(supermercado_nome) FILTER (WHERE valor = minimo) OVER janela AS supermercados,
+               count(*) OVER janela AS num_ofertas,
+               json_group_array(json_object('valor', valor, 'supermercado_nome', supermercado_nome,
+                                            'id_supermercado', id_supermercado)) OVER janela AS ofertas,
+               row_number() OVER janela AS ordem
+        FROM (
+            SELECT ph.data_validade, ph.id_produto, ph.valor, s.id AS id_supermercado, s.nome AS supermercado_nome,
+                   min(ph.valor) OVER (PARTITION BY ph.data_validade, ph.id_produto) AS minimo
+            FROM precos_historicos ph
+            JOIN supermercados s ON ph.id_supermercado = s.id
+            WHERE ph.data_validade IN (SELECT value FROM json_each(?))
+        )
+        WINDOW janela AS (PARTITION BY data_validade, id_produto ORDER BY valor, supermercado_nome
+                          ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)
+    )
+    WHERE ordem = 1
+"""
+
+
+def atualizar_melhores_ofertas(cursor, datas):
+    """Recalcula `melhores_ofertas_dia` para os dias indicados (na transação atual)."""
+    datas = sorted(set(datas))
+    if not datas:
+        return
+    cursor.execute(APAGAR_MELHORES_OFERTAS, (datas,))
+    cursor.execute(CALCULAR_MELHORES_OFERTAS, (datas,))
+
+
+# Granularidades de historico_resumido e a unidade correspondente de date_trunc
+GRANULARIDADES_RESUMIDAS = {'semana': 'week', 'mes': 'month'}
+
+TABELA_PERIODOS_PENDENTES = """
+    CREATE TEMP TABLE IF NOT EXISTS periodos_pendentes (
+        id_produto INTEGER NOT NULL,
+        granularidade TEXT NOT NULL,
+        periodo DATE NOT NULL,
+        fim DATE NOT NULL
+    )
+"""
+
+CRIAR_PERIODOS_PENDENTES = TABELA_PERIODOS_PENDENTES + " ON COMMIT DELETE ROWS"
+
+# Consome as anotações de historico_pendente e converte-as nos períodos a recalcular
+RECOLHER_PERIODOS_PENDENTES = """
+    WITH pendentes AS (
+        DELETE FROM historico_pendente RETURNING id_produto, data
+    )
+    INSERT INTO periodos_pendentes (id_produto, granularidade, periodo, fim)
+    SELECT DISTINCT p.id_produto, g.granularidade, date_trunc(g.unidade, p.data)::date,
+           (date_trunc(g.unidade, p.data) + ('1 ' || g.unidade)::interval)::date
+    FROM pendentes p
+    CROSS JOIN unnest(%s::text[], %s::text[]) AS g (granularidade, unidade)
+"""
+
+# As semanas começam à segunda-feira, como em date_trunc('week')
+RECOLHER_PERIODOS_PENDENTES_SQLITE = """
+    INSERT INTO periodos_pendentes (id_produto, granularidade, periodo, fim)
+    SELECT id_produto, 'semana', date(data, '-6 days', 'weekday 1'), date(data, '-6 days', 'weekday 1', '+7 days')
+    FROM historico_pendente
+    UNION
+    SELECT id_produto, 'mes', date(data, 'start of month'), date(data, 'start of month', '+1 month')
+    FROM historico_pendente
+"""
+
+# Os períodos pendentes são apagados antes de recalculados: um período cujas ofertas foram
+# todas retiradas (ou as de um supermercado) não voltaria a aparecer no INSERT
+APAGAR_HISTORICO_RESUMIDO = """
+    DELETE FROM historico_resumido
+    WHERE EXISTS (
+        SELECT 1 FROM periodos_pendentes pp
+        WHERE pp.id_produto = historico_resumido.id_produto
+          AND pp.granularidade = historico_resumido.granularidade
+          AND pp.periodo = historico_resumido.periodo
+    )
+"""
+
+CALCULAR_HISTORICO_RESUMIDO = """
+    INSERT INTO historico_resumido (id_produto, granularidade, periodo, id_supermercado,
+                                    valor_minimo, valor_medio, valor_maximo, num_dias)
+    SELECT pp.id_produto, pp.granularidade, pp.periodo, ph.id_supermercado,
+           min(ph.valor), avg(ph.valor), max(ph.valor), count(*)
+    FROM periodos_pendentes pp
+    JOIN precos_historicos ph ON ph.id_produto = pp.id_produto
+                             AND ph.data_validade >= pp.periodo AND ph.data_validade < pp.fim
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (id_produto, granularidade, periodo, id_supermercado) DO UPDATE
+    SET valor_minimo = EXCLUDED.valor_minimo,
+        valor_medio = EXCLUDED.valor_medio,
+        valor_maximo = EXCLUDED.valor_maximo,
+        num_dias = EXCLUDED.num_dias
+"""
+
+
+def atualizar_historico_resumido(cursor):
+    """Recalcula (na transação atual) os períodos de `historico_resumido` anotados como pendentes."""
+    cursor.execute(CRIAR_PERIODOS_PENDENTES)
+    cursor.execute(RECOLHER_PERIODOS_PENDENTES,
+                   (list(GRANULARIDADES_RESUMIDAS), list(GRANULARIDADES_RESUMIDAS.values())))
+    if cursor.rowcount:
+        cursor.execute("ANALYZE periodos_pendentes")
+        cursor.execute(APAGAR_HISTORICO_RESUMIDO)
+        cursor.execute(CALCULAR_HISTORICO_RESUMIDO)
+
+
+def atualizar_resumos_sqlite(cursor):
+    """Recalcula as duas tabelas para os (produto, dia) de `historico_pendente`, no SQLite.
+
+    Consome as anotações e retorna os dias recalculados.
+    """
+    datas = [data for (data,) in cursor.execute("SELECT DISTINCT data FROM historico_pendente ORDER BY data")]
+    if not datas:
+        return []
+    dias = json.dumps([data.isoformat() for data in datas])
+    cursor.execute(APAGAR_MELHORES_OFERTAS_SQLITE, (dias,))
+    cursor.execute(CALCULAR_MELHORES_OFERTAS_SQLITE, (dias,))
+
+    cursor.execute(TABELA_PERIODOS_PENDENTES)
+    cursor.execute("DELETE FROM periodos_pendentes")
+    cursor.execute(RECOLHER_PERIODOS_PENDENTES_SQLITE)
+    cursor.execute("DELETE FROM historico_pendente")
+    cursor.execute(APAGAR_HISTORICO_RESUMIDO)
+    cursor.execute(CALCULAR_HISTORICO_RESUMIDO)
+    return datas
@@ -0,0 +1,308 @@
+"""Importações assíncronas: o envio vira uma tarefa processada em segundo plano.
+
+O POST de /api/importar só grava o conteúdo na base (em blocos de linhas,
+sem o carregar inteiro em memória) e responde logo com o id da tarefa. Uma
+thread de trabalho dentro da aplicação vai buscar tarefas pendentes e
+importa-as bloco a bloco, confirmando (commit) cada bloco junto com o
+progresso. Como o estado fica em `importacoes`, uma tarefa interrompida por
+um reinício é retomada a partir do último bloco confirmado.
+
+O conteúdo é identificado pelo seu hash SHA-256: reenviar a mesma folha
+devolve a tarefa já existente sem importar nada de novo.
+
+Uma folha autoritativa substitui, para cada supermercado que traz, tudo o
+que estava gravado entre a primeira e a última data dela: no fim, as
+ofertas que não vieram na folha são retiradas.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from psycopg2.extras import RealDictCursor
+
+import acesso_dados
+import armazenamento
+import autocompletar
+import cache
+import metricas
+from importacao import FolhaRecebida, importar_linhas, retirar_ausentes
+from resumos import atualizar_melhores_ofertas, atualizar_historico_resumido
+
+logger = logging.getLogger(__name__)
+
+# Linhas por bloco: cada bloco é gravado, importado e confirmado de uma vez
+LINHAS_POR_BLOCO = int(os.environ.get('IMPORTACAO_LINHAS_POR_BLOCO', '2000'))
+# Segundos entre verificações de tarefas pendentes quando não há aviso de nova tarefa
+INTERVALO_VERIFICACAO = float(os.environ.get('IMPORTACAO_INTERVALO', '5'))
+# Uma tarefa "importando" sem progresso há mais tempo que isto é considerada abandonada
+PRAZO_ABANDONO = int(os.environ.get('IMPORTACAO_PRAZO_ABANDONO', '300'))
+# Meses (a contar do atual) com partição de precos_historicos criada antes de cada importação
+PARTICOES_FUTURAS = int(os.environ.get('IMPORTACAO_PARTICOES_FUTURAS', '3'))
+# Quantas linhas rejeitadas são guardadas em detalhe por tarefa
+MAX_ERROS_DETALHADOS = 50
+
+# Contadores do resultado de uma tarefa; os retirados só são contados no fim
+CONTADORES = ('ofertas', 'inseridos', 'atualizados', 'inalterados', 'rejeitados', 'retirados')
+
+PENDENTE = 'pendente'
+IMPORTANDO = 'importando'
+RESUMOS = 'resumos'
+CONCLUIDA = 'concluida'
+ERRO = 'erro'
+
+REIVINDICAR_TAREFA = """
+    UPDATE importacoes SET etapa = %s, atualizada_em = now()
+    WHERE id = (
+        SELECT id FROM importacoes
+        WHERE etapa = %s OR (etapa = ANY(%s) AND atualizada_em < now() - make_interval(secs => %s))
+        ORDER BY id
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, blocos_processados
+"""
+
+
+def _blocos_da_folha(linhas):
+    """Agrupa as linhas em blocos de até LINHAS_POR_BLOCO linhas com conteúdo.
+
+    Gera (número da primeira linha na folha, linhas). As linhas em branco
+    entre blocos são saltadas; as que ficam no meio de um bloco são mantidas
+    (vazias), para a numeração das rejeições continuar a ser a da folha.
+    """
+    bloco = []
+    primeira_linha = com_conteudo = em_branco = 0
+    for numero, linha in enumerate(linhas, start=1):
+        if not linha.strip():
+            em_branco += 1
+            continue
+        if bloco:
+            bloco.extend([''] * em_branco)
+        else:
+            primeira_linha = numero
+        em_branco = 0
+        bloco.append(linha)
+        com_conteudo += 1
+        if com_conteudo >= LINHAS_POR_BLOCO:
+            yield primeira_linha, bloco
+            bloco = []
+            com_conteudo = 0
+    if bloco:
+        yield primeira_linha, bloco
+
+
+def criar_tarefa(conn, linhas, autoritativa=False):
+    """Grava as linhas enviadas como uma nova tarefa e retorna (id, nova).
+
+    O hash do conteúdo é calculado antes de gravar: se já existir uma tarefa
+    com o mesmo conteúdo, nada é gravado e é devolvido o id dessa tarefa com
+    `nova=False`. Retorna (None, False) se não houver nenhuma linha com
+    conteúdo.
+    """
+    with FolhaRecebida(linhas, autoritativa) as folha:
+        if not folha.total_linhas:
+            return None, False
+        cursor = conn.cursor()
+        try:
+            existente = _tarefa_por_hash(cursor, folha.hash)
+            if existente is None:
+                # Se outro pedido gravar o mesmo conteúdo ao mesmo tempo, este espera pelo
+                # commit dele e não insere nada
+                cursor.execute("""
+                    INSERT INTO importacoes (etapa, autoritativa, hash_conteudo, total_linhas) VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (hash_conteudo) DO NOTHING
+                    RETURNING id
+                """, (PENDENTE, autoritativa, folha.hash, folha.total_linhas))
+                row = cursor.fetchone()
+                if row is not None:
+                    id_tarefa = row[0]
+                    blocos = 0
+                    for primeira_linha, bloco in _blocos_da_folha(folha.linhas()):
+                        cursor.execute("""
+                            INSERT INTO importacoes_blocos (id_importacao, ordem, primeira_linha, conteudo) VALUES (%s, %s, %s, %s)
+                        """, (id_tarefa, blocos, primeira_linha, '\n'.join(bloco)))
+                        blocos += 1
+                    cursor.execute("UPDATE importacoes SET total_blocos = %s WHERE id = %s", (blocos, id_tarefa))
+                    conn.commit()
+                    return id_tarefa, True
+                conn.rollback()
+                existente = _tarefa_por_hash(cursor, folha.hash)
+
+            # Reenviar uma folha cuja importação falhou volta a pô-la na fila
+            cursor.execute("UPDATE importacoes SET etapa = %s, atualizada_em = now() WHERE id = %s AND etapa = %s",
+                           (PENDENTE, existente, ERRO))
+            conn.commit()
+            return existente, False
+        finally:
+            cursor.close()
+
+
+def _tarefa_por_hash(cursor, digest):
+    cursor.execute("SELECT id FROM importacoes WHERE hash_conteudo = %s", (digest,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def obter_tarefa(conn, id_tarefa):
+    """Retorna o estado de uma tarefa (ou None se não existir)."""
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    cursor.execute("""
+        SELECT id, etapa, autoritativa, total_linhas, linhas_processadas, total_blocos, blocos_processados,
+               resultado, erros, criada_em, atualizada_em
+        FROM importacoes WHERE id = %s
+    """, (id_tarefa,))
+    tarefa = cursor.fetchone()
+    cursor.close()
+    return tarefa
+
+
+def processar_tarefa(conn, id_tarefa, bloco_inicial):
+    """Importa os blocos de uma tarefa a partir de `bloco_inicial`, um commit por bloco."""
+    cursor = conn.cursor()
+    inicio = time.perf_counter()
+    try:
+        cursor.execute("SELECT total_blocos, linhas_processadas, resultado, erros, autoritativa FROM importacoes WHERE id = %s", (id_tarefa,))
+        total_blocos, linhas_processadas, resultado, erros, autoritativa = cursor.fetchone()
+        linhas_inicio = linhas_processadas
+        resultado = resultado or {}
+        for chave in CONTADORES:
+            resultado.setdefault(chave, 0)
+        # Criar uma partição bloqueia a tabela até ao commit: as dos próximos meses são
+        # criadas já, numa transação curta, e não a meio de um bloco
+        cursor.execute("""
+            SELECT garantir_particoes_precos(ARRAY(
+                SELECT (date_trunc('month', CURRENT_DATE) + make_interval(months => i))::date
+                FROM generate_series(0, %s) AS i))
+        """, (PARTICOES_FUTURAS,))
+        conn.commit()
+
+        for ordem in range(bloco_inicial, total_blocos):
+            cursor.execute("SELECT conteudo, primeira_linha FROM importacoes_blocos WHERE id_importacao = %s AND ordem = %s",
+                           (id_tarefa, ordem))
+            conteudo, primeira_linha = cursor.fetchone()
+            linhas = conteudo.split('\n')
+
+            # Os blocos gravados antes da migração 11 não têm primeira_linha nem linhas em branco
+            resumo = importar_linhas(conn, linhas, primeira_linha=primeira_linha or linhas_processadas + 1,
+                                     autoritativa=id_tarefa if autoritativa else None)
+            linhas_processadas += resumo.linhas
+            for chave in ('ofertas', 'inseridos', 'atualizados', 'inalterados', 'rejeitados'):
+                resultado[chave] += getattr(resumo, chave)
+            erros = (erros + resumo.rejeicoes.amostra)[:MAX_ERROS_DETALHADOS]
+            metricas.contar_linhas_importacao(inseridas=resumo.inseridos, atualizadas=resumo.atualizados,
+                                              inalteradas=resumo.inalterados, rejeitadas=resumo.rejeitados)
+
+            # Os dados do bloco e o progresso são confirmados na mesma transação
+            cursor.execute("""
+                UPDATE importacoes
+                SET blocos_processados = %s, linhas_processadas = %s, resultado = %s, erros = %s,
+                    datas_afetadas = ARRAY(SELECT DISTINCT unnest(datas_afetadas || %s::date[]) ORDER BY 1),
+                    atualizada_em = now()
+                WHERE id = %s
+            """, (ordem + 1, linhas_processadas, json.dumps(resultado), json.dumps(erros), sorted(resumo.datas), id_tarefa))
+            cache.registrar_alteracoes(cursor, resumo.datas)
+            conn.commit()
+            cache.versoes.expirar()
+
+        # Com todos os blocos gravados, uma folha autoritativa retira as ofertas que não trouxe
+        with metricas.medir_etapa('retirada'):
+            retiradas, datas_retiradas = retirar_ausentes(cursor, id_tarefa)
+        metricas.contar_linhas_importacao(retiradas=retiradas)
+        if retiradas:
+            resultado['retirados'] += retiradas
+            cache.registrar_alteracoes(cursor, datas_retiradas)
+
+        # e recalculam-se as tabelas derivadas dos dias tocados
+        cursor.execute("""
+            UPDATE importacoes
+            SET etapa = %s, resultado = %s, atualizada_em = now(),
+                datas_afetadas = ARRAY(SELECT DISTINCT unnest(datas_afetadas || %s::date[]) ORDER BY 1)
+            WHERE id = %s
+            RETURNING datas_afetadas
+        """, (RESUMOS, json.dumps(resultado), datas_retiradas, id_tarefa))
+        datas_afetadas = cursor.fetchone()[0]
+        conn.commit()
+        cache.versoes.expirar()
+        with metricas.medir_etapa('resumos'):
+            atualizar_melhores_ofertas(cursor, datas_afetadas)
+            atualizar_historico_resumido(cursor)
+        cache.registrar_alteracoes(cursor, datas_afetadas, catalogo=False)
+
+        cursor.execute("UPDATE importacoes SET etapa = %s, atualizada_em = now() WHERE id = %s", (CONCLUIDA, id_tarefa))
+        # O conteúdo já não é preciso: o hash continua a garantir a idempotência
+        cursor.execute("DELETE FROM importacoes_blocos WHERE id_importacao = %s", (id_tarefa,))
+        conn.commit()
+        cache.versoes.expirar()
+        duracao = time.perf_counter() - inicio
+        linhas = linhas_processadas - linhas_inicio
+        logger.info("Tarefa %s concluída: %d linhas em %.1f s (%.0f linhas/s), %s",
+                    id_tarefa, linhas, duracao, linhas / duracao if duracao else 0, resultado)
+    except Exception as e:
+        conn.rollback()
+        cursor.execute("""
+            UPDATE importacoes SET etapa = %s, erros = erros || %s::jsonb, atualizada_em = now() WHERE id = %s
+        """, (ERRO, json.dumps([{'motivo': f'Erro no servidor: {e}'}]), id_tarefa))
+        conn.commit()
+        logger.exception("Erro ao importar (tarefa %s)", id_tarefa)
+    finally:
+        cursor.close()
+
+
+def reivindicar_tarefa(conn):
+    """Marca a próxima tarefa pendente (ou abandonada) como em curso e retorna (id, bloco)."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(REIVINDICAR_TAREFA, (IMPORTANDO, PENDENTE, [IMPORTANDO, RESUMOS], PRAZO_ABANDONO))
+        row = cursor.fetchone()
+        conn.commit()
+        return row
+    finally:
+        cursor.close()
+
+
+class Trabalhador:
+    """Thread de fundo que processa as tarefas de importação, uma de cada vez."""
+
+    def __init__(self):
+        self._aviso = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def iniciar(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._ciclo, name='importacoes', daemon=True)
+                self._thread.start()
+
+    def avisar(self):
+        """Acorda o trabalhador porque chegou uma tarefa nova."""
+        self.iniciar()
+        self._aviso.set()
+
+    def _ciclo(self):
+        while True:
+            self._aviso.clear()
+            try:
+                with acesso_dados.get_pool().conexao() as conn:
+                    while True:
+                        tarefa = reivindicar_tarefa(conn)
+                        if tarefa is None:
+                            break
+                        processar_tarefa(conn, *tarefa)
+                        # Os produtos novos ficam logo no índice do autocompletar deste processo
+                        autocompletar.indice.atualizar(armazenamento.ArmazenamentoPostgres(conn))
+                        conn.rollback()
+            except Exception:
+                logger.exception("Erro no trabalhador de importações")
+            self._aviso.wait(INTERVALO_VERIFICACAO)
+
+
+trabalhador = Trabalhador()
+
+
+def init_app(app):
+    """Arranca o trabalhador com a aplicação (desligável com IMPORTACAO_TRABALHADOR=0)."""
+    if os.environ.get('IMPORTACAO_TRABALHADOR', '1') != '0':
+        trabalhador.iniciar()
@@ -0,0 +1,71 @@
+"""A aplicação com o armazenamento SQLite num ficheiro temporário, limpo antes de cada teste.
+
+Os testes do PostgreSQL usam a base de DATABASE_URL (com as migrações
+aplicadas) e são saltados quando ela não está definida.
+"""
+import os
+import tempfile
+
+import pytest
+
+os.environ['ARMAZENAMENTO'] = 'sqlite'
+os.environ['SQLITE_CAMINHO'] = os.path.join(tempfile.mkdtemp(prefix='testes_comparador_'), 'testes.db')
+os.environ['CACHE_ATIVO'] = '0'
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+import app as aplicacao  # noqa: E402  (o armazenamento é escolhido ao importar)
+import armazenamento_sqlite  # noqa: E402
+import autocompletar  # noqa: E402
+import cache  # noqa: E402
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+
+@pytest.fixture
+def cliente():
+    conn = armazenamento_sqlite.conexao_sqlite()
+    tabelas = [nome for (nome,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+    conn.execute("PRAGMA foreign_keys = OFF")
+    for tabela in tabelas:
+        conn.execute(f"DELETE FROM {tabela}")
+    conn.execute("DELETE FROM sqlite_sequence")
+    conn.execute("PRAGMA foreign_keys = ON")
+    autocompletar.indice = autocompletar.IndiceProdutos()
+    cache.versoes.expirar()
+    return aplicacao.app.test_client()
+
+
+@pytest.fixture
+def importar(cliente):
+    """Envia uma folha (lista de linhas) e retorna o estado final da importação."""
+    def enviar(linhas, autoritativa=False):
+        caminho = '/api/importar?autoritativa=1' if autoritativa else '/api/importar'
+        resposta = cliente.post(caminho, data='\n'.join(linhas).encode('utf-8'), content_type='text/plain')
+        assert resposta.status_code == 202, resposta.get_json()
+        return cliente.get(f"/api/importar/{resposta.get_json()['job_id']}").get_json()
+    return enviar
+
+
+def oferta(validade, supermercado, produto, valor, categoria='Mercearia'):
+    """Uma linha da folha de ofertas, com as colunas separadas por tabulações."""
+    return '\t'.join([validade, supermercado, produto, f'R$ {valor} un', categoria])
+
+
+def ids_por_nome(cliente, data):
+    """Ids dos produtos em oferta na `data`, pelo nome."""
+    return {p['nome']: p['id'] for p in cliente.get(f'/api/produtos-em-oferta?data={data}').get_json()}
+
+
+@pytest.fixture
+def conexao_postgres():
+    """Conexão à base de DATABASE_URL, migrada; o que ficar por confirmar é desfeito no fim."""
+    if not DATABASE_URL:
+        pytest.skip('DATABASE_URL não definida')
+    import psycopg2
+    import migracoes
+    conn = psycopg2.connect(DATABASE_URL)
+    migracoes.aplicar_migracoes(conn)
+    yield conn
+    conn.rollback()
+    conn.close()
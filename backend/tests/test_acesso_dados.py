@@ -0,0 +1,83 @@
+"""Pool de conexões e consultas preparadas, contra o PostgreSQL de DATABASE_URL."""
+import time
+
+import pytest
+
+import acesso_dados
+import armazenamento
+
+pytestmark = pytest.mark.skipif(not acesso_dados.DATABASE_URL, reason='DATABASE_URL não definida')
+
+
+@pytest.fixture
+def pool():
+    pool = acesso_dados.PoolConexoes(acesso_dados.DATABASE_URL, minimo=1, maximo=2, timeout=0.2, max_idade=60, checagem=30)
+    yield pool
+    pool.fechar()
+
+
+def test_pool_reaproveita_as_conexoes_devolvidas(pool):
+    conn = pool.obter()
+    assert pool.estatisticas()['em_uso'] == 1
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT 1")
+    pool.devolver(conn)
+
+    # A transação deixada aberta foi desfeita e a mesma conexão volta a ser entregue
+    assert conn.get_transaction_status() == acesso_dados.extensions.TRANSACTION_STATUS_IDLE
+    assert pool.obter() is conn
+    estatisticas = pool.estatisticas()
+    assert (estatisticas['checkouts'], estatisticas['total'], estatisticas['recicladas']) == (2, 1, 0)
+
+
+def test_pool_recicla_conexoes_velhas_fechadas_ou_descartadas(pool):
+    conn = pool.obter()
+    pool.devolver(conn, descartar=True)
+    assert conn.closed
+    assert pool.estatisticas()['total'] == 0
+
+    conn = pool.obter()
+    pool.devolver(conn)
+    conn.close()
+    outra = pool.obter()
+    assert outra is not conn and not outra.closed
+    pool.devolver(outra)
+
+    pool.max_idade = 0.01
+    time.sleep(0.02)
+    assert pool.obter() is not outra
+    assert pool.estatisticas()['recicladas'] == 3
+
+
+def test_pool_esgotado(pool):
+    conns = [pool.obter(), pool.obter()]
+    inicio = time.monotonic()
+    with pytest.raises(acesso_dados.PoolEsgotado):
+        pool.obter()
+    assert time.monotonic() - inicio >= pool.timeout
+    assert pool.estatisticas()['falhas_checkout'] == 1
+
+    # Uma devolução acorda quem está à espera
+    pool.devolver(conns.pop())
+    assert pool.obter() is not None
+
+
+def test_pool_esgotado_responde_503(pool, cliente, monkeypatch):
+    monkeypatch.setattr(armazenamento, 'ARMAZENAMENTO', 'postgres')
+    monkeypatch.setattr(acesso_dados, '_pool', pool)
+    conns = [pool.obter(), pool.obter()]
+    resposta = cliente.get('/api/filtros')
+    assert resposta.status_code == 503
+    assert resposta.get_json()['status'] == 'error'
+    for conn in conns:
+        pool.devolver(conn)
+
+
+def test_consulta_preparada_uma_vez_por_conexao(conexao_postgres):
+    nome = acesso_dados.registrar_consulta('teste_soma', 'SELECT $1::int + $2::int')
+    cursor = conexao_postgres.cursor()
+    for a, b in [(1, 2), (40, 2)]:
+        acesso_dados.executar(cursor, nome, (a, b))
+        assert cursor.fetchone()[0] == a + b
+    cursor.execute("SELECT statement FROM pg_prepared_statements WHERE name = %s", (nome,))
+    assert [linha[0] for linha in cursor.fetchall()] == ['PREPARE teste_soma AS SELECT $1::int + $2::int']
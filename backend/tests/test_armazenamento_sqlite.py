@@ -0,0 +1,202 @@
+from email.utils import parsedate_to_datetime
+
+import metricas
+from conftest import ids_por_nome, oferta
+
+
+def ofertas_do_dia(cliente, data):
+    return sorted((o['produto_nome'], o['supermercado_nome'], o['valor'])
+                  for o in cliente.get(f'/api/ofertas?data={data}').get_json())
+
+
+def test_importacao_conta_ofertas_e_rejeicoes(importar):
+    tarefa = importar([
+        oferta('1-2/05/2025', 'Super A', 'Arroz', '10,00'),
+        '',
+        oferta('01/05/2025', 'Super B', 'Arroz', '11,00'),
+        'linha sem colunas',
+        '',
+        oferta('31/02/2025', 'Super A', 'Feijão', '8,00'),
+    ])
+    assert tarefa['etapa'] == 'concluida'
+    assert tarefa['total_linhas'] == 4
+    assert tarefa['resultado'] == {'ofertas': 3, 'inseridos': 3, 'atualizados': 0, 'inalterados': 0,
+                                   'rejeitados': 2, 'retirados': 0}
+    # As linhas em branco contam para o número da linha na folha
+    assert [erro['linha'] for erro in tarefa['erros']] == [4, 6]
+
+
+def test_folha_repetida_reaproveita_a_importacao(cliente, importar):
+    linhas = [oferta('01/05/2025', 'Super A', 'Arroz', '10,00'), oferta('01/05/2025', 'Super A', 'Feijão', '8,00')]
+    primeira = importar(linhas)
+
+    resposta = cliente.post('/api/importar', data='\n\n'.join(linhas).encode('utf-8'), content_type='text/plain')
+    assert resposta.status_code == 202
+    assert resposta.get_json()['nova'] is False
+    assert resposta.get_json()['job_id'] == primeira['id']
+
+    # A mesma folha como autoritativa é outra importação
+    assert importar(linhas, autoritativa=True)['id'] != primeira['id']
+
+    tarefa = importar([oferta('01/05/2025', 'Super A', 'Arroz', '9,50'), oferta('01/05/2025', 'Super A', 'Feijão', '8,00')])
+    assert tarefa['resultado']['atualizados'] == 1
+    assert tarefa['resultado']['inalterados'] == 1
+    assert ofertas_do_dia(cliente, '2025-05-01') == [('Arroz', 'Super A', 9.5), ('Feijão', 'Super A', 8.0)]
+
+
+def test_folha_autoritativa_retira_so_as_ofertas_do_supermercado(cliente, importar):
+    importar([
+        oferta('1-3/05/2025', 'Super A', 'Arroz', '10,00'),
+        oferta('1-3/05/2025', 'Super A', 'Feijão', '8,00'),
+        oferta('1-3/05/2025', 'Super B', 'Feijão', '7,00'),
+        oferta('10/05/2025', 'Super A', 'Café', '15,00'),
+    ])
+    # Sem ser autoritativa, a folha não retira nada
+    assert importar([oferta('02/05/2025', 'Super A', 'Arroz', '10,00')])['resultado']['retirados'] == 0
+
+    tarefa = importar([oferta('1-3/05/2025', 'Super A', 'Arroz', '10,00')], autoritativa=True)
+    assert tarefa['resultado']['retirados'] == 3
+    assert ofertas_do_dia(cliente, '2025-05-02') == [('Arroz', 'Super A', 10.0), ('Feijão', 'Super B', 7.0)]
+    # Fora das datas da folha nada é retirado
+    assert ofertas_do_dia(cliente, '2025-05-10') == [('Café', 'Super A', 15.0)]
+
+    ids = ids_por_nome(cliente, '2025-05-02')
+    todas = cliente.get(f"/api/produto/todas-ofertas-hoje?id={ids['Feijão']}&data=2025-05-02").get_json()
+    assert [o['supermercado_nome'] for o in todas] == ['Super B']
+
+
+def test_melhores_ofertas_com_empate_e_ordenadas_por_preco(cliente, importar):
+    importar([
+        oferta('01/05/2025', 'Super C', 'Arroz', '12,00'),
+        oferta('01/05/2025', 'Super B', 'Arroz', '10,00'),
+        oferta('01/05/2025', 'Super A', 'Arroz', '10,00'),
+        oferta('01/05/2025', 'Super A', 'Feijão', '8,00'),
+    ])
+    em_oferta = cliente.get('/api/produtos-em-oferta?data=2025-05-01').get_json()
+    assert [(p['nome'], p['supermercado_nome'], p['valor']) for p in em_oferta] == [
+        ('Arroz', 'Super A', 10.0), ('Arroz', 'Super B', 10.0), ('Feijão', 'Super A', 8.0)]
+
+    id_arroz = em_oferta[0]['id']
+    todas = cliente.get(f'/api/produto/todas-ofertas-hoje?id={id_arroz}&data=2025-05-01').get_json()
+    assert [(o['supermercado_nome'], o['valor']) for o in todas] == [('Super A', 10.0), ('Super B', 10.0), ('Super C', 12.0)]
+
+
+def test_ofertas_paginadas_pelo_cursor(cliente, importar):
+    produtos = ['Arroz', 'Azeite', 'Café', 'Feijão', 'Leite', 'Sal', 'Óleo']
+    importar([oferta('01/05/2025', supermercado, produto, '5,00')
+              for produto in produtos for supermercado in ('Super A', 'Super B')])
+    todas = cliente.get('/api/ofertas?data=2025-05-01').get_json()
+    assert len(todas) == 14
+
+    paginas = []
+    cursor = None
+    while True:
+        caminho = '/api/ofertas?data=2025-05-01&limit=4' + (f'&cursor={cursor}' if cursor else '')
+        pagina = cliente.get(caminho).get_json()
+        paginas.append(pagina['ofertas'])
+        cursor = pagina['proximo_cursor']
+        if cursor is None:
+            break
+    assert [len(pagina) for pagina in paginas] == [4, 4, 4, 2]
+    assert [o['id'] for pagina in paginas for o in pagina] == [o['id'] for o in todas]
+
+    filtrada = cliente.get('/api/ofertas?data=2025-05-01&limit=10&busca=cafe').get_json()
+    assert [o['produto_nome'] for o in filtrada['ofertas']] == ['Café', 'Café']
+    assert filtrada['proximo_cursor'] is None
+
+
+def test_ofertas_com_limit_ou_cursor_invalido(cliente):
+    for limite in ('0', 'abc', '-1', '1001'):
+        assert cliente.get(f'/api/ofertas?limit={limite}').status_code == 400
+    assert cliente.get('/api/ofertas?limit=10&cursor=invalido').status_code == 400
+
+
+def test_autocomplete_com_limit(cliente, importar):
+    importar([oferta('01/05/2025', 'Super A', produto, '5,00') for produto in ('Açúcar', 'Açafrão', 'Azeite')])
+    nomes = [p['nome'] for p in cliente.get('/api/autocomplete?q=ac&limit=1').get_json()]
+    assert len(nomes) == 1 and nomes[0] in ('Açúcar', 'Açafrão')
+    assert len(cliente.get('/api/autocomplete?q=a').get_json()) == 3
+    for limite in ('0', 'abc', '-1', '2.5', '51'):
+        assert cliente.get(f'/api/autocomplete?q=a&limit={limite}').status_code == 400
+
+
+def test_historico_por_dia_semana_e_mes(cliente, importar):
+    importar([
+        # 2025-05-04 é um domingo: o dia 5 já é da semana seguinte
+        oferta('2-5/05/2025', 'Super A', 'Arroz', '10,00'),
+        oferta('03/05/2025', 'Super B', 'Arroz', '12,00'),
+        oferta('02/06/2025', 'Super A', 'Arroz', '9,00'),
+    ])
+    importar([oferta('04/05/2025', 'Super A', 'Arroz', '7,00')])
+    id_arroz = ids_por_nome(cliente, '2025-05-02')['Arroz']
+
+    def historico(granularidade, inicio='2025-05-01', fim='2025-06-30'):
+        resposta = cliente.get(f'/api/produto/{id_arroz}/historico?inicio={inicio}&fim={fim}&granularidade={granularidade}')
+        assert resposta.status_code == 200
+        # As datas saem no formato HTTP do JSON do Flask
+        return [(parsedate_to_datetime(h['periodo']).date().isoformat(), h['supermercado_nome'], h['num_dias'],
+                 h['valor_minimo'], h['valor_maximo']) for h in resposta.get_json()]
+
+    assert historico('dia', fim='2025-05-03') == [
+        ('2025-05-02', 'Super A', 1, 10.0, 10.0), ('2025-05-03', 'Super A', 1, 10.0, 10.0),
+        ('2025-05-03', 'Super B', 1, 12.0, 12.0)]
+    assert historico('semana') == [
+        ('2025-04-28', 'Super A', 3, 7.0, 10.0), ('2025-04-28', 'Super B', 1, 12.0, 12.0),
+        ('2025-05-05', 'Super A', 1, 10.0, 10.0), ('2025-06-02', 'Super A', 1, 9.0, 9.0)]
+    assert historico('mes') == [
+        ('2025-05-01', 'Super A', 4, 7.0, 10.0), ('2025-05-01', 'Super B', 1, 12.0, 12.0),
+        ('2025-06-01', 'Super A', 1, 9.0, 9.0)]
+    # A semana que contém `inicio` entra inteira
+    assert historico('semana', inicio='2025-05-07', fim='2025-05-10') == [('2025-05-05', 'Super A', 1, 10.0, 10.0)]
+    assert cliente.get(f'/api/produto/{id_arroz}/historico?granularidade=ano').status_code == 400
+
+
+def test_otimizar_lista(cliente, importar):
+    importar([
+        oferta('01/05/2025', 'Super A', 'Arroz', '10,00'),
+        oferta('01/05/2025', 'Super B', 'Arroz', '12,00'),
+        oferta('01/05/2025', 'Super A', 'Feijão', '9,00'),
+        oferta('01/05/2025', 'Super B', 'Feijão', '6,00'),
+        oferta('01/05/2025', 'Super B', 'Café', '15,00'),
+    ])
+    ids = ids_por_nome(cliente, '2025-05-01')
+    corpo = {'ids': [ids['Arroz'], ids['Feijão'], 999], 'data': '2025-05-01'}
+
+    resultado = cliente.post('/api/lista/otimizar', json=corpo).get_json()
+    assert [item['nome'] for item in resultado['itens']] == ['Arroz', 'Feijão']
+    assert resultado['indisponiveis'] == [999]
+    assert [(loja['supermercado_nome'], loja['total']) for loja in resultado['lojas']] == [('Super B', 18.0), ('Super A', 19.0)]
+    assert resultado['melhor_loja_unica']['supermercado_nome'] == 'Super B'
+    assert resultado['divisao']['total'] == 16.0
+    assert {loja['supermercado_nome']: loja['subtotal'] for loja in resultado['divisao']['lojas']} == {'Super A': 10.0, 'Super B': 6.0}
+
+    uma_loja = cliente.post('/api/lista/otimizar', json={**corpo, 'max_lojas': 1}).get_json()
+    assert uma_loja['divisao']['total'] == 18.0
+    assert cliente.post('/api/lista/otimizar', json={'ids': []}).status_code == 400
+
+
+def test_metricas_contam_as_linhas_lidas(cliente, importar):
+    importar([oferta('01/05/2025', supermercado, 'Arroz', '10,00') for supermercado in ('Super A', 'Super B', 'Super C')])
+
+    def linhas_registadas():
+        serie = metricas.linhas_consultas._series.get(('filtros_supermercados',))
+        return serie[-2] if serie else 0
+
+    antes = linhas_registadas()
+    assert len(cliente.get('/api/filtros').get_json()['supermercados']) == 3
+    assert linhas_registadas() - antes == 3
+
+
+def test_metricas_contam_os_bytes_das_respostas_em_fluxo(cliente, importar, monkeypatch):
+    importar([oferta('01/05/2025', 'Super Econômico', produto, '10,00') for produto in ('Açúcar', 'Feijão', 'Pão')])
+    # Sem escapar os acentos, cada um ocupa mais de um byte
+    monkeypatch.setattr(cliente.application.json, 'ensure_ascii', False)
+
+    def bytes_registados():
+        serie = metricas.respostas._series.get(('/api/ofertas',))
+        return serie[-2] if serie else 0
+
+    antes = bytes_registados()
+    resposta = cliente.get('/api/ofertas?data=2025-05-01')
+    assert 'Açúcar' in resposta.get_data(as_text=True)
+    assert bytes_registados() - antes == len(resposta.data)
@@ -0,0 +1,94 @@
+"""COPY para a staging e upsert das ofertas, contra o PostgreSQL de DATABASE_URL (tudo é desfeito no fim)."""
+import uuid
+from datetime import date
+
+import importacao
+from conftest import oferta
+from importacao import importar_linhas
+
+
+def gravadas(cursor, supermercado):
+    cursor.execute("""
+        SELECT p.nome, ph.data_validade, ph.valor::numeric(10, 2)::text, ph.observacoes
+        FROM precos_historicos ph
+        JOIN produtos p ON p.id = ph.id_produto
+        JOIN supermercados s ON s.id = ph.id_supermercado
+        WHERE s.nome = %s
+        ORDER BY 1, 2
+    """, (supermercado,))
+    return cursor.fetchall()
+
+
+def test_fluxo_copy_entrega_as_linhas_em_pedacos():
+    linhas = [f'{i}\tlinha {i}\n' for i in range(100)]
+    fluxo = importacao._FluxoCopy(iter(linhas))
+    pedacos = []
+    while True:
+        pedaco = fluxo.read(37)
+        if not pedaco:
+            break
+        assert len(pedaco) <= 37
+        pedacos.append(pedaco)
+    assert ''.join(pedacos) == ''.join(linhas)
+
+
+def test_copy_para_a_staging(conexao_postgres):
+    supermercado = f'Super {uuid.uuid4().hex[:8]}'
+    resumo = importar_linhas(conexao_postgres, [
+        oferta('1-2/05/2025', supermercado, 'Arroz \\ Integral (leve 3)', '10,50'),
+        'linha inválida',
+        oferta('03/05/2025', supermercado, 'Feijão', '8,00'),
+    ], primeira_linha=7)
+    assert (resumo.linhas, resumo.ofertas, resumo.rejeitados) == (3, 3, 1)
+    assert resumo.rejeicoes.amostra[0]['linha'] == 8
+
+    cursor = conexao_postgres.cursor()
+    # A staging só se esvazia no commit
+    cursor.execute("""
+        SELECT linha, data_validade, produto, valor::numeric(10, 2)::text, observacoes
+        FROM staging_ofertas ORDER BY linha, data_validade
+    """)
+    assert cursor.fetchall() == [
+        (7, date(2025, 5, 1), 'Arroz \\ Integral', '10.50', 'leve 3'),
+        (7, date(2025, 5, 2), 'Arroz \\ Integral', '10.50', 'leve 3'),
+        (9, date(2025, 5, 3), 'Feijão', '8.00', None),
+    ]
+    assert gravadas(cursor, supermercado) == [
+        ('Arroz \\ Integral', date(2025, 5, 1), '10.50', 'leve 3'),
+        ('Arroz \\ Integral', date(2025, 5, 2), '10.50', 'leve 3'),
+        ('Feijão', date(2025, 5, 3), '8.00', None),
+    ]
+
+
+def test_upsert_conta_inseridas_atualizadas_e_inalteradas(conexao_postgres):
+    supermercado = f'Super {uuid.uuid4().hex[:8]}'
+    resumo = importar_linhas(conexao_postgres, [
+        oferta('01/05/2025', supermercado, 'Arroz', '10,00'),
+        oferta('01/05/2025', supermercado, 'Feijão', '8,00'),
+        oferta('01/05/2025', supermercado, 'Café', '15,00'),
+    ])
+    assert (resumo.inseridos, resumo.atualizados, resumo.inalterados) == (3, 0, 0)
+    assert resumo.datas == {date(2025, 5, 1)}
+
+    resumo = importar_linhas(conexao_postgres, [
+        oferta('01/05/2025', supermercado, 'Arroz', '9,00'),
+        oferta('01/05/2025', supermercado, 'Feijão', '8,00'),
+        oferta('01/05/2025', supermercado, 'Leite', '5,00'),
+        # Repetida na mesma folha: vale a última linha
+        oferta('01/05/2025', supermercado, 'Leite', '4,50'),
+    ])
+    assert (resumo.inseridos, resumo.atualizados, resumo.inalterados) == (1, 1, 1)
+
+    cursor = conexao_postgres.cursor()
+    assert gravadas(cursor, supermercado) == [
+        ('Arroz', date(2025, 5, 1), '9.00', None),
+        ('Café', date(2025, 5, 1), '15.00', None),
+        ('Feijão', date(2025, 5, 1), '8.00', None),
+        ('Leite', date(2025, 5, 1), '4.50', None),
+    ]
+    # Só as ofertas gravadas ficam pendentes para o histórico resumido
+    cursor.execute("""
+        SELECT count(*) FROM historico_pendente hp JOIN produtos p ON p.id = hp.id_produto
+        WHERE p.nome IN ('Arroz', 'Feijão', 'Café', 'Leite') AND hp.data = '2025-05-01'
+    """)
+    assert cursor.fetchone()[0] == 4
@@ -0,0 +1,21 @@
+import pytest
+
+import acesso_dados
+import armazenamento
+import migracoes
+
+
+def test_consultas_quentes_incluem_as_ofertas_que_a_api_corre():
+    consultas = {nome: sql for nome, sql, *_ in migracoes.consultas_quentes(1)}
+    for filtros in [('', '', ''), ('x', '', ''), ('', '1', '1')]:
+        pagina = armazenamento.consulta_ofertas(*filtros, paginada=True)
+        assert consultas[pagina] == acesso_dados.CONSULTAS[pagina]
+        assert armazenamento.sql_ofertas(*filtros) in consultas.values()
+
+
+def test_planos_das_consultas_quentes(conexao_postgres):
+    cursor = conexao_postgres.cursor()
+    cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+    if cursor.fetchone() is None:
+        pytest.skip('sem pg_trgm a busca não tem o índice trigram da migração 5')
+    assert migracoes.verificar_planos(conexao_postgres) == []
@@ -0,0 +1,114 @@
+from datetime import date
+
+import pytest
+
+import benchmark_parser
+import parser_ofertas
+from parser_ofertas import LinhaInvalida, analisar_linha, analisar_lote
+
+
+def linha(validade='02/05/2025', supermercado='Comper', produto='Arroz Tio João (5kg)', valor='R$ 24,90 un', categoria='Mercearia'):
+    return '\t'.join([validade, supermercado, produto, valor, categoria])
+
+
+def test_linha_valida():
+    oferta = analisar_linha(linha())
+    assert oferta.datas == (date(2025, 5, 2),)
+    assert oferta.supermercado == 'Comper'
+    assert oferta.categoria == 'Mercearia'
+    assert oferta.produto == 'Arroz Tio João'
+    assert oferta.observacoes == '5kg'
+    assert oferta.valor == 24.90
+    assert oferta.unidade == 'un'
+
+
+def test_espacos_em_volta_das_colunas_sao_ignorados():
+    oferta = analisar_linha(linha(supermercado='  Comper ', categoria=' Mercearia  '))
+    assert (oferta.supermercado, oferta.categoria) == ('Comper', 'Mercearia')
+
+
+def test_produto_sem_observacao():
+    oferta = analisar_linha(linha(produto='Feijão Camil'))
+    assert (oferta.produto, oferta.observacoes) == ('Feijão Camil', None)
+
+
+def test_valor_com_separador_de_milhares():
+    oferta = analisar_linha(linha(valor='R$ 1.299,00 cx'))
+    assert (oferta.valor, oferta.unidade) == (1299.0, 'cx')
+
+
+def test_validade_em_intervalo_expande_um_dia_por_oferta():
+    assert parser_ofertas.expandir_validade('1-3/05/2025') == (date(2025, 5, 1), date(2025, 5, 2), date(2025, 5, 3))
+    assert parser_ofertas.expandir_validade('30 - 31/12/2025') == (date(2025, 12, 30), date(2025, 12, 31))
+
+
+@pytest.mark.parametrize('validade', ['31/02/2025', '5-3/05/2025', '02/13/2025', '02-05-2025', '02/05/2025x', ''])
+def test_validade_invalida(validade):
+    with pytest.raises(LinhaInvalida) as erro:
+        parser_ofertas.expandir_validade(validade)
+    assert erro.value.motivo == parser_ofertas.DATA_INVALIDA
+
+
+@pytest.mark.parametrize('texto, motivo', [
+    ('linha colada sem colunas', parser_ofertas.SEM_TAB),
+    ('02/05/2025\tComper\tArroz', parser_ofertas.POUCAS_COLUNAS),
+    (linha(validade='35/05/2025'), parser_ofertas.DATA_INVALIDA),
+    (linha(valor='grátis'), parser_ofertas.VALOR_INVALIDO),
+    (linha(valor='R$ .'), parser_ofertas.VALOR_INVALIDO),
+    (linha(supermercado=' '), parser_ofertas.CAMPO_EM_BRANCO),
+    (linha(produto='(só observação)'), parser_ofertas.CAMPO_EM_BRANCO),
+    (linha(categoria=''), parser_ofertas.CAMPO_EM_BRANCO),
+])
+def test_motivos_de_rejeicao(texto, motivo):
+    with pytest.raises(LinhaInvalida) as erro:
+        analisar_linha(texto)
+    assert erro.value.motivo == motivo
+
+
+def test_lote_em_colunas():
+    lote = analisar_lote([linha(validade='1-2/05/2025'), linha(produto='Café Pilão', valor='R$ 15,49 pct')])
+    assert len(lote) == 3
+    assert lote.total_linhas == 2
+    assert lote.linhas == [1, 1, 2]
+    assert lote.datas == [date(2025, 5, 1), date(2025, 5, 2), date(2025, 5, 2)]
+    assert lote.produtos == ['Arroz Tio João', 'Arroz Tio João', 'Café Pilão']
+    assert lote.valores == [24.90, 24.90, 15.49]
+    assert lote.unidades == ['un', 'un', 'pct']
+    assert lote.rejeicoes.total == 0
+
+
+def test_lote_numera_rejeicoes_pela_linha_de_origem():
+    lote = analisar_lote([linha(), '', '   ', 'linha ruim', linha(valor='x')], primeira_linha=10)
+    assert lote.total_linhas == 3
+    assert lote.linhas == [10]
+    assert lote.rejeicoes.como_dict() == {
+        'total': 2,
+        'por_motivo': {parser_ofertas.SEM_TAB: 1, parser_ofertas.VALOR_INVALIDO: 1},
+        'amostra': [
+            {'linha': 13, 'motivo': parser_ofertas.SEM_TAB, 'conteudo': 'linha ruim'},
+            {'linha': 14, 'motivo': parser_ofertas.VALOR_INVALIDO, 'conteudo': linha(valor='x')},
+        ],
+    }
+
+
+def test_relatorio_partilhado_guarda_amostra_limitada():
+    rejeicoes = parser_ofertas.RelatorioRejeicoes(max_detalhes=2)
+    analisar_lote(['ruim'] * 3, rejeicoes=rejeicoes)
+    analisar_lote(['ruim'] * 2, primeira_linha=4, rejeicoes=rejeicoes)
+    assert rejeicoes.total == 5
+    assert rejeicoes.por_motivo[parser_ofertas.SEM_TAB] == 5
+    assert [r['linha'] for r in rejeicoes.amostra] == [1, 2]
+
+
+@pytest.mark.parametrize('total', [20_000, 100_000, pytest.param(1_000_000, marks=pytest.mark.slow)])
+def test_desempenho_analisar_lote(benchmark, total):
+    linhas = benchmark_parser.gerar_folha(total)
+
+    def analisar():
+        benchmark_parser.limpar_caches()
+        return analisar_lote(linhas)
+
+    # Poucas rodadas: cada uma já analisa a folha inteira com os caches vazios
+    lote = benchmark.pedantic(analisar, rounds=3)
+    assert lote.total_linhas == len(linhas)
+    assert lote.rejeicoes.total < len(linhas) * 0.02
@@ -0,0 +1,37 @@
+from conftest import ids_por_nome, oferta
+
+
+def historico(cliente, id_produto, granularidade):
+    resposta = cliente.get(f'/api/produto/{id_produto}/historico?inicio=2025-05-01&fim=2025-05-31&granularidade={granularidade}')
+    assert resposta.status_code == 200
+    return [(h['supermercado_nome'], h['num_dias'], h['valor_minimo']) for h in resposta.get_json()]
+
+
+def test_resumo_acompanha_ofertas_retiradas(cliente, importar):
+    importar([
+        oferta('1-3/05/2025', 'Super A', 'Arroz', '10,00'),
+        oferta('1-3/05/2025', 'Super B', 'Arroz', '11,00'),
+        oferta('1-3/05/2025', 'Super A', 'Feijão', '8,00'),
+        oferta('1-3/05/2025', 'Super A', 'Café', '15,00'),
+        oferta('1-3/05/2025', 'Super A', 'Leite', '5,00'),
+    ])
+    ids = ids_por_nome(cliente, '2025-05-01')
+    for granularidade in ('semana', 'mes'):
+        assert historico(cliente, ids['Arroz'], granularidade) == [('Super A', 3, 10.0), ('Super B', 3, 11.0)]
+        assert historico(cliente, ids['Café'], granularidade) == [('Super A', 3, 15.0)]
+        assert historico(cliente, ids['Leite'], granularidade) == [('Super A', 3, 5.0)]
+
+    # A folha autoritativa do Super A deixa de trazer o Arroz, o Leite e o Café do dia 2
+    tarefa = importar([
+        oferta('1-3/05/2025', 'Super A', 'Feijão', '8,00'),
+        oferta('01/05/2025', 'Super A', 'Café', '15,00'),
+        oferta('03/05/2025', 'Super A', 'Café', '15,00'),
+    ], autoritativa=True)
+    assert tarefa['resultado']['retirados'] == 7
+
+    for granularidade in ('semana', 'mes'):
+        assert historico(cliente, ids['Arroz'], granularidade) == [('Super B', 3, 11.0)]
+        assert historico(cliente, ids['Café'], granularidade) == [('Super A', 2, 15.0)]
+        assert historico(cliente, ids['Leite'], granularidade) == []
+        assert historico(cliente, ids['Feijão'], granularidade) == [('Super A', 3, 8.0)]
+    assert historico(cliente, ids['Leite'], 'dia') == []
@@ -0,0 +1,115 @@
+"""Tarefas de importação contra o PostgreSQL de DATABASE_URL.
+
+As tarefas confirmam (commit) cada bloco, por isso estes testes não podem
+ser desfeitos no fim: a tabela `importacoes` é esvaziada antes e depois de
+cada um e a base tem de ser só de testes.
+"""
+import uuid
+
+import psycopg2
+import pytest
+
+import tarefas_importacao
+from conftest import oferta
+from tarefas_importacao import criar_tarefa, obter_tarefa, processar_tarefa, reivindicar_tarefa
+
+
+class Queda(BaseException):
+    """Simula o processo a morrer a meio de uma tarefa (não é apanhada como um erro da importação)."""
+
+
+@pytest.fixture
+def conn(conexao_postgres, monkeypatch):
+    monkeypatch.setattr(tarefas_importacao, 'LINHAS_POR_BLOCO', 2)
+
+    def esvaziar():
+        conexao_postgres.rollback()
+        with conexao_postgres.cursor() as cursor:
+            cursor.execute("DELETE FROM importacoes")
+        conexao_postgres.commit()
+
+    esvaziar()
+    yield conexao_postgres
+    esvaziar()
+
+
+@pytest.fixture
+def folha():
+    supermercado = f'Super {uuid.uuid4().hex[:8]}'
+    return [oferta('01/05/2025', supermercado, produto, valor)
+            for produto, valor in [('Arroz', '10,00'), ('Feijão', '8,00'), ('Café', '15,00'), ('Leite', '5,00'), ('Sal', '2,00')]]
+
+
+def test_mesmo_conteudo_reaproveita_a_tarefa(conn, folha):
+    id_tarefa, nova = criar_tarefa(conn, folha)
+    assert nova is True
+    assert obter_tarefa(conn, id_tarefa)['total_blocos'] == 3
+
+    # As linhas em branco não contam para o hash
+    assert criar_tarefa(conn, ['', *folha[:2], '', '', *folha[2:], '']) == (id_tarefa, False)
+    # mas ser autoritativa conta
+    id_autoritativa, nova = criar_tarefa(conn, folha, autoritativa=True)
+    assert nova is True and id_autoritativa != id_tarefa
+    assert criar_tarefa(conn, ['', '  ']) == (None, False)
+
+    # Reenviar uma folha cuja importação falhou volta a pô-la na fila
+    with conn.cursor() as cursor:
+        cursor.execute("UPDATE importacoes SET etapa = %s WHERE id = %s", (tarefas_importacao.ERRO, id_tarefa))
+    conn.commit()
+    assert criar_tarefa(conn, folha) == (id_tarefa, False)
+    assert obter_tarefa(conn, id_tarefa)['etapa'] == tarefas_importacao.PENDENTE
+
+
+def test_reivindicar_salta_as_tarefas_bloqueadas(conn, folha):
+    primeira, _ = criar_tarefa(conn, folha[:2])
+    segunda, _ = criar_tarefa(conn, folha[2:])
+
+    outra = psycopg2.connect(conn.dsn)
+    try:
+        with outra.cursor() as cursor:
+            cursor.execute("SELECT id FROM importacoes WHERE id = %s FOR UPDATE", (primeira,))
+        # Com a primeira presa noutra transação, é a segunda que é reivindicada, sem esperar
+        assert reivindicar_tarefa(conn) == (segunda, 0)
+        assert reivindicar_tarefa(conn) is None
+        outra.rollback()
+        assert reivindicar_tarefa(conn) == (primeira, 0)
+    finally:
+        outra.close()
+
+
+def test_tarefa_interrompida_retoma_no_ultimo_bloco_confirmado(conn, folha, monkeypatch):
+    id_tarefa, _ = criar_tarefa(conn, folha)
+    assert reivindicar_tarefa(conn) == (id_tarefa, 0)
+
+    importar_linhas = tarefas_importacao.importar_linhas
+    chamadas = []
+
+    def importar_e_cair(conn, linhas, **kwargs):
+        chamadas.append(linhas)
+        if len(chamadas) == 2:
+            raise Queda()
+        return importar_linhas(conn, linhas, **kwargs)
+
+    monkeypatch.setattr(tarefas_importacao, 'importar_linhas', importar_e_cair)
+    with pytest.raises(Queda):
+        processar_tarefa(conn, id_tarefa, 0)
+    conn.rollback()
+    tarefa = obter_tarefa(conn, id_tarefa)
+    assert (tarefa['etapa'], tarefa['blocos_processados'], tarefa['linhas_processadas']) == (tarefas_importacao.IMPORTANDO, 1, 2)
+
+    # Enquanto não passar o prazo de abandono a tarefa continua a ser de quem a tinha
+    assert reivindicar_tarefa(conn) is None
+    with conn.cursor() as cursor:
+        cursor.execute("UPDATE importacoes SET atualizada_em = now() - make_interval(secs => %s) WHERE id = %s",
+                       (tarefas_importacao.PRAZO_ABANDONO + 1, id_tarefa))
+    conn.commit()
+    assert reivindicar_tarefa(conn) == (id_tarefa, 1)
+
+    monkeypatch.setattr(tarefas_importacao, 'importar_linhas', importar_linhas)
+    processar_tarefa(conn, id_tarefa, 1)
+    tarefa = obter_tarefa(conn, id_tarefa)
+    assert tarefa['etapa'] == tarefas_importacao.CONCLUIDA
+    assert (tarefa['blocos_processados'], tarefa['linhas_processadas']) == (3, 5)
+    # O bloco confirmado antes da queda não foi importado outra vez
+    assert tarefa['resultado'] == {'ofertas': 5, 'inseridos': 5, 'atualizados': 0, 'inalterados': 0,
+                                   'rejeitados': 0, 'retirados': 0}
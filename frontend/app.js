@@ -16,6 +16,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const graficoTitulo = document.getElementById('graficoTitulo');
     const ctx = document.getElementById('graficoPrecos').getContext('2d');
     let precoChart = null; // Variável para armazenar a instância do gráfico e destruí-la depois
+    // Agregação pedida ao histórico de preços (dia, semana ou mes)
+    const granularidadeHistorico = 'semana';
 
     /**
      * Define a data de hoje como valor padrão para o filtro de data.
@@ -101,12 +103,13 @@ document.addEventListener('DOMContentLoaded', () => {
      */
     async function mostrarGrafico(produtoId, produtoNome) {
         try {
-            const response = await fetch(`${apiBaseUrl}/produto/${produtoId}/historico`);
+            // Último ano, agregado por semana: um ponto por supermercado e semana
+            const response = await fetch(`${apiBaseUrl}/produto/${produtoId}/historico?granularidade=${granularidadeHistorico}`);
             const historico = await response.json();
             
             // Prepara os dados para o gráfico
-            const labels = historico.map(item => new Date(item.data_registro).toLocaleDateString('pt-BR', {timeZone: 'UTC'}));
-            const data = historico.map(item => item.valor);
+            const labels = historico.map(item => new Date(item.periodo).toLocaleDateString('pt-BR', {timeZone: 'UTC'}));
+            const data = historico.map(item => item.valor_medio);
 
             graficoTitulo.textContent = `Histórico de Preços - ${produtoNome}`;
 
@@ -137,11 +140,13 @@ document.addEventListener('DOMContentLoaded', () => {
                                     const fullDataPoint = historico[context.dataIndex];
                                     const supermercado = fullDataPoint.supermercado_nome;
                                     
-                                    const precoLabel = `Preço: ${new Intl.NumberFormat('pt-BR', { style: 'currency', currency: 'BRL' }).format(context.parsed.y)}`;
+                                    const moeda = new Intl.NumberFormat('pt-BR', { style: 'currency', currency: 'BRL' });
+                                    const precoLabel = `Preço médio: ${moeda.format(context.parsed.y)}`;
+                                    const faixaLabel = `Mínimo: ${moeda.format(fullDataPoint.valor_minimo)} / Máximo: ${moeda.format(fullDataPoint.valor_maximo)}`;
                                     const supermercadoLabel = `Supermercado: ${supermercado}`;
 
                                     // Retorna um array de strings para criar um tooltip com várias linhas
-                                    return [precoLabel, supermercadoLabel];
+                                    return [precoLabel, faixaLabel, supermercadoLabel];
                                 }
                             }
                         }
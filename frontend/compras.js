@@ -6,79 +6,75 @@ document.addEventListener('DOMContentLoaded', () => {
     const resultadosContainer = document.getElementById('resultadosContainer');
     const limparListaBtn = document.getElementById('limparListaBtn');
 
-    let produtosEmOferta = [];
-    let listaDeCompras = JSON.parse(localStorage.getItem('minhaListaDeCompras')) || [];
+    // Número máximo de supermercados a visitar na divisão mais barata da lista
+    const maxLojas = 2;
 
-    // Função para remover acentos em JavaScript
-    function unaccent(str) {
-        if (!str) return "";
-        return str.normalize("NFD").replace(/[\u0300-\u036f]/g, "");
-    }
+    // Quantas sugestões pedir ao autocompletar
+    const limiteSugestoes = 10;
 
-    async function carregarProdutosEmOferta() {
-        try {
-            const response = await fetch(`${apiBaseUrl}/produtos-em-oferta`);
-            produtosEmOferta = await response.json();
-        } catch (error) {
-            console.error('Erro ao carregar produtos em oferta:', error);
-        }
-    }
+    let listaDeCompras = (JSON.parse(localStorage.getItem('minhaListaDeCompras')) || [])
+        .map(item => ({ id: item.id, nome: item.nome }));
 
-    function mostrarAutocomplete(input) {
-        autocompleteResults.innerHTML = '';
-        const unaccentedInput = unaccent(input.toLowerCase());
+    // Só a resposta ao último texto digitado é mostrada
+    let ultimaBusca = 0;
+    // e só o resultado do último pedido de otimização da lista é desenhado
+    let ultimaOtimizacao = 0;
+
+    async function mostrarAutocomplete(input) {
+        const texto = input.trim();
+        const busca = ++ultimaBusca;
 
-        if (!unaccentedInput) {
+        if (!texto) {
+            autocompleteResults.innerHTML = '';
             autocompleteResults.style.display = 'none';
             return;
         }
 
-        // --- CORREÇÃO APLICADA AQUI ---
-        // Trocamos .includes() por .startsWith() para que a busca
-        // corresponda apenas ao início do nome do produto.
-        const filtrados = produtosEmOferta.filter(p => 
-            unaccent(p.nome.toLowerCase()).startsWith(unaccentedInput)
-        );
+        let filtrados;
+        try {
+            const params = new URLSearchParams({ q: texto, limit: limiteSugestoes });
+            const response = await fetch(`${apiBaseUrl}/autocomplete?${params}`);
+            filtrados = await response.json();
+        } catch (error) {
+            console.error('Erro ao buscar sugestões de produtos:', error);
+            return;
+        }
+        if (busca !== ultimaBusca) {
+            return;
+        }
 
+        autocompleteResults.innerHTML = '';
         if (filtrados.length > 0) {
             filtrados.forEach(produto => {
                 const div = document.createElement('div');
                 div.textContent = produto.nome;
-                div.addEventListener('click', () => adicionarProdutoNaLista(produto.id, produto.nome));
+                // Os produtos sem oferta aparecem na sugestão, mas não podem entrar na lista
+                if (produto.em_oferta) {
+                    div.addEventListener('click', () => adicionarProdutoNaLista(produto.id, produto.nome, produto.em_oferta));
+                } else {
+                    div.classList.add('autocomplete-sem-oferta');
+                }
                 autocompleteResults.appendChild(div);
             });
         } else {
             const div = document.createElement('div');
-            div.textContent = 'Nenhum produto em oferta encontrado com esse nome.';
+            div.textContent = 'Nenhum produto encontrado com esse nome.';
             div.classList.add('autocomplete-no-result');
             autocompleteResults.appendChild(div);
         }
         autocompleteResults.style.display = 'block';
     }
 
-    async function adicionarProdutoNaLista(produtoId, produtoNome) {
+    function adicionarProdutoNaLista(produtoId, produtoNome, emOferta) {
         searchInput.value = '';
         autocompleteResults.style.display = 'none';
 
-        if (listaDeCompras.find(item => item.id === produtoId)) {
+        if (!emOferta || listaDeCompras.find(item => item.id === produtoId)) {
             return;
         }
 
-        try {
-            const response = await fetch(`${apiBaseUrl}/produto/todas-ofertas-hoje?id=${produtoId}`);
-            const ofertas = await response.json();
-            
-            if (ofertas.length > 0) {
-                listaDeCompras.push({
-                    id: produtoId,
-                    nome: produtoNome,
-                    ofertas: ofertas
-                });
-                salvarErenderizar();
-            }
-        } catch (error) {
-            console.error('Erro ao buscar ofertas do produto:', error);
-        }
+        listaDeCompras.push({ id: produtoId, nome: produtoNome });
+        salvarErenderizar();
     }
     
     function limparLista() {
@@ -91,7 +87,48 @@ document.addEventListener('DOMContentLoaded', () => {
         renderizarResultados();
     }
 
-    function renderizarResultados() {
+    function formatarValor(valor) {
+        return `R$ ${valor.toFixed(2).replace('.', ',')}`;
+    }
+
+    async function otimizarLista() {
+        const response = await fetch(`${apiBaseUrl}/lista/otimizar`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ ids: listaDeCompras.map(item => item.id), max_lojas: maxLojas })
+        });
+        return response.json();
+    }
+
+    function renderizarDivisao(divisao) {
+        if (!divisao || divisao.total === null || divisao.lojas.length < 2) {
+            return;
+        }
+        let html = '<ul>';
+        divisao.lojas.forEach(loja => {
+            const nomes = loja.itens.map(item => item.nome).join(', ');
+            html += `<li><strong>${loja.supermercado_nome}</strong>: ${nomes} <span>${formatarValor(loja.subtotal)}</span></li>`;
+        });
+        html += '</ul>';
+
+        const ficha = document.createElement('div');
+        ficha.className = 'supermercado-ficha completo';
+        ficha.innerHTML = `
+            <div class="ficha-header">
+                <h2>Dividindo a compra em até ${maxLojas} supermercados</h2>
+                <div class="ficha-total completo">
+                    <span>Total: ${formatarValor(divisao.total)}</span>
+                </div>
+            </div>
+            <div class="ficha-body">
+                ${html}
+            </div>
+        `;
+        resultadosContainer.appendChild(ficha);
+    }
+
+    async function renderizarResultados() {
+        const pedido = ++ultimaOtimizacao;
         resultadosContainer.innerHTML = '';
 
         if (listaDeCompras.length === 0) {
@@ -101,68 +138,57 @@ document.addEventListener('DOMContentLoaded', () => {
         }
         limparListaBtn.style.display = 'block';
 
-        const todosSupermercados = new Set();
-        listaDeCompras.forEach(produto => {
-            produto.ofertas.forEach(oferta => {
-                todosSupermercados.add(oferta.supermercado_nome);
-            });
-        });
+        let resultado;
+        try {
+            resultado = await otimizarLista();
+        } catch (error) {
+            console.error('Erro ao otimizar a lista de compras:', error);
+            return;
+        }
+        // A lista mudou enquanto o pedido estava em curso: outro pedido vai desenhá-la
+        if (pedido !== ultimaOtimizacao) {
+            return;
+        }
 
-        const fichasSupermercados = [];
-        todosSupermercados.forEach(supermercado => {
-            let totalSupermercado = 0;
-            let itensEncontrados = 0;
-            let listaProdutosHtml = '<ul>';
+        // Preço de cada item em cada supermercado, pela ordem da lista
+        const ofertasPorId = new Map(resultado.itens.map(item => [item.id, item.ofertas]));
+        resultadosContainer.innerHTML = '';
+
+        renderizarDivisao(resultado.divisao);
 
+        resultado.lojas.forEach(loja => {
+            let listaProdutosHtml = '<ul>';
             listaDeCompras.forEach(produtoDaLista => {
-                const ofertaEncontrada = produtoDaLista.ofertas.find(o => o.supermercado_nome === supermercado);
+                const ofertas = ofertasPorId.get(produtoDaLista.id) || [];
+                const ofertaEncontrada = ofertas.find(o => o.supermercado_nome === loja.supermercado_nome);
 
                 if (ofertaEncontrada) {
-                    totalSupermercado += ofertaEncontrada.valor;
-                    itensEncontrados++;
-                    listaProdutosHtml += `<li>${produtoDaLista.nome} <span>R$ ${ofertaEncontrada.valor.toFixed(2).replace('.', ',')}</span></li>`;
+                    listaProdutosHtml += `<li>${produtoDaLista.nome} <span>${formatarValor(ofertaEncontrada.valor)}</span></li>`;
                 } else {
                     listaProdutosHtml += `<li class="item-faltando">${produtoDaLista.nome} <span>Indisponível</span></li>`;
                 }
             });
-
             listaProdutosHtml += '</ul>';
-            
-            fichasSupermercados.push({
-                nome: supermercado,
-                total: totalSupermercado,
-                completa: itensEncontrados === listaDeCompras.length,
-                htmlProdutos: listaProdutosHtml,
-                contagemItens: `(${itensEncontrados} de ${listaDeCompras.length} itens)`
-            });
-        });
-
-        fichasSupermercados.sort((a, b) => {
-            if (a.completa && !b.completa) return -1;
-            if (!a.completa && b.completa) return 1;
-            return a.total - b.total;
-        });
 
-        fichasSupermercados.forEach(fichaData => {
             const ficha = document.createElement('div');
             ficha.className = 'supermercado-ficha';
-            if (fichaData.completa) {
+            if (loja.completa) {
                 ficha.classList.add('completo');
             }
 
             const totalHtml = `
-                <div class="ficha-total ${fichaData.completa ? 'completo' : 'parcial'}">
-                    <span>Total: R$ ${fichaData.total.toFixed(2).replace('.', ',')}</span>
-                    <small>${fichaData.contagemItens}</small>
+                <div class="ficha-total ${loja.completa ? 'completo' : 'parcial'}">
+                    <span>Total: ${formatarValor(loja.total)}</span>
+                    <small>(${loja.itens_encontrados} de ${listaDeCompras.length} itens)</small>
                 </div>`;
             
             ficha.innerHTML = `
                 <div class="ficha-header">
-                    <h2>${fichaData.nome}</h2>
+                    <h2>${loja.supermercado_nome}</h2>
                     ${totalHtml}
                 </div>
                 <div class="ficha-body">
-                    ${fichaData.htmlProdutos}
+                    ${listaProdutosHtml}
                 </div>
             `;
             resultadosContainer.appendChild(ficha);
@@ -180,6 +206,5 @@ document.addEventListener('DOMContentLoaded', () => {
     });
 
     // Carga inicial
-    carregarProdutosEmOferta();
     renderizarResultados();
 });